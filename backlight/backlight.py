@@ -1,10 +1,9 @@
 import board
-import displayio
 import terminalio
-from adafruit_display_text import label
-import time
-import sys
+import asyncio
 import cardputer_keyboard
+from interface_modules.ui_loop import UIEventLoop, StdinKeySource
+from interface_modules.screen_manager import get_screen_manager
 
 
 def get_slider_str(brightness, length=20):
@@ -24,93 +23,50 @@ def set_backlight_level(brightness):
     board.DISPLAY.brightness = brightness
     return brightness
 
-def display_backlight_menu():
-    # Create the main display group
-    main_group = displayio.Group()
-
-    # Create a full-screen black background
-    splash_bitmap = displayio.Bitmap(board.DISPLAY.width, board.DISPLAY.height, 1)
-    splash_palette = displayio.Palette(1)
-    splash_palette[0] = 0x000000  # black
-    bg_sprite = displayio.TileGrid(splash_bitmap, pixel_shader=splash_palette, x=0, y=0)
-    main_group.append(bg_sprite)
+def display_backlight_menu(source=None):
+    asyncio.run(run_backlight_menu(source))
 
+def open_backlight_screen():
+    """Lay out the backlight screen on the shared scene and return the label showing the brightness."""
+    screen = get_screen_manager()
+    screen.open()
 
     # Calculate positions - adjust y_start to account for status bar
     line_height = terminalio.FONT.get_bounding_box()[1]
     spacing = 4
     y_start = 40  # Increased to account for status bar
 
-    # Create labels
-    title_label = label.Label(
-        terminalio.FONT,
-        text="Backlight Control",
-        color=0x00FF00,
-        x=10,
-        y=y_start
-    )
-    main_group.append(title_label)
-
-    brightness_label = label.Label(
-        terminalio.FONT,
-        text="",  # Will be updated in the loop
-        color=0x00FF00,
-        x=10,
-        y=y_start + line_height + spacing
-    )
-    main_group.append(brightness_label)
-
-    instructions_label = label.Label(
-        terminalio.FONT,
-        text="Use LEFT/RIGHT or A/D to adjust",
-        color=0x007700,
-        x=10,
-        y=y_start + (line_height + spacing) * 2
-    )
-    main_group.append(instructions_label)
-
-    exit_label = label.Label(
-        terminalio.FONT,
-        text="Press ENTER to exit",
-        color=0x007700,
-        x=10,
-        y=y_start + (line_height + spacing) * 3
-    )
-    main_group.append(exit_label)
+    screen.label(10, y_start, "Backlight Control", 0x00FF00)
+    brightness_label = screen.label(10, y_start + line_height + spacing, "", 0x00FF00)  # Updated by redraw
+    screen.label(10, y_start + (line_height + spacing) * 2, "Use LEFT/RIGHT or A/D to adjust", 0x007700)
+    screen.label(10, y_start + (line_height + spacing) * 3, "Press ENTER to exit", 0x007700)
+    return brightness_label
 
-    # Show the menu
-    board.DISPLAY.root_group = main_group
+async def run_backlight_menu(source=None):
+    brightness_label = open_backlight_screen()
 
     # Get initial brightness
-    current = board.DISPLAY.brightness
+    state = {"current": board.DISPLAY.brightness}
     
     # Attach keyboard
     cardputer_keyboard.attach_serial()
 
-    while True:
+    def on_key(key):
+        if key in ("RIGHT", "d", "D"):  # Right arrow or d key
+            state["current"] = set_backlight_level(state["current"] + 0.05)
+        elif key in ("LEFT", "a", "A"):  # Left arrow or a key
+            state["current"] = set_backlight_level(state["current"] - 0.05)
+        elif key in ("\r", "\n"):  # Enter key
+            return True
+        return False
+
+    def redraw():
         # Update brightness display
+        current = state["current"]
         slider = get_slider_str(current)
-        brightness_text = f"Brightness: {slider} {int(current*100)}%"
-        brightness_label.text = brightness_text
-
-
-        # Check for user input
-        c = sys.stdin.read(1)
-        if c:
-            if c == '\x1b':
-                seq = sys.stdin.read(2)
-                if seq == "[C":  # Right arrow
-                    current = set_backlight_level(current + 0.05)
-                elif seq == "[D":  # Left arrow
-                    current = set_backlight_level(current - 0.05)
-            elif c.lower() == 'd':  # d key for right
-                current = set_backlight_level(current + 0.05)
-            elif c.lower() == 'a':  # a key for left
-                current = set_backlight_level(current - 0.05)
-            elif c in ['\r', '\n']:  # Enter key
-                break
+        brightness_label.text = f"Brightness: {slider} {int(current*100)}%"
 
-        time.sleep(0.05)
+    await UIEventLoop(source or StdinKeySource(), on_key, redraw).run()
 
 if __name__ == "__main__":
     display_backlight_menu()
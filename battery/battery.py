@@ -1,22 +1,23 @@
 import time
 import board
 import analogio
+from battery.telemetry import BatteryTelemetry
 
 # Create an analog input object for the battery ADC pin
 bat_adc = analogio.AnalogIn(board.BAT_ADC)
 
+# Shared telemetry service: run telemetry.run() as a task and read telemetry.percent / .millivolts
+telemetry = BatteryTelemetry(bat_adc)
+
 
 def get_battery_voltage():
-    # Return percentage based on max possible ADC value
-    max_adc = 65535  # Maximum 16-bit ADC value
-    percentage = (bat_adc.value / max_adc) * 100
-    return percentage
+    # Return the state of charge in percent, from the latest telemetry sample if it is recent
+    return telemetry.latest(max_age=telemetry.interval * 2)
 
 
 if __name__ == "__main__":
     while True:
-        voltage = get_battery_voltage()
-        raw_voltage = bat_adc.value
-        print("Battery Voltage: {:.2f} V".format(voltage))
-        print("Raw Voltage: {}".format(raw_voltage))
+        telemetry.sample()
+        print("Battery: {:.0f}% ({:.2f} V)".format(telemetry.percent, telemetry.millivolts / 1000))
+        print("Raw Voltage: {}".format(bat_adc.value))
         time.sleep(10)
@@ -0,0 +1,162 @@
+'''telemetry.py - Filtered battery sampling with a history kept in RAM and appended to the SD card in batches.
+
+BatteryTelemetry reads the battery ADC in the background. Each sample averages a burst of `oversample`
+ADC reads, and the median of the last `window` averages rejects the odd spike. The result is converted
+to millivolts through the voltage divider and a calibration factor, then to a state of charge through
+SOC_TABLE. The latest values are kept on the object (millivolts, percent, updated), so the status bar,
+commands and anything else can read them without touching the ADC.
+
+Every sample also goes into a fixed-size ring buffer. Once `flush_every` samples have piled up they are
+handed to the storage service (sd_storage) in one append, which writes them out with the other SD card
+writes, so the card sees one small write every few minutes instead of one per sample. If the card is
+not mounted the storage service keeps them until it can write them; if it cannot take any more, the
+samples stay in the ring for the next flush (the oldest are lost if the ring fills up first).
+
+Log format: back-to-back LOG_RECORD records of (time.time() seconds, millivolts); see read_log().
+'''
+
+import struct
+import time
+from array import array
+
+from sd_storage import get_storage
+
+ADC_MAX = 65535
+DEFAULT_REFERENCE = 3.3  # volts, if the ADC does not report its reference_voltage
+DIVIDER_RATIO = 2.0      # battery voltage / voltage at the ADC pin
+CALIBRATION = 1.0        # correction factor; set so the reading matches a multimeter
+
+# Resting single-cell LiPo voltage (mV) -> state of charge (%), highest voltage first
+SOC_TABLE = (
+    (4200, 100), (4150, 95), (4110, 90), (4020, 80), (3950, 70), (3870, 60),
+    (3830, 50), (3790, 40), (3750, 30), (3700, 20), (3600, 10), (3450, 5), (3300, 0),
+)
+
+LOG_RECORD = "<IH"  # timestamp, millivolts
+LOG_RECORD_SIZE = struct.calcsize(LOG_RECORD)
+
+
+def state_of_charge(millivolts, table=SOC_TABLE):
+    """Return the state of charge in percent for a battery voltage, interpolating between table entries."""
+    high_mv, high_pct = table[0]
+    if millivolts >= high_mv:
+        return high_pct
+    for low_mv, low_pct in table[1:]:
+        if millivolts >= low_mv:
+            return low_pct + (high_pct - low_pct) * (millivolts - low_mv) / (high_mv - low_mv)
+        high_mv, high_pct = low_mv, low_pct
+    return high_pct
+
+
+def read_log(path):
+    """Yield (timestamp, millivolts) for every record in a battery log file."""
+    get_storage().flush(path)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(LOG_RECORD_SIZE * 64)
+            if not data:
+                return
+            for offset in range(0, len(data) - LOG_RECORD_SIZE + 1, LOG_RECORD_SIZE):
+                yield struct.unpack_from(LOG_RECORD, data, offset)
+
+
+class BatteryTelemetry:
+    def __init__(self, adc, log_path=None, interval=10, oversample=16, window=5, capacity=128, flush_every=64,
+                 divider=DIVIDER_RATIO, calibration=CALIBRATION):
+        """
+        adc: analogio.AnalogIn (or anything with a 16-bit .value) on the battery divider.
+        log_path: File the history is appended to, or None to keep it in RAM only.
+        interval: Seconds between samples when run() is used.
+        capacity: Samples kept in RAM; flush_every must not be larger.
+        """
+        self.adc = adc
+        self.log_path = log_path
+        self.interval = interval
+        self.oversample = oversample
+        self.scale = (getattr(adc, "reference_voltage", None) or DEFAULT_REFERENCE) * divider * calibration * 1000 / ADC_MAX
+        self.millivolts = 0   # latest filtered battery voltage
+        self.percent = None   # latest state of charge, None before the first sample
+        self.updated = 0      # time.monotonic() of the latest sample
+        self.samples = 0      # samples taken so far
+        self.writes = 0       # batches handed to the storage service so far
+        self._window = [0] * window
+        self._capacity = capacity
+        self._flush_every = min(flush_every, capacity)
+        self._times = array("I", [0] * capacity)
+        self._levels = array("H", [0] * capacity)
+        self._head = 0        # ring slot the next sample goes into
+        self._count = 0       # samples in the ring
+        self._unflushed = 0   # newest samples in the ring not yet in the log
+        self._buffer = bytearray(capacity * LOG_RECORD_SIZE)
+        self._running = False
+
+    def sample(self):
+        """Read the ADC, update the latest values and the history, and return the filtered millivolts."""
+        adc = self.adc
+        total = 0
+        for _ in range(self.oversample):
+            total += adc.value
+        window = self._window
+        window[self.samples % len(window)] = total // self.oversample
+        self.samples += 1
+        filled = window if self.samples >= len(window) else window[:self.samples]
+        raw = sorted(filled)[len(filled) // 2]
+
+        millivolts = int(raw * self.scale)
+        self.millivolts = millivolts
+        self.percent = state_of_charge(millivolts)
+        self.updated = time.monotonic()
+
+        head = self._head
+        self._times[head] = int(time.time())
+        self._levels[head] = millivolts
+        self._head = (head + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+        self._unflushed = min(self._unflushed + 1, self._capacity)
+        if self._unflushed >= self._flush_every and self.log_path is not None:
+            self.flush()
+        return millivolts
+
+    def latest(self, max_age=None):
+        """Return the latest state of charge, sampling first if there is none or it is older than max_age seconds."""
+        if self.percent is None or (max_age is not None and time.monotonic() - self.updated > max_age):
+            self.sample()
+        return self.percent
+
+    def history(self):
+        """Return the samples in RAM as a list of (timestamp, millivolts), oldest first."""
+        start = (self._head - self._count) % self._capacity
+        result = []
+        for i in range(self._count):
+            slot = (start + i) % self._capacity
+            result.append((self._times[slot], self._levels[slot]))
+        return result
+
+    def flush(self):
+        """Append the samples not yet logged to the log file in one write; return how many were handed over."""
+        n = self._unflushed
+        if not n or self.log_path is None:
+            return 0
+        start = (self._head - n) % self._capacity
+        for i in range(n):
+            slot = (start + i) % self._capacity
+            struct.pack_into(LOG_RECORD, self._buffer, i * LOG_RECORD_SIZE, self._times[slot], self._levels[slot])
+        if not get_storage().append(self.log_path, memoryview(self._buffer)[:n * LOG_RECORD_SIZE]):
+            return 0  # the card has been missing for a while; keep the samples for the next flush
+        self._unflushed = 0
+        self.writes += 1
+        return n
+
+    def stop(self):
+        self._running = False
+
+    async def run(self):
+        """Sample every interval seconds until stop() is called or the task is cancelled, then flush."""
+        import asyncio
+        self._running = True
+        try:
+            while self._running:
+                self.sample()
+                await asyncio.sleep(self.interval)
+        finally:
+            self.flush()
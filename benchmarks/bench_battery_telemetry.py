@@ -0,0 +1,104 @@
+'''bench_battery_telemetry.py - Battery telemetry against a simulated ADC.
+
+SimulatedADC discharges a cell from 4.15 V to 3.45 V over the run, with read noise and an occasional
+spike, as seen through the voltage divider. The script samples it SAMPLES times and reports:
+  - how far single raw reads and the filtered readings are from the true voltage
+  - the time one sample takes, how many batches went to the storage service and how many writes it made
+and checks that the log file holds exactly the samples taken, that samples taken while the card is
+missing are written by the next successful flush, and that the state of charge table is monotonic.
+Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_battery_telemetry.py
+'''
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from battery.telemetry import BatteryTelemetry, read_log, state_of_charge, ADC_MAX, DIVIDER_RATIO
+from sd_storage import get_storage
+
+SAMPLES = 1000
+NOISE_MV = 40        # standard deviation of a single read, at the battery
+SPIKE_CHANCE = 0.02  # fraction of reads that are way off
+REFERENCE = 3.3
+
+
+class SimulatedADC:
+    reference_voltage = REFERENCE
+
+    def __init__(self, seed=1):
+        self.random = random.Random(seed)
+        self.battery_mv = 4150.0
+
+    def volts_to_value(self, millivolts):
+        value = int(millivolts / DIVIDER_RATIO / 1000 / REFERENCE * ADC_MAX)
+        return max(0, min(ADC_MAX, value))
+
+    @property
+    def value(self):
+        mv = self.battery_mv + self.random.gauss(0, NOISE_MV)
+        if self.random.random() < SPIKE_CHANCE:
+            mv += self.random.choice((-1, 1)) * 800
+        return self.volts_to_value(mv)
+
+
+def main():
+    ok = True
+    adc = SimulatedADC()
+    log_path = os.path.join(tempfile.mkdtemp(), "battery.log")
+    telemetry = BatteryTelemetry(adc, log_path)
+    raw_error = 0.0
+    filtered_error = 0.0
+    elapsed = 0
+    for i in range(SAMPLES):
+        adc.battery_mv = 4150 - 700 * i / SAMPLES
+        raw_error += abs(adc.value * REFERENCE * DIVIDER_RATIO * 1000 / ADC_MAX - adc.battery_mv)
+        start = time.perf_counter_ns()
+        telemetry.sample()
+        elapsed += time.perf_counter_ns() - start
+        if i >= 5:  # once the median window is full
+            filtered_error += abs(telemetry.millivolts - adc.battery_mv)
+    telemetry.flush()
+    print(f"{SAMPLES} samples, {telemetry.oversample} reads each, {elapsed / SAMPLES / 1000:.1f} us per sample")
+    print(f"mean error: single read {raw_error / SAMPLES:.1f} mV, filtered {filtered_error / (SAMPLES - 5):.1f} mV")
+    print(f"latest: {telemetry.millivolts} mV = {telemetry.percent:.0f}%")
+    get_storage().flush(log_path)
+    print(f"log: {telemetry.writes} batches, {get_storage().writes} writes, {os.path.getsize(log_path)} bytes")
+
+    logged = list(read_log(log_path))
+    if len(logged) != SAMPLES or logged[-len(telemetry.history()):] != telemetry.history():
+        print(f"FAIL: log holds {len(logged)} records, expected {SAMPLES} ending with the RAM history")
+        ok = False
+    if filtered_error / (SAMPLES - 5) >= raw_error / SAMPLES:
+        print("FAIL: filtering did not reduce the error")
+        ok = False
+
+    # Card missing for a while: nothing is lost as long as the ring does not overflow
+    missing = BatteryTelemetry(adc, os.path.join(log_path + ".d", "battery.log"), capacity=128, flush_every=16)
+    for _ in range(100):
+        missing.sample()
+    missing.flush()
+    get_storage().flush()   # fails: the directory is not there
+    os.mkdir(log_path + ".d")
+    written = len(list(read_log(missing.log_path)))
+    if written != 100:
+        print(f"FAIL: {written} samples written after the card came back, expected 100")
+        ok = False
+
+    levels = [state_of_charge(mv) for mv in range(3200, 4300, 5)]
+    if levels != sorted(levels) or levels[0] != 0 or levels[-1] != 100:
+        print("FAIL: state_of_charge is not monotonic from 0 to 100")
+        ok = False
+
+    if not ok:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
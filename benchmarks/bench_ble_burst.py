@@ -0,0 +1,109 @@
+'''bench_ble_burst.py - Characters per second when pasting text into the BLE keyboard.
+
+Pastes PASTE_LENGTH characters through keyboard/ble_keyboard.py's main loop with a fake HID device whose
+reports take REPORT_DELAY seconds. "before" replays the old behaviour of one character per loop
+iteration followed by a 10 ms sleep; "after" delivers the paste as the single chunk the key reader
+now gets when several bytes are waiting. Also checks that a single typed key still goes through the
+normal per-key path, and that in a burst every key is echoed and traced and Ctrl+T prints the trace
+report instead of being sent. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_ble_burst.py
+'''
+
+import asyncio
+import io
+import os
+import sys
+import time
+
+from bench_setup import simulate
+
+import simulator
+
+simulate(ble=True)
+
+from interface_modules import ui_loop
+from keyboard import ble_keyboard
+from keyboard.keystroke_trace import KeystrokeTrace
+
+REPORT_DELAY = 0.0005
+PASTE_LENGTH = 400
+PASTE = ("The quick brown fox jumps over the lazy dog. " * 10)[:PASTE_LENGTH]
+
+
+async def paste(per_char):
+    source = ui_loop.QueueKeySource()
+    keyboard = asyncio.create_task(ble_keyboard.main(source))
+    await asyncio.sleep(0)
+    reports = ble_keyboard.k.reports
+    expected = reports + 2 * PASTE_LENGTH  # press and release per character
+    start = time.perf_counter()
+    if per_char:
+        for char in PASTE:
+            source.feed(char)
+            await asyncio.sleep(0.01)
+    else:
+        source.feed(PASTE)
+    while ble_keyboard.k.reports < expected:
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    keyboard.cancel()
+    return PASTE_LENGTH / elapsed
+
+
+def check_burst():
+    """Feed a burst with Ctrl+T in it to a traced KeyRepeater; returns a list of failures."""
+    failures = []
+    trace = KeystrokeTrace()
+    repeater = ble_keyboard.KeyRepeater(trace)
+    repeater.loop = ui_loop.UIEventLoop(None, repeater.on_key)
+    repeater.loop.chunk_ns = time.monotonic_ns()
+    reports = ble_keyboard.k.reports
+    echo = io.StringIO()
+    saved, sys.stdout = sys.stdout, echo
+    try:
+        repeater.on_keys(list("ab") + [ble_keyboard.report_key, "UP"] + list("cd"))
+    finally:
+        sys.stdout = saved
+    output = echo.getvalue()
+    if "Keystroke latency" not in output:
+        failures.append("Ctrl+T in a burst did not print the trace report")
+    if not output.startswith("ab") or "cd" not in output:
+        failures.append("keys in a burst were not echoed")
+    if trace.count != 5:
+        failures.append("%d of the 5 keys in a burst were traced" % trace.count)
+    if ble_keyboard.k.reports - reports != 2 * 5:
+        failures.append("a burst sent %d HID reports for 5 keys" % (ble_keyboard.k.reports - reports))
+    return failures
+
+
+def main():
+    simulator.FakeHIDKeyboard.report_delay = REPORT_DELAY
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        before = asyncio.run(paste(per_char=True))
+        after = asyncio.run(paste(per_char=False))
+        single = ble_keyboard.KeyRepeater()
+        single.loop = ui_loop.UIEventLoop(None, single.on_key)
+        single.on_keys(["a"])
+        single_path_ok = single.current_key == "a"
+        failures = check_burst()
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+    print(f"HID report delay {REPORT_DELAY * 1000:.1f} ms, paste of {PASTE_LENGTH} chars")
+    print(f"before (per char + 10 ms sleep): {before:8.0f} chars/s")
+    print(f"after  (burst):                  {after:8.0f} chars/s")
+    print(f"single key uses the per-key path: {single_path_ok}")
+    if not single_path_ok:
+        failures.append("a single key did not go through the per-key path")
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
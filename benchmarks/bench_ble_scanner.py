@@ -0,0 +1,121 @@
+'''bench_ble_scanner.py - Replay recorded advertisements through the BLE scanner and measure throughput.
+
+Replays a fixture file (one JSON list [time, mac, rssi, name, services, connectable] per line, as
+written by scan_radio(record=...)) through the AdvertisementQueue and BLEScanner, with service
+discovery stubbed out, and reports advertisements per second, devices, discoveries and log writes.
+Without a path argument it generates a fixture: DEVICES devices, a few of which rename themselves
+half way, ADVERTISEMENTS advertisements in all, and a table smaller than the device count so eviction
+runs too. Checks that discovery ran for every new or changed connectable device, with a details line
+each, and that the log holds one line
+per such event plus a summary per device. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_ble_scanner.py [fixture.jsonl]
+'''
+
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from connectivity.bluetooth_scanner import BLEScanner
+
+DEVICES = 300
+ADVERTISEMENTS = 50000
+CAPACITY = 128
+RENAMED = 15
+BATCH = 16  # entries the replay puts on the queue before yielding, like scan_radio
+WINDOW = 256  # entries per scan window; one device is discovered between windows
+
+
+def generate_fixture(path, seed=1):
+    rng = random.Random(seed)
+    macs = ["%02x:%02x:%02x:%02x:%02x:%02x" % tuple(rng.randrange(256) for _ in range(6)) for _ in range(DEVICES)]
+    names = ["Device %d" % i if i % 3 else "" for i in range(DEVICES)]
+    services = [["0000180f-0000-1000-8000-00805f9b34fb"] if i % 4 == 0 else [] for i in range(DEVICES)]
+    # A few devices are seen far more often than the rest, as with phones and beacons nearby
+    weights = [20 if i < 40 else 1 for i in range(DEVICES)]
+    with open(path, "w") as f:
+        for n in range(ADVERTISEMENTS):
+            i = rng.choices(range(DEVICES), weights)[0]
+            name = names[i]
+            if i < RENAMED and n > ADVERTISEMENTS // 2:
+                name = name + " (paired)"
+            f.write(json.dumps([n * 0.002, macs[i], rng.randint(-95, -40), name, services[i], i % 2 == 0]) + "\n")
+
+
+def load_fixture(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            now, mac, rssi, name, services, connectable = json.loads(line)
+            entries.append((now, mac, rssi, name, tuple(services), connectable, None))
+    return entries
+
+
+async def replay(scanner, entries):
+    consumer = asyncio.create_task(scanner.consume())
+    for n, entry in enumerate(entries):
+        scanner.queue.put(entry)
+        if n % BATCH == BATCH - 1:
+            await asyncio.sleep(0)
+        if n % WINDOW == WINDOW - 1:
+            scanner.discover_next()   # as scan_radio does between scan windows
+    await asyncio.sleep(0)
+    consumer.cancel()
+    try:
+        await consumer
+    except asyncio.CancelledError:
+        pass
+    scanner.close()
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    if len(sys.argv) > 1:
+        fixture = sys.argv[1]
+    else:
+        fixture = os.path.join(workdir, "advertisements.jsonl")
+        generate_fixture(fixture)
+    entries = load_fixture(fixture)
+    log_path = os.path.join(workdir, "ble_scan.jsonl")
+
+    events = []
+    scanner = BLEScanner(log_path, capacity=CAPACITY, discover=lambda record: events.append(record.mac) or [])
+    start = time.perf_counter()
+    asyncio.run(replay(scanner, entries))
+    elapsed = time.perf_counter() - start
+
+    with open(log_path) as f:
+        lines = [json.loads(line) for line in f]
+    found = [e for e in lines if e["event"] in ("new", "changed")]
+    summaries = [e for e in lines if e["event"] == "summary"]
+    print(f"{len(entries)} advertisements in {elapsed:.2f} s: {len(entries) / elapsed:,.0f} advertisements/s")
+    print(f"{len({e[1] for e in entries})} devices, {scanner.table.evicted} evictions, {scanner.queue.dropped} dropped")
+    print(f"{scanner.discoveries} discoveries ({scanner.skipped} skipped), {len(found)} new/changed events, {len(summaries)} summaries")
+    print(f"log: {scanner.log.writes} writes, {os.path.getsize(log_path)} bytes "
+          f"({len(entries) / max(1, scanner.log.writes):.0f} advertisements per write)")
+
+    ok = True
+    waiting = {e["mac"] for e in found if e["connectable"]}
+    details = [e for e in lines if e["event"] == "details"]
+    if scanner.discoveries != len(events) or len(events) != len(details) or set(events) != waiting:
+        print("FAIL: discovery did not run for every new or changed connectable device")
+        ok = False
+    if len(summaries) != scanner.table.evicted + len(scanner.table):
+        print("FAIL: expected one summary per evicted or remaining device")
+        ok = False
+    if scanner.processed + scanner.queue.dropped != len(entries):
+        print("FAIL: advertisements were lost without being counted as dropped")
+        ok = False
+    if not ok:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+'''bench_boot.py - Boot phase report for code.py on the host, with stub hardware modules.
+
+Runs code.py against the fake modules, with the SD card taking SD_INIT_DELAY seconds to initialise
+like a real card on SPI. Presses Enter once the menu has been up for a moment, then Esc to close the
+menu that comes back while the selected command runs. Prints the phases code.py recorded in
+boot_phases: the menu should be drawn before the SD card work starts. The
+"imports" phase does not include command_registry and ui_loop, which the benchmark loads first to
+point SD_ROOT at a temporary directory and to swap in the key source.
+
+Usage: python benchmarks/bench_boot.py
+'''
+
+import os
+import runpy
+import sys
+import tempfile
+
+from bench_setup import ROOT, simulate
+
+import simulator
+
+simulate()
+
+import command_registry
+from interface_modules import ui_loop
+
+SD_INIT_DELAY = 0.25
+MENU_TIME = 0.5
+
+
+class EnterAfterDelay(ui_loop.QueueKeySource):
+    """Key source that presses Enter MENU_TIME seconds after the first menu starts reading keys, then
+    closes the menu that comes back after the command was scheduled with Esc."""
+
+    menus = 0
+
+    def __init__(self):
+        super().__init__()
+        EnterAfterDelay.menus += 1
+        self.first = EnterAfterDelay.menus == 1
+
+    async def read(self):
+        import asyncio
+        await asyncio.sleep(MENU_TIME if self.first else 0)
+        return "\n" if self.first else "\x1b"
+
+
+def main():
+    simulator.FakeSDCard.init_delay = SD_INIT_DELAY
+    command_registry.SD_ROOT = tempfile.mkdtemp()
+    ui_loop.StdinKeySource = EnterAfterDelay
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        scope = runpy.run_path(os.path.join(ROOT, "code.py"))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+    print(f"SD card init delay {SD_INIT_DELAY * 1000:.0f} ms, Enter pressed after {MENU_TIME * 1000:.0f} ms")
+    scope["boot_report"]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+'''bench_command_index.py - Menu startup cost of the lazy CommandIndex versus loading the whole command list.
+
+"eager" is what get_registry used to do: json.load the whole command list file. "lazy" opens the index,
+reads the first screen of names and loads the schema of the selected command. Both are timed and
+measured with tracemalloc against a command list written to a temporary directory.
+
+Usage: python benchmarks/bench_command_index.py
+'''
+
+import json
+import tempfile
+import time
+import tracemalloc
+
+from bench_setup import simulate
+
+simulate()
+
+import command_registry
+
+VISIBLE_COUNT = 7  # lines display_menu fits on the Cardputer screen
+
+
+def eager():
+    with open(command_registry.SD_ROOT + "/bench_commandlist.json") as f:
+        tools = json.load(f)["tools"]
+    names = [tool["function"]["name"] for tool in tools]
+    return names[:VISIBLE_COUNT], tools[3]
+
+
+def lazy():
+    index = command_registry.get_registry("bench")
+    names = [index.names[i] for i in range(VISIBLE_COUNT)]
+    return names, index.schema_json(3)
+
+
+def measure(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak
+
+
+def main():
+    for count in (100, 1000, 5000):
+        command_registry.SD_ROOT = tempfile.mkdtemp()
+        commands = [command_registry.Command(f"Peer {i}: Toggle relay {i}", f"Toggle relay channel {i} on a peer gadget", print,
+                                             kwargs={"state": "on"}) for i in range(count)]
+        command_registry.write_commandlist_to_file("bench", commands)
+        assert eager()[0] == lazy()[0]
+        print(f"{count} commands")
+        for name, func in (("eager", eager), ("lazy", lazy)):
+            ms, peak = measure(func)
+            print(f"  {name:6s} {ms:8.3f} ms  peak {peak / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+'''bench_command_memory.py - Bytes per registered command for the different registry layouts.
+
+Compares a dict of Command objects with an instance __dict__ (the old layout), a dict of the current
+slotted Command objects, and a CommandTable, alone and with the type-to-filter SearchIndex it builds the
+first time the menu is filtered. Commands mimic peer gadgets: every name is unique but the
+descriptions repeat across devices, built as separate string objects as they would be when parsed.
+
+Usage: python benchmarks/bench_command_memory.py
+'''
+
+import tracemalloc
+
+from bench_setup import simulate
+
+simulate()
+
+import command_registry
+
+DESCRIPTIONS = ["Toggle relay channel", "Read temperature sensor", "Set LED colour", "Report battery level"]
+
+
+class DictCommand:
+    """Command as it was before __slots__: every instance carries a __dict__."""
+
+    def __init__(self, name, description, callback, args=None, kwargs=None):
+        self.name = name
+        self.description = description
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+
+
+def action():
+    pass
+
+
+def build(count, command_class, registry):
+    for i in range(count):
+        description = "".join(["", DESCRIPTIONS[i % len(DESCRIPTIONS)]])  # a fresh string object each time
+        command_registry.register_command(command_class(f"Peer {i // 8}: command {i % 8}", description, action), registry)
+    return registry
+
+
+def filtered_table():
+    """A CommandTable whose search index is built once registration is done, as after the first '/'."""
+    return command_registry.CommandTable()
+
+
+def bytes_per_command(count, command_class, registry_factory):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    registry = build(count, command_class, registry_factory())
+    if registry_factory is filtered_table:
+        registry.search_index()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del registry
+    return used / count
+
+
+def main():
+    layouts = (
+        ("dict of __dict__ Commands", DictCommand, dict),
+        ("dict of slotted Commands", command_registry.Command, dict),
+        ("CommandTable", command_registry.Command, command_registry.CommandTable),
+        ("CommandTable, filtered once", command_registry.Command, filtered_table),
+    )
+    print(f"{'layout':28s} {'100':>8s} {'1000':>8s} {'10000':>8s}   (bytes per command, names included)")
+    for label, command_class, factory in layouts:
+        sizes = [bytes_per_command(count, command_class, factory) for count in (100, 1000, 10000)]
+        print(f"{label:28s} " + " ".join(f"{size:8.1f}" for size in sizes))
+
+
+if __name__ == "__main__":
+    main()
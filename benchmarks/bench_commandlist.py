@@ -0,0 +1,66 @@
+'''bench_commandlist.py - Time and peak allocation of command list generation at 10, 100 and 1000 commands.
+
+Measures prepare_commandlist_for_ai with cold and warm schema caches, and write_commandlist_to_file for
+a first write, an unchanged registry, one appended command and one command changed in the middle.
+The "SD card" is a temporary directory.
+
+Usage: python benchmarks/bench_commandlist.py
+'''
+
+import tempfile
+import time
+import tracemalloc
+
+from bench_setup import simulate
+
+simulate()
+
+import command_registry
+
+
+def make_commands(count):
+    commands = []
+    for i in range(count):
+        command = command_registry.Command(f"Peer {i}: Toggle relay {i}", f"Toggle relay channel {i} on a peer gadget", print)
+        if i % 2:
+            command_registry.add_keyword_args(command, {"state": "on", "duration": "10"})
+        commands.append(command)
+    return commands
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1000, peak
+
+
+def run(count):
+    command_registry.SD_ROOT = tempfile.mkdtemp()
+    commands = make_commands(count)
+    results = []
+    results.append(("prepare (cold cache)", measure(lambda: command_registry.prepare_commandlist_for_ai(commands))))
+    results.append(("prepare (warm cache)", measure(lambda: command_registry.prepare_commandlist_for_ai(commands))))
+    for command in commands:
+        command.invalidate_schema()
+    results.append(("write (first)", measure(lambda: command_registry.write_commandlist_to_file("bench", commands))))
+    results.append(("write (unchanged)", measure(lambda: command_registry.write_commandlist_to_file("bench", commands))))
+    commands.append(command_registry.Command("Peer new: Appended", "A command a new peer added", print))
+    results.append(("write (1 appended)", measure(lambda: command_registry.write_commandlist_to_file("bench", commands))))
+    command_registry.add_command_args(commands[count // 2], ["channel"])
+    results.append(("write (1 changed mid)", measure(lambda: command_registry.write_commandlist_to_file("bench", commands))))
+    return results
+
+
+def main():
+    for count in (10, 100, 1000):
+        print(f"{count} commands")
+        for name, (ms, peak) in run(count):
+            print(f"  {name:24s} {ms:8.3f} ms  peak {peak / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+'''bench_commandlist_memory.py - Check that writing the command list needs working memory bounded by one command.
+
+For growing registries, starts from cold schema caches, as after boot, and measures with tracemalloc
+what write_commandlist_to_file (streamed) leaves allocated, which is the per-command schema cache it
+fills, and its working memory: the peak on top of that cache. That is compared with writing the
+string from prepare_commandlist_for_ai in one go from the same warm caches. Checks that the working
+memory of the streamed write does not grow with the registry and that the file is byte-identical to
+json.dumps of the full tools list. Exits non-zero if either check fails.
+
+Usage: python benchmarks/bench_commandlist_memory.py
+'''
+
+import json
+import sys
+import tempfile
+import tracemalloc
+
+from bench_setup import simulate
+
+simulate()
+
+import command_registry
+
+
+def make_commands(count):
+    commands = []
+    for i in range(count):
+        command = command_registry.Command(f"Peer {i}: Toggle relay {i}", f"Toggle relay channel {i} on a peer gadget", print)
+        command_registry.add_keyword_args(command, {"state": "on", "duration": "10"})
+        commands.append(command)
+    return commands
+
+
+def measure(func):
+    """Return (peak, retained) bytes allocated by func."""
+    tracemalloc.start()
+    func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, retained
+
+
+def write_whole_string(path, commands):
+    with open(path, "w") as f:
+        f.write(command_registry.prepare_commandlist_for_ai(commands))
+
+
+def main():
+    ok = True
+    working = []
+    print(f"{'commands':>8} {'schema cache':>14} {'streamed':>12} {'whole string':>14}")
+    for count in (10, 100, 1000, 5000):
+        command_registry.SD_ROOT = tempfile.mkdtemp()
+        commands = make_commands(count)
+        peak, cache = measure(lambda: command_registry.write_commandlist_to_file("bench", commands))
+        whole = measure(lambda: write_whole_string(command_registry.SD_ROOT + "/whole.json", commands))[0]
+        working.append(peak - cache)
+        print(f"{count:8d} {cache / 1024:10.1f} KiB {(peak - cache) / 1024:8.1f} KiB {whole / 1024:11.1f} KiB")
+
+        with open(command_registry.SD_ROOT + "/bench_commandlist.json") as f:
+            written = f.read()
+        expected = json.dumps({"tools": [command_registry.command_schema(c) for c in commands]})
+        if written != expected:
+            print(f"  FAIL: streamed output differs from json.dumps at {count} commands")
+            ok = False
+
+    # Allow some slack for allocator noise, but nothing close to linear growth
+    if working[-1] > 2 * working[0]:
+        print("FAIL: working memory of the streamed write grows with registry size")
+        ok = False
+    print("ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
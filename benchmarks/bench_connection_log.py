@@ -0,0 +1,110 @@
+'''bench_connection_log.py - Write cost and query time of the binary connection log on the host.
+
+Simulates SCANS minute-by-minute scans, each seeing a mix of a few home networks and phones that are
+always there plus a changing crowd of passers-by, and writes them with ConnectionLogWriter (one
+flush per scan, as run_connection_logger does). Then compares ConnectionLogReader queries for a
+one-hour window and for a single rarely seen device with a full scan of the file, checks they
+return the same records, reopens the writer on the existing file and appends to it, and compares
+the file size with one JSON line per record. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_connection_log.py
+'''
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from connectivity.connection_logger import ConnectionLogWriter, ConnectionLogReader, KIND_WIFI, KIND_BLE
+
+SCANS = 14 * 24 * 60   # two weeks of one scan a minute
+START = 1700000000
+
+
+def make_scans(seed=1):
+    rng = random.Random(seed)
+    regulars = [("aa:00:00:00:00:%02x" % i, "HomeNet %d" % (i % 4), KIND_WIFI if i < 8 else KIND_BLE) for i in range(16)]
+    crowd = [("bb:%02x:%02x:00:00:01" % (i // 256, i % 256), "Phone %d" % i, KIND_BLE) for i in range(5000)]
+    for scan in range(SCANS):
+        seen = list(regulars)
+        seen += rng.sample(crowd, rng.randint(0, 6))
+        yield START + scan * 60, [(mac, name, kind, rng.randint(-95, -30), rng.randint(1, 13)) for mac, name, kind in seen]
+
+
+def write_log(path, scans):
+    writer = ConnectionLogWriter(path)
+    elapsed = 0
+    for timestamp, seen in scans:
+        start = time.perf_counter_ns()
+        for mac, name, kind, rssi, channel in seen:
+            writer.add(timestamp, mac, name, rssi, channel, kind)
+        writer.flush()
+        elapsed += time.perf_counter_ns() - start
+    return writer, elapsed
+
+
+def full_scan(reader, start=None, end=None, device=None):
+    """The same query answered by reading every segment."""
+    results = []
+    for segment in range(reader.segments):
+        for timestamp, dev, name, rssi, channel, kind, auth in reader.records(segment):
+            text = reader.strings[dev]
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end) and \
+                    (device is None or text == device):
+                results.append((timestamp, text, reader.strings[name], rssi, channel, kind, auth))
+    return results
+
+
+def timed(function):
+    start = time.perf_counter_ns()
+    result = function()
+    return result, (time.perf_counter_ns() - start) / 1e6
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "connections.log")
+    scans = list(make_scans())
+    writer, elapsed = write_log(path, scans[:SCANS // 2])
+    # Reopen, as after a reboot, and carry on appending
+    writer2, elapsed2 = write_log(path, scans[SCANS // 2:])
+    records = writer.records + writer2.records
+    size = os.path.getsize(path) + os.path.getsize(path + ".str") + os.path.getsize(path + ".dev")
+    json_size = sum(len(json.dumps({"time": t, "mac": m, "name": n, "rssi": r, "channel": c, "kind": k})) + 1
+                    for t, seen in scans for m, n, k, r, c in seen)
+    print(f"{records} records from {SCANS} scans: {(elapsed + elapsed2) / records / 1000:.2f} us per record, "
+          f"{writer.writes + writer2.writes} log writes")
+    print(f"file: {size / 1e6:.2f} MB ({size / records:.1f} bytes per record), JSON lines: {json_size / 1e6:.2f} MB")
+
+    ok = True
+    reader = ConnectionLogReader(path)
+    window = (START + SCANS * 60 * 2 // 3, START + SCANS * 60 * 2 // 3 + 3600)
+    rare = scans[SCANS // 3][1][-1][0]
+    for label, kwargs in (("one hour", {"start": window[0], "end": window[1]}), ("one device", {"device": rare})):
+        reader.reads = reader.bytes_read = 0
+        reader._summaries = {}
+        indexed, indexed_ms = timed(lambda: list(reader.query(**kwargs)))
+        indexed_reads = reader.reads, reader.bytes_read // 1024
+        reader.reads = reader.bytes_read = 0
+        scanned, scan_ms = timed(lambda: full_scan(reader, **kwargs))
+        print(f"{label:10s}: {len(indexed):5d} records, indexed {indexed_ms:7.2f} ms "
+              f"({indexed_reads[0]} reads, {indexed_reads[1]} KB), "
+              f"full scan {scan_ms:7.2f} ms ({reader.reads} reads, {reader.bytes_read // 1024} KB)")
+        if indexed != scanned:
+            print(f"FAIL: {label} query returned {len(indexed)} records, full scan {len(scanned)}")
+            ok = False
+    if sum(1 for _ in reader.query()) != records:
+        print("FAIL: the log does not hold every record written")
+        ok = False
+    reader.close()
+    if not ok:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
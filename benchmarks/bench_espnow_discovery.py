@@ -0,0 +1,92 @@
+'''bench_espnow_discovery.py - ESP-NOW discovery time against peer count, over a lossy loopback network.
+
+For each peer count, runs one discovery round of DiscoveryEngine against that many simulated
+gadgets (DiscoveryResponder on a LoopbackNetwork endpoint) with LOSS packet loss and 1-5 ms latency.
+Every third gadget offers enough commands that its signatures span several frames. Reports the time
+the round took, frames sent by the controller and by the peers, and resend requests, then checks
+that every peer was found with all its commands, that the Command entries are named after the peer,
+and that each peer's config file was written. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_espnow_discovery.py
+'''
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from simulator.loopback import LoopbackNetwork
+from connectivity import espnow_manager
+from connectivity.espnow_manager import DiscoveryEngine, DiscoveryResponder, peer_commands, save_peer_config
+
+PEER_COUNTS = (1, 5, 20, 50)
+LOSS = 0.1
+CONTROLLER = b"\x02\x00\x00\x00\x00\x01"
+
+
+def peer_signatures(n):
+    count = 40 if n % 3 == 0 else 3
+    return [("Relay %d toggle" % i, "Toggle relay %d of gadget %d" % (i, n), ["state"] if i % 2 else [])
+            for i in range(count)]
+
+
+def run_round(peer_count, config_dir):
+    network = LoopbackNetwork(loss=LOSS, seed=peer_count)
+    controller = network.endpoint(CONTROLLER)
+    peers = {}
+    for n in range(peer_count):
+        mac = bytes([0x24, 0x6F, 0x28, 0x00, n // 256, n % 256])
+        endpoint = network.endpoint(mac)
+        responder = DiscoveryResponder(endpoint, mac, "Gadget %d" % n, peer_signatures(n))
+        endpoint.handler = responder.handle
+        peers[mac] = (responder, endpoint)
+
+    engine = DiscoveryEngine(controller)
+    start = time.perf_counter()
+    results = asyncio.run(engine.discover(timeout=10))
+    elapsed = time.perf_counter() - start
+
+    ok = True
+    for mac, document in results.items():
+        save_peer_config(mac, document, config_dir)
+    for n, mac in enumerate(peers):
+        document = results.get(mac)
+        expected = [[name, description, args] for name, description, args in peer_signatures(n)]
+        if document is None or document["commands"] != expected:
+            print(f"  FAIL: gadget {n} missing or incomplete")
+            ok = False
+            continue
+        commands = peer_commands(mac, document)
+        if len(commands) != len(expected) or not commands[0].name.startswith("Gadget %d: " % n):
+            print(f"  FAIL: wrong commands for gadget {n}")
+            ok = False
+        path = os.path.join(config_dir, mac.hex())
+        with open(path) as f:
+            if len(json.load(f)["commands"]) != len(expected):
+                print(f"  FAIL: config file of gadget {n} is incomplete")
+                ok = False
+    peer_frames = sum(endpoint.sent for _, endpoint in peers.values())
+    fragments = sum(len(responder.fragments) for responder, _ in peers.values())
+    print(f"{peer_count:4d} peers: {elapsed * 1000:7.1f} ms, found {len(results)}, "
+          f"controller sent {engine.frames_sent} frames ({engine.retries} resend requests), "
+          f"peers sent {peer_frames} frames for {fragments} fragments, {network.lost} lost")
+    return ok
+
+
+def main():
+    config_dir = tempfile.mkdtemp()
+    print(f"loss {LOSS:.0%}, settle time {espnow_manager.SETTLE * 1000:.0f} ms after the last broadcast")
+    ok = True
+    for count in PEER_COUNTS:
+        ok = run_round(count, config_dir) and ok
+    if not ok:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
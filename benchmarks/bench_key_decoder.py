@@ -0,0 +1,81 @@
+'''bench_key_decoder.py - Split-sequence corpus check and decode rate for keyboard.key_decoder.
+
+Every corpus entry is decoded whole, one character per feed() call, and split in two at every
+position; all three must give the expected keys (with flush() at the end for trailing ESCs).
+Then measures decode rate over a typing-like mix of characters and escape sequences.
+Exits non-zero if any corpus entry fails.
+
+Usage: python benchmarks/bench_key_decoder.py
+'''
+
+import sys
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from keyboard.key_decoder import KeyDecoder
+
+CORPUS = [
+    ("abc", ["a", "b", "c"]),
+    ("\r\n\x7f\t", ["\r", "\n", "\x7f", "\t"]),
+    ("\x1b[A\x1b[B\x1b[C\x1b[D", ["UP", "DOWN", "RIGHT", "LEFT"]),
+    ("\x1bOA\x1bOD", ["UP", "LEFT"]),
+    ("\x1b[H\x1b[F\x1b[1~\x1b[4~\x1bOH\x1bOF", ["HOME", "END", "HOME", "END", "HOME", "END"]),
+    ("\x1b[5~\x1b[6~\x1b[2~\x1b[3~", ["PGUP", "PGDN", "INSERT", "DELETE"]),
+    ("\x1bOP\x1bOQ\x1bOR\x1bOS", ["F1", "F2", "F3", "F4"]),
+    ("\x1b[15~\x1b[17~\x1b[18~\x1b[19~\x1b[20~\x1b[21~\x1b[23~\x1b[24~",
+     ["F5", "F6", "F7", "F8", "F9", "F10", "F11", "F12"]),
+    ("\x1b[[A\x1b[[E", ["F1", "F5"]),
+    ("\x1b[1;5A\x1b[1;2D\x1b[1;3C\x1b[1;8B", ["CTRL+UP", "SHIFT+LEFT", "ALT+RIGHT", "SHIFT+ALT+CTRL+DOWN"]),
+    ("\x1b[3;5~\x1b[5;2~\x1b[15;6~", ["CTRL+DELETE", "SHIFT+PGUP", "SHIFT+CTRL+F5"]),
+    ("\x1b[Z", ["SHIFT+TAB"]),
+    ("\x1bx\x1bB", ["ALT+x", "ALT+B"]),
+    ("a\x1b", ["a", "ESC"]),
+    ("\x1b\x1b[A", ["ESC", "UP"]),
+    ("\x1b[99~x", ["\x1b[99~", "x"]),
+    ("\x1b[1;5Xy", ["\x1b[1;5X", "y"]),
+    ("\x1b[", ["ALT+["]),
+]
+
+
+def decode(chunks):
+    decoder = KeyDecoder()
+    keys = []
+    for chunk in chunks:
+        keys.extend(decoder.feed(chunk))
+    return keys + decoder.flush()
+
+
+def check_corpus():
+    failures = 0
+    for text, expected in CORPUS:
+        splits = [[text], list(text)] + [[text[:i], text[i:]] for i in range(1, len(text))]
+        for chunks in splits:
+            got = decode(chunks)
+            if got != expected:
+                failures += 1
+                print(f"FAIL {chunks!r}: got {got!r}, expected {expected!r}")
+    return failures
+
+
+def decode_rate(repeat=2000):
+    sample = "The quick brown fox\r" + "\x1b[A\x1b[B\x1b[1;5C\x1b[3~" + "jumps\x7f\x7f" + "\x1bOP\x1b[15~"
+    decoder = KeyDecoder()
+    start = time.perf_counter()
+    keys = 0
+    for _ in range(repeat):
+        keys += len(decoder.feed(sample))
+    elapsed = time.perf_counter() - start
+    return len(sample) * repeat / elapsed, keys / elapsed
+
+
+def main():
+    failures = check_corpus()
+    chars, keys = decode_rate()
+    print(f"corpus: {len(CORPUS)} entries, {failures} failures")
+    print(f"decode rate: {chars / 1e6:.2f} M chars/s, {keys / 1e6:.2f} M keys/s")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
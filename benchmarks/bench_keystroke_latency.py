@@ -0,0 +1,69 @@
+'''bench_keystroke_latency.py - Per-stage keystroke latency of the BLE keyboard against a fake HID device.
+
+Runs keyboard/ble_keyboard.py's main loop with a KeystrokeTrace, fake adafruit_ble/adafruit_hid modules
+(each HID report taking REPORT_DELAY seconds) and typing-paced input from a QueueKeySource, then prints
+the trace's percentile report. Also times the key handler with tracing disabled and enabled to show
+what the hooks cost.
+
+Usage: python benchmarks/bench_keystroke_latency.py
+'''
+
+import asyncio
+import os
+import sys
+import time
+
+from bench_setup import simulate
+
+import simulator
+
+simulate(ble=True)
+
+from interface_modules import ui_loop
+from keyboard import ble_keyboard
+from keyboard.keystroke_trace import KeystrokeTrace
+
+REPORT_DELAY = 0.002
+KEYS = (list("hello cardputer") + ["\x1b[A", "\x1b[B"]) * 8  # raw input, one keystroke each
+
+
+async def type_text(trace, interval=0.01):
+    source = ui_loop.QueueKeySource()
+    keyboard = asyncio.create_task(ble_keyboard.main(source, trace))
+    for key in KEYS:
+        await asyncio.sleep(interval)
+        source.feed(key)
+    await asyncio.sleep(interval)
+    keyboard.cancel()
+
+
+def handler_cost(trace, keys=20000):
+    """Average nanoseconds per call of KeyRepeater.on_key with instant HID reports."""
+    repeater = ble_keyboard.KeyRepeater(trace)
+    repeater.loop = ui_loop.UIEventLoop(None, repeater.on_key)
+    start = time.perf_counter_ns()
+    for i in range(keys):
+        repeater.on_key("ab"[i % 2])
+    return (time.perf_counter_ns() - start) / keys
+
+
+def main():
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    trace = KeystrokeTrace()
+    try:
+        simulator.FakeHIDKeyboard.report_delay = REPORT_DELAY
+        asyncio.run(type_text(trace))
+        simulator.FakeHIDKeyboard.report_delay = 0.0
+        disabled = handler_cost(None)
+        enabled = handler_cost(KeystrokeTrace())
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+    print(f"HID report delay {REPORT_DELAY * 1000:.1f} ms")
+    trace.print_report()
+    print(f"key handler: {disabled:.0f} ns/key with tracing off, {enabled:.0f} ns/key with tracing on")
+
+
+if __name__ == "__main__":
+    main()
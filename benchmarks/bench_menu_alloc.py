@@ -0,0 +1,98 @@
+'''bench_menu_alloc.py - Memory allocated by the menu's scroll/redraw path between key presses.
+
+Builds a Menu on fake labels with a long highlighted option and runs on_timer + redraw for a number of
+scroll steps, as the UI loop does while the user is not pressing anything. "before" redraws the way the
+menu did without the layout cache, formatting every visible option on every step.
+
+On a device (where gc.mem_free exists) the garbage collector is disabled during the run, so the
+gc.mem_free delta is everything the steps allocated. On the host, CPython frees temporaries right
+away, so tracemalloc reports what stays allocated and the largest amount live at once; interpreter
+overhead such as bound-method and range objects shows up there too.
+
+Usage: python benchmarks/bench_menu_alloc.py
+'''
+
+import gc
+
+import bench_setup  # puts the repository root on the module path
+
+try:
+    import simulator
+    simulator.install()
+except ImportError:
+    simulator = None  # on the device, with the real display modules
+
+from interface_modules import menu_renderer
+from interface_modules.menu_interface import Menu
+from interface_modules.menu_renderer import LineRenderer, format_option
+
+OPTIONS = ["Peer %d: Toggle relay channel %d on the garage gadget next to the door" % (i, i) for i in range(20)]
+VISIBLE_COUNT = 7
+AVAILABLE_TOTAL = 39
+STEPS = 500
+
+
+class Label:
+    def __init__(self):
+        self.text = ""
+        self.color = 0
+
+
+def uncached_redraw(menu):
+    """How the menu redrew before the layout cache: format every visible option on every step."""
+    for i in range(menu.visible_count):
+        option_index = menu.page + i
+        selected = option_index == menu.selected
+        menu.renderer.set_line(i, *format_option(menu.options[option_index], selected, AVAILABLE_TOTAL, menu.scroll))
+
+
+def make_menu():
+    menu = Menu(OPTIONS, LineRenderer([Label() for _ in range(VISIBLE_COUNT)]), VISIBLE_COUNT, AVAILABLE_TOTAL)
+    menu.select(3)
+    # One full scroll cycle first, so every frame and row is laid out and every label has seen its text
+    for _ in range(len(menu.frames)):
+        menu.on_timer()
+        menu.redraw()
+    return menu
+
+
+def measure(step):
+    if hasattr(gc, "mem_free"):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_free()
+        for _ in range(STEPS):
+            step()
+        used = before - gc.mem_free()
+        gc.enable()
+        return used, used
+    import tracemalloc
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for _ in range(STEPS):
+        step()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current - start, peak - start
+
+
+def main():
+    menu = make_menu()
+
+    def cached_step():
+        menu.on_timer()
+        menu.redraw()
+
+    def uncached_step():
+        menu.on_timer()
+        uncached_redraw(menu)
+
+    before = measure(uncached_step)
+    after = measure(cached_step)
+    print(f"{STEPS} scroll steps, {len(menu.frames)} frames per cycle")
+    print(f"before: {before[0]} bytes retained, {before[1]} bytes peak")
+    print(f"after:  {after[0]} bytes retained, {after[1]} bytes peak")
+
+
+if __name__ == "__main__":
+    main()
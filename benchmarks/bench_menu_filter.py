@@ -0,0 +1,101 @@
+'''bench_menu_filter.py - Per-keystroke latency of the menu's type-to-filter, and of paging to the end.
+
+For 1,000 and 10,000 command names, types a few queries one character at a time into a Menu and times
+each keystroke (filter + redraw of the visible window). "scan" is what filtering costs without the
+index: checking every name for the query on every keystroke. Also reports how long building the
+SearchIndex takes, what it holds, and how many key presses reach the last option with and without
+END/PGDN. Each filtered result is checked against the scan and the script exits non-zero on a mismatch.
+
+Usage: python benchmarks/bench_menu_filter.py
+'''
+
+import sys
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from interface_modules.menu_interface import Menu
+from interface_modules.menu_renderer import LineRenderer
+from interface_modules.option_search import SearchIndex, _words
+
+VISIBLE_COUNT = 7
+AVAILABLE_TOTAL = 39
+QUERIES = ["relay", "batt", "peer 42", "gar", "zz"]
+VERBS = ["Toggle relay", "Read sensor", "Battery voltage", "Open garage door", "Set backlight", "Ping"]
+
+
+class Label:
+    def __init__(self):
+        self.text = ""
+        self.color = 0
+
+
+def make_names(count):
+    return ["Peer %d: %s %d" % (i // 6, VERBS[i % len(VERBS)], i) for i in range(count)]
+
+
+def scan(names, query):
+    """Filtering without an index: test every name."""
+    query = query.lower()
+    if len(query) < 3:
+        return [i for i, name in enumerate(names) if any(w.startswith(query) for w in _words(name))]
+    return [i for i, name in enumerate(names) if query in name.lower()]
+
+
+def matches_of(menu):
+    return [menu.view.source_index(i) for i in range(len(menu.view))]
+
+
+def run(count):
+    names = make_names(count)
+    start = time.perf_counter_ns()
+    index = SearchIndex(names)
+    build_ms = (time.perf_counter_ns() - start) / 1e6
+    postings = sum(len(p) for p in index._trigrams.values()) + sum(len(p) for p in index._prefixes.values())
+    print(f"{count} options: index built in {build_ms:.1f} ms, "
+          f"{len(index._trigrams)} trigrams, {postings} postings (~{postings * 4 // 1024} KiB of arrays)")
+
+    menu = Menu(names, LineRenderer([Label() for _ in range(VISIBLE_COUNT)]), VISIBLE_COUNT, AVAILABLE_TOTAL, index)
+    menu.select(0)
+    indexed = []
+    scanned = []
+    ok = True
+    for query in QUERIES:
+        menu.on_key("/")
+        for n in range(1, len(query) + 1):
+            start = time.perf_counter_ns()
+            menu.on_key(query[n - 1])
+            menu.redraw()
+            indexed.append(time.perf_counter_ns() - start)
+            start = time.perf_counter_ns()
+            expected = scan(names, query[:n])
+            scanned.append(time.perf_counter_ns() - start)
+            if matches_of(menu) != expected:
+                print(f"  MISMATCH for {query[:n]!r}: {len(matches_of(menu))} vs {len(expected)}")
+                ok = False
+        print(f"  {query!r:10s} -> {len(menu.view)} matches")
+        menu.on_key("ESC")
+    indexed.sort()
+    scanned.sort()
+    print(f"  indexed: p50 {indexed[len(indexed) // 2] / 1000:8.1f} us  max {indexed[-1] / 1000:8.1f} us per key")
+    print(f"  scan:    p50 {scanned[len(scanned) // 2] / 1000:8.1f} us  max {scanned[-1] / 1000:8.1f} us per key")
+
+    presses = 0
+    menu.select(0)
+    while menu.selected < count - 1:
+        menu.on_key("PGDN")
+        presses += 1
+    print(f"  last option: {count - 1} presses of DOWN, {presses} of PGDN, 1 of END")
+    return ok
+
+
+def main():
+    ok = True
+    for count in (1000, 10000):
+        ok = run(count) and ok
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+'''bench_menu_render.py - Count label mutations per redraw in the menu, with and without dirty-line rendering.
+
+Runs the real menu against fake board/displayio modules, pressing 's' every few scroll steps and Enter
+at the end. The "before" run swaps in a renderer that writes every line on every redraw, which is what
+the menu loop used to do on each 50 ms frame.
+
+Usage: python benchmarks/bench_menu_render.py
+'''
+
+import asyncio
+import os
+import sys
+
+from bench_setup import simulate
+
+import simulator
+
+simulate()
+
+from interface_modules import menu_interface, menu_renderer, ui_loop
+
+OPTIONS = [
+    "Sample Command: Do something",
+    "Battery Voltage: Get battery voltage as a percentage of the maximum ADC reading",
+    "Backlight: Adjust the display brightness",
+    "A very long option without any colon that has to scroll across the whole line",
+] + ["Peer %d: Toggle relay channel %d on the garage gadget" % (i, i) for i in range(16)]
+
+
+class AlwaysWriteRenderer(menu_renderer.LineRenderer):
+    """The old behaviour: assign .text and .color on every visible line every frame."""
+
+    def set_line(self, index, text, color=None):
+        lbl = self.labels[index]
+        lbl.text = text
+        self.mutations += 1
+        if color is not None:
+            lbl.color = color
+            self.mutations += 1
+
+
+class CountingLoop(ui_loop.UIEventLoop):
+    last = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CountingLoop.last = self
+
+
+async def drive(moves, step):
+    source = ui_loop.QueueKeySource()
+    menu = asyncio.create_task(menu_interface.run_menu(OPTIONS, source))
+    for _ in range(moves):
+        await asyncio.sleep(step)
+        source.feed("s")
+    await asyncio.sleep(step)
+    source.feed("\n")
+    await menu
+
+
+def run(renderer_class, moves=12, step=0.02):
+    saved = (menu_renderer.LineRenderer, ui_loop.UIEventLoop, menu_interface.SCROLL_DELAY)
+    menu_renderer.LineRenderer = renderer_class
+    ui_loop.UIEventLoop = CountingLoop
+    menu_interface.SCROLL_DELAY = 0.002
+    simulator.FakeLabel.mutations = 0
+    try:
+        asyncio.run(drive(moves, step))
+    finally:
+        menu_renderer.LineRenderer, ui_loop.UIEventLoop, menu_interface.SCROLL_DELAY = saved
+    return simulator.FakeLabel.mutations, CountingLoop.last.stats.redraws
+
+
+def main():
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        before, before_redraws = run(AlwaysWriteRenderer)
+        after, after_redraws = run(menu_renderer.LineRenderer)
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+    print("before: mutations/redraw %.2f (%d redraws, %d total)" % (before / before_redraws, before_redraws, before))
+    print("after:  mutations/redraw %.2f (%d redraws, %d total)" % (after / after_redraws, after_redraws, after))
+
+
+if __name__ == "__main__":
+    main()
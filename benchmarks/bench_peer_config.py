@@ -0,0 +1,119 @@
+'''bench_peer_config.py - Boot cost of loading peer commands from connectivity/config with PeerConfigStore.
+
+Writes DEVICES synthetic peer config files with espnow_manager.save_peer_config, then times
+registering every peer's commands into a fresh CommandTable:
+  - naive: read and parse every file (what each boot would do without the store)
+  - cold: PeerConfigStore with no index yet (parses everything, then saves the index)
+  - warm: PeerConfigStore with a saved index and no changed files
+  - one changed: one file rewritten with a new command list since the index was saved
+Then changes one more file under a running store and checks that register() swaps that peer's
+commands in the existing table. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_peer_config.py
+'''
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from command_registry import CommandTable, register_commands
+from connectivity.espnow_manager import peer_commands, save_peer_config
+from connectivity.peer_config import PeerConfigStore, is_config_name, parse_config
+
+DEVICES = 200
+COMMANDS = 12   # per device
+
+
+def mac(n):
+    return bytes([0x24, 0x6F, 0x28, 0x10, n // 256, n % 256])
+
+
+def document(n, version=0):
+    return {"name": "Gadget %d" % n,
+            "commands": [["Relay %d toggle v%d" % (i, version), "Toggle relay %d of gadget %d" % (i, n),
+                          ["state"] if i % 2 else []] for i in range(COMMANDS)]}
+
+
+def naive(config_dir):
+    table = CommandTable()
+    for name in os.listdir(config_dir):
+        if is_config_name(name):
+            with open(os.path.join(config_dir, name), "rb") as f:
+                peer, commands = parse_config(f.read())
+            register_commands(peer_commands(bytes.fromhex(name), {"name": peer, "commands": commands}), table)
+    return table
+
+
+def with_store(config_dir):
+    table = CommandTable()
+    store = PeerConfigStore(config_dir)
+    store.register(table)
+    return table, store
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def rewrite(config_dir, n, version):
+    save_peer_config(mac(n), document(n, version), config_dir)
+    path = os.path.join(config_dir, mac(n).hex())
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + version))  # FAT mtimes are coarse; make the change visible
+
+
+def main():
+    config_dir = tempfile.mkdtemp()
+    for n in range(DEVICES):
+        save_peer_config(mac(n), document(n), config_dir)
+    expected = DEVICES * COMMANDS
+    ok = True
+
+    table, naive_ms = timed(naive, config_dir)
+    _, table_ms = timed(CommandTable().extend, list(table))
+    print(f"{DEVICES} devices, {COMMANDS} commands each; every run includes about {table_ms:.1f} ms for adding "
+          f"{expected} commands to the CommandTable and its search index")
+    print(f"naive      : {naive_ms:7.2f} ms, {DEVICES} files parsed")
+    runs = [("cold", None), ("warm", None), ("one changed", 7)]
+    for label, change in runs:
+        if change is not None:
+            rewrite(config_dir, change, 1)
+        (table, store), elapsed = timed(with_store, config_dir)
+        print(f"{label:11s}: {elapsed:7.2f} ms, {store.reads} files read, {store.parsed} parsed")
+        if len(table) != expected:
+            print(f"FAIL: {label} registered {len(table)} commands, expected {expected}")
+            ok = False
+        want = DEVICES if label == "cold" else (1 if change is not None else 0)
+        if store.parsed != want:
+            print(f"FAIL: {label} parsed {store.parsed} files, expected {want}")
+            ok = False
+    if "Gadget 7: Relay 0 toggle v1" not in table or "Gadget 7: Relay 0 toggle v0" in table:
+        print("FAIL: the changed file's commands were not picked up")
+        ok = False
+
+    # A running store keeps the table it registered into in step with later changes
+    rewrite(config_dir, 42, 2)
+    os.remove(os.path.join(config_dir, mac(99).hex()))
+    added, elapsed = timed(store.register, table)
+    print(f"refresh    : {elapsed:7.2f} ms, {added} commands re-registered")
+    if "Gadget 42: Relay 3 toggle v2" not in table or "Gadget 42: Relay 3 toggle v0" in table or \
+            "Gadget 99: Relay 0 toggle v0" in table or len(table) != expected - COMMANDS:
+        print("FAIL: refresh did not replace the changed peer's commands and drop the removed peer's")
+        ok = False
+    with open(os.path.join(config_dir, "index.json")) as f:
+        if len(json.load(f)["files"]) != DEVICES - 1:
+            print("FAIL: the saved index is out of date")
+            ok = False
+    if not ok:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
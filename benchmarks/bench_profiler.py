@@ -0,0 +1,188 @@
+'''bench_profiler.py - Cost and accuracy of the profiler's sections, and a profile of a driven menu.
+
+Reports the cost of a call made under a section, per call: with profiling off, on, and on with
+tracemalloc tracing the heap (which is what gc.mem_free() costs on the device). Then drives a
+40-option menu with a key every KEY_INTERVAL seconds, runs a few commands with profiling on, and
+prints the report that the Profiler command shows on the device.
+
+It checks that:
+  - section times match sleeps of a known length, and a recursive section counts its time once
+  - an exception leaves the section closed and propagates
+  - heap allocated inside a section is counted, and recording a call allocates nothing that stays
+  - sections registered past capacity are counted as overflow and not measured
+  - the menu, Command.execute and the SD writes of dump() show up in the report
+Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_profiler.py
+'''
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_setup import simulate
+
+simulate()
+
+import profiler
+from command_registry import Command, CommandTable
+from interface_modules import menu_interface, ui_loop
+from profiler import Profiler, get_profiler
+
+CALLS = 100000
+KEY_INTERVAL = 0.02
+KEYS = "ssssswwss/1\x1b\x1b"   # the first ESC drops the filter, the second closes the menu
+
+
+def noop():
+    pass
+
+
+def per_call(function):
+    start = time.perf_counter_ns()
+    for _ in range(CALLS):
+        function()
+    return (time.perf_counter_ns() - start) / CALLS
+
+
+def overhead():
+    p = Profiler()
+    measured = p.section("noop")
+
+    def under_section():
+        with measured:
+            pass
+
+    bare = per_call(noop)
+    p.enable(False)
+    off = per_call(under_section)
+    p.enable()
+    on = per_call(under_section)
+    tracemalloc.start()
+    traced = per_call(under_section)
+    tracemalloc.stop()
+    return bare, off, on, traced
+
+
+def checks():
+    failures = []
+    p = Profiler(capacity=4)
+    p.enable()
+    sleep = p.section("sleep")
+    for _ in range(5):
+        with sleep:
+            time.sleep(0.01)
+    s = p.stats("sleep")
+    if s["calls"] != 5 or not 50 <= s["total_ms"] < 75 or s["max_us"] < 10000:
+        failures.append("sleeps of 5 x 10 ms measured as %d calls, %.1f ms" % (s["calls"], s["total_ms"]))
+
+    recursive = p.section("recursive")
+
+    def descend(n):
+        with recursive:
+            time.sleep(0.002)
+            if n:
+                descend(n - 1)
+    descend(4)
+    s = p.stats("recursive")
+    if s["calls"] != 5 or not 10 <= s["total_ms"] < 20:
+        failures.append("recursion measured as %d calls, %.1f ms (expected 5, about 10 ms)" % (s["calls"], s["total_ms"]))
+
+    failing = p.section("failing")
+    try:
+        with failing:
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    else:
+        failures.append("an exception inside a section was swallowed")
+    with failing:
+        pass
+    if p.stats("failing")["calls"] != 2 or p._depth[failing.slot] != 0:
+        failures.append("a section left by an exception stayed open")
+
+    tracemalloc.start()
+    allocating = p.section("allocating")
+    kept = []
+    with allocating:
+        kept.append(bytearray(10000))
+    if p.stats("allocating")["alloc"] < 10000:
+        failures.append("10000 bytes allocated in a section counted as %d" % p.stats("allocating")["alloc"])
+    empty = p.section("sleep")
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(10000):
+        with empty:
+            pass
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    if grown > 512:
+        failures.append("recording 10000 calls kept %d bytes" % grown)
+
+    extra = p.section("one too many")
+    with extra:
+        pass
+    if p.overflow != 1 or extra.slot is not None or p.stats("one too many") is not None:
+        failures.append("a section past capacity was measured or not counted")
+    return failures
+
+
+async def drive_menu():
+    source = ui_loop.QueueKeySource()
+    menu = asyncio.create_task(menu_interface.run_menu(["Option %d" % i for i in range(40)], source))
+    for key in KEYS:
+        await asyncio.sleep(KEY_INTERVAL)
+        source.feed(key)
+    await menu
+
+
+def profile_session(directory):
+    failures = []
+    p = get_profiler()
+    p.reset()
+    p.enable()
+    table = CommandTable()
+    table["add"] = Command("add", "Add two numbers", lambda a, b: a + b, [2, 3])
+    table["list"] = Command("list", "Build a list", lambda n: list(range(n)), [1000])
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        asyncio.run(drive_menu())
+        for command in table:
+            for _ in range(50):
+                command.execute()
+        path = p.dump(os.path.join(directory, profiler.REPORT_FILE))
+        p.dump(path)   # the second one is in the report it writes
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+    p.enable(False)
+    p.print_report()
+    for name, calls in (("menu.key", len(KEYS)), ("menu.redraw", 1), ("command.execute", 100), ("sd.replace", 1)):
+        s = p.stats(name)
+        if s is None or s["calls"] < calls:
+            failures.append("%s was called %s times, expected at least %d" % (name, s and s["calls"], calls))
+    with open(path) as f:
+        if "menu.redraw" not in f.read():
+            failures.append("the saved report does not list the menu")
+    return failures
+
+
+def main():
+    bare, off, on, traced = overhead()
+    print(f"per call: bare {bare:.0f} ns, section off +{off - bare:.0f} ns, on +{on - bare:.0f} ns, "
+          f"on with tracemalloc +{traced - bare:.0f} ns")
+    failures = checks()
+    print()
+    failures += profile_session(tempfile.mkdtemp())
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+'''bench_remote_command.py - Throughput of remote command calls against the number of calls in flight.
+
+A RemoteDispatcher talks to PEERS simulated gadgets (CommandServer on LoopbackNetwork endpoints)
+over a loopback network with LATENCY seconds of one-way delay, so a call takes about 100 ms however
+fast the peer is. CALLS calls are made with 1, 4 and 16 of them outstanding at a time, and the calls
+per second are reported. Replies arrive out of order because the latency is random. Every result is
+checked against the call it answers.
+
+It then checks the rest of the call path:
+  - a call to a MAC nobody answers raises TimeoutError and leaves nothing pending
+  - a cancelled call is dropped and its late reply ignored
+  - a command with a cache TTL is answered from the ResultCache until the TTL expires
+  - a failing command raises RemoteError
+  - Command.execute() on a command from peer_commands() returns a coroutine that runs it on the peer,
+    and the signature's argument names end up in its schema, not in its args
+  - over a FrameRouter, a discovery frame arriving during a call is kept for the discovery channel
+Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_remote_command.py
+'''
+
+import asyncio
+import sys
+import time
+
+import bench_setup  # puts the repository root on the module path
+
+from simulator.loopback import LoopbackNetwork
+from command_registry import command_schema
+from connectivity.espnow_manager import MSG_RESULT, MSG_SIGNATURES, FrameRouter, pack_frame, peer_commands
+from connectivity.remote_command import AsyncTransport, CommandServer, RemoteDispatcher, RemoteError
+
+PEERS = 4
+CALLS = 96
+LATENCY = (0.04, 0.06)
+IN_FLIGHT = (1, 4, 16)
+CONTROLLER = b"\x02\x00\x00\x00\x00\x01"
+ROUTED = b"\x02\x00\x00\x00\x00\x02"
+SILENT = b"\x02\x00\x00\x00\x00\xee"
+
+
+def peer_mac(n):
+    return bytes([0x24, 0x6F, 0x28, 0x20, 0, n])
+
+
+def make_network():
+    network = LoopbackNetwork(latency=LATENCY, seed=3)
+    reads = [0]
+
+    def temperature():
+        reads[0] += 1
+        return 21.5
+
+    def fail():
+        raise ValueError("relay stuck")
+
+    for n in range(PEERS):
+        endpoint = network.endpoint(peer_mac(n))
+        handlers = {"add": lambda a, b: a + b, "temperature": temperature, "fail": fail,
+                    "report": lambda lines: ["line %d of a long report" % i for i in range(lines)]}
+        endpoint.handler = CommandServer(endpoint, handlers).handle
+    dispatcher = RemoteDispatcher(AsyncTransport(network.endpoint(CONTROLLER), poll=0.001))
+    return network, dispatcher, reads
+
+
+async def throughput(dispatcher, in_flight):
+    queue = list(range(CALLS))
+    errors = []
+
+    async def worker():
+        while queue:
+            i = queue.pop()
+            result = await dispatcher.call(peer_mac(i % PEERS), "add", (i, 1000))
+            if result != i + 1000:
+                errors.append(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(in_flight)])
+    return time.perf_counter() - start, errors
+
+
+async def checks(network, dispatcher, reads):
+    failures = []
+
+    try:
+        await dispatcher.call(SILENT, "add", (1, 2), timeout=0.2)
+        failures.append("a call to a silent MAC did not time out")
+    except asyncio.TimeoutError:
+        pass
+
+    task = asyncio.create_task(dispatcher.call(peer_mac(0), "add", (1, 2)))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    try:
+        await task
+        failures.append("a cancelled call completed")
+    except asyncio.CancelledError:
+        pass
+    if await dispatcher.call(peer_mac(1), "add", (2, 3)) != 5:
+        failures.append("a call after a cancelled one got the wrong reply")
+
+    for _ in range(3):
+        await dispatcher.call(peer_mac(2), "temperature", ttl=0.3)
+    if reads[0] != 1 or dispatcher.cache_hits != 2:
+        failures.append("cached command was read %d times" % reads[0])
+    await asyncio.sleep(0.35)
+    await dispatcher.call(peer_mac(2), "temperature", ttl=0.3)
+    if reads[0] != 2:
+        failures.append("cached result outlived its TTL")
+
+    try:
+        await dispatcher.call(peer_mac(3), "fail")
+        failures.append("a failing command did not raise")
+    except RemoteError as e:
+        if "relay stuck" not in str(e):
+            failures.append("wrong error text %r" % str(e))
+
+    if len(await dispatcher.call(peer_mac(3), "report", (40,))) != 40:
+        failures.append("a reply spanning several frames was not reassembled")
+
+    command = peer_commands(peer_mac(0), {"name": "Gadget", "commands": [["add", "Add two numbers", ["a", "b"]]]})[0]
+    if command.args is not None:
+        failures.append("argument names of a peer command were stored as its args: %r" % (command.args,))
+    if command_schema(command)["function"]["parameters"]["required"] != ["a", "b"]:
+        failures.append("argument names of a peer command are missing from its schema")
+    command.callback.dispatcher = dispatcher
+    command.args = [20, 22]
+    if await command.execute() != 42:
+        failures.append("Command.execute() of a peer command did not run it on the peer")
+
+    router = FrameRouter(network.endpoint(ROUTED))
+    discovery = router.channel(MSG_SIGNATURES)
+    routed = RemoteDispatcher(AsyncTransport(router.channel(MSG_RESULT), poll=0.001))
+    call = asyncio.create_task(routed.call(peer_mac(1), "add", (4, 5)))
+    network.send(peer_mac(3), ROUTED, pack_frame(MSG_SIGNATURES, 1, b"{}"))
+    if await call != 9:
+        failures.append("a call over a FrameRouter channel got the wrong reply")
+    received = discovery.receive()
+    if received is None or received[1][0] != MSG_SIGNATURES:
+        failures.append("a discovery frame read during a call was not kept for the discovery channel")
+
+    await asyncio.sleep(0.1)
+    if dispatcher.pending:
+        failures.append("%d calls left pending" % len(dispatcher.pending))
+    return failures
+
+
+def main():
+    print(f"{PEERS} peers, {LATENCY[0] * 1000:.0f}-{LATENCY[1] * 1000:.0f} ms one-way latency, {CALLS} calls")
+    ok = True
+    for in_flight in IN_FLIGHT:
+        network, dispatcher, _ = make_network()
+        elapsed, errors = asyncio.run(throughput(dispatcher, in_flight))
+        print(f"{in_flight:3d} in flight: {CALLS / elapsed:7.1f} calls/s ({elapsed * 1000 / CALLS:6.1f} ms per call)")
+        if errors:
+            print(f"FAIL: {len(errors)} calls got another call's result")
+            ok = False
+    network, dispatcher, reads = make_network()
+    failures = asyncio.run(checks(network, dispatcher, reads))
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures or not ok:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
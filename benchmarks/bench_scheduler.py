@@ -0,0 +1,184 @@
+'''bench_scheduler.py - Scheduling overhead and timing jitter of the job scheduler with 50 periodic jobs.
+
+Runs JOBS periodic jobs with periods from 20 to 200 ms for DURATION seconds. Every tenth job is a
+"sensor read" that busies the CPU for BUSY_MS, and the rest only count their runs. Meanwhile a menu is
+driven with a key every KEY_INTERVAL seconds. Two ways of running the jobs are compared:
+  - scheduler: one Scheduler task with the jobs in its heap
+  - tasks: one asyncio task per job, looping over callback(); await asyncio.sleep(period), which is what
+    code would do without a scheduler
+For each it reports the scheduling overhead per run, how late runs started (mean and worst), how
+far the run counts drifted from DURATION / period, and the menu's key-to-redraw latency. Then it
+checks that the scheduler ran every job on its grid without drift, that one-shot and background
+commands submitted from a CommandTable run once, that submitting a running periodic command again
+does not add a second job, and that cancel() stops a periodic job. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_scheduler.py
+'''
+
+import asyncio
+import os
+import sys
+import time
+
+from bench_setup import simulate
+
+simulate()
+
+from command_registry import BACKGROUND, PERIODIC, Command, CommandTable
+from interface_modules import menu_interface, ui_loop
+from scheduler import Scheduler
+
+JOBS = 50
+DURATION = 3.0
+BUSY_MS = 1.0
+KEY_INTERVAL = 0.05
+
+
+def period(i):
+    return 0.02 + (i % 10) * 0.02
+
+
+def make_callback(i, runs, starts):
+    def read():
+        runs[i] += 1
+        starts[i].append(time.monotonic_ns())
+        if i % 10 == 0:
+            end = time.perf_counter() + BUSY_MS / 1000
+            while time.perf_counter() < end:
+                pass
+    return read
+
+
+class RecordingLoop(ui_loop.UIEventLoop):
+    last = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        RecordingLoop.last = self
+
+
+async def drive_menu(runs):
+    """Press keys for DURATION seconds; returns the menu's loop stats and the runs of each job in that time."""
+    source = ui_loop.QueueKeySource()
+    menu = asyncio.create_task(menu_interface.run_menu(["Option %d" % i for i in range(40)], source))
+    start = list(runs)
+    end = time.monotonic() + DURATION
+    while time.monotonic() < end:
+        await asyncio.sleep(KEY_INTERVAL)
+        source.feed("s")
+    counts = [now - before for now, before in zip(runs, start)]
+    report = RecordingLoop.last.stats.report()
+    source.feed("\n")
+    await menu
+    return report, counts
+
+
+async def with_scheduler(runs, starts):
+    scheduler = Scheduler()
+    jobs = [scheduler.add("job %d" % i, make_callback(i, runs, starts), mode=PERIODIC, period=period(i))
+            for i in range(JOBS)]
+    task = asyncio.create_task(scheduler.run())
+    report, counts = await drive_menu(runs)
+    task.cancel()
+    lates = [job.late_total_ns / job.runs / 1e6 for job in jobs if job.runs]
+    late_max = max(job.late_max_ns for job in jobs) / 1e6
+    per_run = scheduler.overhead_ns / max(1, sum(job.runs for job in jobs)) / 1000
+    return report, counts, sum(lates) / len(lates), late_max, per_run, jobs
+
+
+async def with_tasks(runs, starts):
+    async def loop(i, callback):
+        due = time.monotonic_ns()
+        lates = []
+        while True:
+            lates.append(time.monotonic_ns() - due)
+            callback()
+            await asyncio.sleep(period(i))
+            due += int(period(i) * 1e9)
+
+    start = time.monotonic_ns()
+    tasks = [asyncio.create_task(loop(i, make_callback(i, runs, starts))) for i in range(JOBS)]
+    report, counts = await drive_menu(runs)
+    for task in tasks:
+        task.cancel()
+    # How late each run started against the job's own grid (start + n * period)
+    lates = []
+    for i in range(JOBS):
+        step = int(period(i) * 1e9)
+        lates.extend((t - start - n * step) / 1e6 for n, t in enumerate(starts[i]))
+    return report, counts, sum(lates) / len(lates), max(lates), None, None
+
+
+def drift(runs):
+    """Largest difference, in runs, between what each job ran and DURATION / period."""
+    return max(abs(runs[i] - DURATION / period(i)) for i in range(JOBS))
+
+
+async def mode_checks():
+    failures = []
+    scheduler = Scheduler()
+    task = asyncio.create_task(scheduler.run())
+    calls = []
+
+    async def logger():
+        calls.append("background start")
+        await asyncio.sleep(0.05)
+        calls.append("background end")
+
+    table = CommandTable()
+    table["once"] = Command("once", "One-shot command", lambda: calls.append("once"))
+    table["logger"] = Command("logger", "Background logger", logger, mode=BACKGROUND)
+    table["tick"] = Command("tick", "Periodic tick", lambda: calls.append("tick"), mode=PERIODIC, period=0.02)
+    jobs = [scheduler.submit(command) for command in table]
+    if scheduler.submit(table["tick"]) is not jobs[2] or len(scheduler.jobs) != 3:
+        failures.append("submitting a running periodic command again scheduled a second job")
+    await asyncio.sleep(0.11)
+    scheduler.cancel(jobs[2])
+    ticks = calls.count("tick")
+    await asyncio.sleep(0.05)
+    task.cancel()
+    if calls.count("once") != 1 or calls.count("background end") != 1:
+        failures.append("one-shot/background commands did not run exactly once: %r" % calls)
+    if not 5 <= ticks <= 7:
+        failures.append("periodic command ran %d times in 110 ms at a 20 ms period" % ticks)
+    if calls.count("tick") != ticks:
+        failures.append("cancelled periodic job kept running")
+    if scheduler.jobs:
+        failures.append("finished jobs left in the scheduler: %r" % [job.name for job in scheduler.jobs])
+    return failures
+
+
+def run(method):
+    runs = [0] * JOBS
+    starts = [[] for _ in range(JOBS)]
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return asyncio.run(method(runs, starts))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+
+def main():
+    ui_loop.UIEventLoop = RecordingLoop
+    print(f"{JOBS} periodic jobs, 20-200 ms periods, {DURATION:.0f} s, every tenth busy for {BUSY_MS:.0f} ms")
+    failures = []
+    for label, method in (("scheduler", with_scheduler), ("tasks", with_tasks)):
+        report, runs, late_avg, late_max, per_run, jobs = run(method)
+        overhead = f"{per_run:5.1f} us/run" if per_run is not None else "    n/a     "
+        print(f"{label:9s}: {sum(runs):5d} runs, overhead {overhead}, late avg {late_avg:6.2f} ms max {late_max:6.2f} ms, "
+              f"drift up to {drift(runs):4.1f} runs, key latency avg {report['key_latency_avg_ms']:.2f} "
+              f"max {report['key_latency_max_ms']:.2f} ms")
+        if jobs is not None and drift(runs) > 2:
+            failures.append("scheduler jobs drifted by %.1f runs" % drift(runs))
+    failures += asyncio.run(mode_checks())
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+'''bench_screen_switch.py - Memory and time of opening screens over and over, with stub displayio.
+
+Alternately opens the command menu and the backlight screen SWITCHES times on the shared scene and
+samples the memory still allocated every REPORT_EVERY switches. Two warm-up switches first fill the
+label pool and create the status bar. The number of live objects must not grow, and neither may the
+retained memory after the first two samples: the script exits non-zero otherwise. (CPython keeps up to
+2000 freed tuples of each small size for reuse, and tracemalloc counts those as allocated, so the
+first samples show a one-off rise of up to ~100 KB on the host that has nothing to do with the code.)
+
+For comparison, "fresh" builds each screen the old way, with a new background Bitmap, Palette,
+TileGrid, Group and labels. The report shows how much each approach allocates per switch (tracemalloc
+peak); that churn is what fragments the heap on the device.
+
+Usage: python benchmarks/bench_screen_switch.py
+'''
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from bench_setup import simulate
+
+display = simulate()
+
+import displayio
+import terminalio
+from adafruit_display_text import label
+
+from backlight.backlight import open_backlight_screen
+from interface_modules.menu_interface import open_menu_screen
+from interface_modules.option_search import SearchIndex
+
+SWITCHES = 10000
+REPORT_EVERY = 2000
+GROWTH_LIMIT = 1024
+OPTIONS = ["Sample Command: Do something", "Battery Voltage: Get battery voltage", "Backlight: Adjust"] + \
+    ["Peer %d: Toggle relay %d" % (i, i) for i in range(40)]
+
+
+def open_fresh_screen(line_count):
+    """How a screen was built before the screen manager."""
+    group = displayio.Group()
+    bitmap = displayio.Bitmap(display.width, display.height, 1)
+    palette = displayio.Palette(1)
+    palette[0] = 0x000000
+    group.append(displayio.TileGrid(bitmap, pixel_shader=palette, x=0, y=0))
+    for i in range(line_count):
+        group.append(label.Label(terminalio.FONT, text="", color=0x007700, x=2, y=20 + i * 16))
+    display.root_group = group
+
+
+def switch(i, index):
+    if i % 2:
+        open_backlight_screen()
+    else:
+        menu = open_menu_screen(OPTIONS, index)
+        menu.select(0)
+        menu.redraw()
+
+
+def main():
+    index = SearchIndex(OPTIONS)
+    switch(0, index)
+    switch(1, index)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    samples = []
+    objects = []
+    start = time.perf_counter_ns()
+    for i in range(SWITCHES):
+        switch(i, index)
+        if (i + 1) % REPORT_EVERY == 0:
+            samples.append(tracemalloc.get_traced_memory()[0] - baseline)
+            gc.collect()
+            objects.append(len(gc.get_objects()))
+    elapsed = time.perf_counter_ns() - start
+    tracemalloc.reset_peak()
+    current = tracemalloc.get_traced_memory()[0]
+    switch(0, index)
+    pooled_peak = tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.reset_peak()
+    current = tracemalloc.get_traced_memory()[0]
+    open_fresh_screen(7)
+    fresh_peak = tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    print(f"{SWITCHES} screen switches, {elapsed / SWITCHES / 1000:.1f} us per switch")
+    print("retained after N switches: " + ", ".join(
+        f"{(n + 1) * REPORT_EVERY}: {size} B" for n, size in enumerate(samples)))
+    print(f"allocated per menu switch: pooled {pooled_peak} B, fresh {fresh_peak} B")
+    growth = samples[-1] - samples[1]
+    more_objects = objects[-1] - objects[0]
+    if growth > GROWTH_LIMIT or more_objects > 0:
+        print(f"FAIL: retained memory grew by {growth} bytes, {more_objects} more live objects")
+        sys.exit(1)
+    print(f"retained memory flat (grew {growth} B, {more_objects} more live objects)")
+
+
+if __name__ == "__main__":
+    main()
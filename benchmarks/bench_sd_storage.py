@@ -0,0 +1,208 @@
+'''bench_sd_storage.py - SD card writes per logged record, with and without the storage service.
+
+Replays an hour of logging in simulated time against a DirectoryCard, a temporary directory that
+counts writes by sector:
+  - battery.log: one 6-byte sample every 10 s
+  - connections.log: a scan of 15 12-byte records every 60 s
+  - ble_scan.jsonl: three JSON lines every 5 s
+Every record is written in three ways:
+  - direct: open, append and close the file for each record
+  - storage: Storage.append() for each record, with tick() every TICK_INTERVAL seconds
+  - low battery: the same, with the battery below LOW_BATTERY percent, so every append is written through
+For each it reports per record the files opened, write operations, bytes flushed, sectors programmed
+and writes that start or end inside a sector, and checks that all three leave the same files.
+
+Then it checks the rest of the service: the card is mounted once; buffers are written once they are
+FLUSH_AGE old and not before; writes made because a buffer filled end on a sector boundary; data
+appended while the card is missing is kept and written when it is back, and appends past
+max_pending are dropped whole; an atomic replace that fails, or that a crash interrupted, leaves a
+whole file. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_sd_storage.py
+'''
+
+import json
+import os
+import sys
+import tempfile
+
+import bench_setup  # puts the repository root on the module path
+
+import simulator
+
+import sd_storage
+from sd_storage import SECTOR_SIZE, TICK_INTERVAL, Storage
+
+DURATION = 3600
+FILES = ("battery.log", "connections.log", "ble_scan.jsonl")
+
+
+def records():
+    """Yield (second, file, data) for every record logged in DURATION seconds."""
+    for t in range(DURATION):
+        if t % 10 == 0:
+            yield t, "battery.log", (t.to_bytes(4, "little") + (4100 - t // 10).to_bytes(2, "little"))
+        if t % 60 == 0:
+            for n in range(15):
+                yield t, "connections.log", t.to_bytes(4, "little") + bytes([n, 0, n, 0, 200, 6, 0, 8])
+        if t % 5 == 0:
+            for n in range(3):
+                line = json.dumps({"event": "new", "time": t, "mac": "aa:bb:cc:dd:ee:%02x" % n, "rssi": -60 - n,
+                                   "name": "Device %d" % n, "services": ["180f"]}) + "\n"
+                yield t, "ble_scan.jsonl", line.encode()
+
+
+def direct(card, directory):
+    count = 0
+    for t, name, data in records():
+        with card.open(os.path.join(directory, name), "ab") as f:
+            f.write(data)
+        count += 1
+    return count
+
+
+def with_storage(card, directory, battery=None):
+    clock = simulator.FakeClock()
+    storage = Storage(directory, card.mount, clock.monotonic)
+    storage.battery = battery
+    storage.mount()
+    count = 0
+    for t, name, data in records():
+        while clock.now < t:
+            clock.now += TICK_INTERVAL
+            storage.tick()
+        storage.append(os.path.join(directory, name), data)
+        count += 1
+    storage.close()
+    return count
+
+
+def contents(directory):
+    result = {}
+    for name in FILES:
+        with open(os.path.join(directory, name), "rb") as f:
+            result[name] = f.read()
+    return result
+
+
+def checks(base):
+    failures = []
+    clock = simulator.FakeClock()
+    card = simulator.DirectoryCard(base)
+    sd_storage.open = card.open
+    directory = os.path.join(base, "card")
+    storage = Storage(directory, card.mount, clock.monotonic)
+    storage.mount()
+    storage.mount()
+    if card.mounts != 1:
+        failures.append("the card was mounted %d times" % card.mounts)
+
+    path = os.path.join(directory, "age.log")
+    storage.append(path, b"x" * 100)
+    clock.now = storage.flush_age - 1
+    storage.tick()
+    if os.path.exists(path):
+        failures.append("a buffer was written before it was flush_age old")
+    clock.now = storage.flush_age
+    storage.tick()
+    if not os.path.exists(path) or os.path.getsize(path) != 100:
+        failures.append("a buffer flush_age old was not written")
+
+    card.reset()
+    for _ in range(40):
+        storage.append(path, b"y" * 100)
+    if card.writes == 0 or card.ragged_ends:
+        failures.append("writes made when a buffer filled did not end on sector boundaries (%d of %d)"
+                        % (card.ragged_ends, card.writes))
+    storage.close(path)
+    if os.path.getsize(path) != 4100:
+        failures.append("close() did not write everything out")
+
+    # Card missing: appends are kept until it is back, the ones past max_pending are dropped whole
+    missing = os.path.join(base, "missing", "log")
+    storage.max_pending = 1000
+    kept = b""
+    for n in range(30):
+        record = b"%03d:" % n + b"z" * 46
+        if storage.append(missing, record):
+            kept += record
+        storage.flush(missing)
+    os.mkdir(os.path.dirname(missing))
+    storage.flush(missing)
+    with open(missing, "rb") as f:
+        written = f.read()
+    if written != kept or not storage.dropped or len(kept) % 50:
+        failures.append("data appended while the card was missing was lost or cut (%d of %d bytes, %d dropped)"
+                        % (len(written), len(kept), storage.dropped))
+
+    # Atomic replace
+    config = os.path.join(directory, "wifi.json")
+    storage.write_atomic(config, '{"version": 1}')
+    try:
+        with storage.replace(config, binary=False) as f:
+            f.write('{"vers')
+            raise OSError("card pulled")
+    except OSError:
+        pass
+    with open(config) as f:
+        if f.read() != '{"version": 1}' or os.path.exists(config + ".tmp"):
+            failures.append("a failed replace did not leave the old file")
+    # Crash between FAT's two renames: the old file moved aside, the new one complete
+    os.rename(config, config + ".old")
+    with open(config + ".tmp", "w") as f:
+        f.write('{"version": 2}')
+    storage.recover(config)
+    with open(config) as f:
+        if f.read() != '{"version": 2}' or os.path.exists(config + ".old"):
+            failures.append("recover() did not finish an interrupted replace")
+    # Crash while writing the new version: it is left alone
+    with open(config + ".tmp", "w") as f:
+        f.write('{"vers')
+    storage.recover(config)
+    with open(config) as f:
+        if f.read() != '{"version": 2}':
+            failures.append("recover() picked up a half written file")
+    return failures
+
+
+def main():
+    base = tempfile.mkdtemp()
+    rows = []
+    results = []
+    for label, run in (("direct", direct), ("storage", with_storage),
+                       ("low battery", lambda card, directory: with_storage(card, directory, lambda: 5))):
+        directory = os.path.join(base, label.replace(" ", "_"))
+        os.makedirs(directory)
+        card = simulator.DirectoryCard(directory)
+        sd_storage.open = card.open
+        try:
+            count = run(card, directory)
+        finally:
+            del sd_storage.open
+        rows.append((label, count, card))
+        results.append(contents(directory))
+
+    print(f"{rows[0][1]} records over {DURATION // 60} min to {len(FILES)} files, {SECTOR_SIZE}-byte sectors")
+    print("              opens   writes    bytes  sectors  partial   (per record)")
+    for label, count, card in rows:
+        print(f"{label:12s} {card.opens / count:6.3f} {card.writes / count:8.3f} {card.bytes / count:8.1f} "
+              f"{card.sectors / count:8.3f} {card.partial / count:8.3f}")
+
+    failures = []
+    if results[1] != results[0] or results[2] != results[0]:
+        failures.append("the storage service did not write the same files as direct appends")
+    if rows[1][2].writes * 10 > rows[0][2].writes:
+        failures.append("the storage service did not cut writes by at least 10x")
+    try:
+        failures += checks(os.path.join(base, "checks"))
+    finally:
+        del sd_storage.open
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+'''bench_setup.py - Setup shared by the benchmark scripts and the tests.
+
+The scripts run as `python benchmarks/<script>.py`, which puts benchmarks/ on the module path but not
+the repository root. Importing this module adds the root, so the device modules and the simulator
+package import as they do on the Cardputer. simulate() then installs the simulator's stand-ins for the
+hardware modules; call it before importing a device module that needs them.
+'''
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def simulate(ble=False, wifi=False):
+    """Install the simulated hardware, with the BLE radio and HID keyboard and the Wi-Fi radio if asked.
+
+    Returns the fake display.
+    """
+    import simulator
+    display = simulator.install()
+    if ble:
+        simulator.install_ble()
+    if wifi:
+        simulator.install_wifi()
+    return display
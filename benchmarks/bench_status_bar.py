@@ -0,0 +1,69 @@
+'''bench_status_bar.py - Label redraws and hardware reads of the status bar on a stub display.
+
+Simulates MINUTES minutes on a fake clock. The status bar task updates the bar every second and,
+as a second screen would, another consumer asks the sensor cache for the battery level ten times
+a second. The battery drains 1% every 40 s, and BLE connects and disconnects a few times. Reports
+label writes per minute and how often each source's read function ran. Compare these with the bar
+rewriting all three labels on every update, and with each consumer reading the hardware itself.
+
+Usage: python benchmarks/bench_status_bar.py
+'''
+
+
+from bench_setup import simulate
+
+import simulator
+
+simulate()
+
+from interface_modules.sensor_cache import SensorCache
+from interface_modules.status_bar import StatusBar, BATTERY_PERIOD, RADIO_PERIOD, CLOCK_PERIOD
+
+MINUTES = 10
+TICK = 0.1  # seconds
+
+
+def main():
+    clock = simulator.FakeClock()
+    clock.now = start = 12 * 3600 + 34 * 60 + 5  # 12:34:05
+
+    def read_battery():
+        return 87 - int((clock.now - start) // 40)
+
+    def read_ble():
+        return int(clock.now // 90) % 2 == 0  # connected for 90 s, then not for 90 s
+
+    def read_clock():
+        return int(clock.now // 3600) % 24, int(clock.now // 60) % 60
+
+    sensors = SensorCache(clock.monotonic)
+    sensors.register("battery", read_battery, BATTERY_PERIOD)
+    sensors.register("ble", read_ble, RADIO_PERIOD)
+    sensors.register("wifi", lambda: None, RADIO_PERIOD)
+    sensors.register("clock", read_clock, CLOCK_PERIOD)
+
+    bar = StatusBar(240, sensors=sensors)
+    screen = simulator.FakeGroup()
+    bar.mount(screen)
+    start_redraws = bar.redraws
+
+    ticks = int(MINUTES * 60 / TICK)
+    updates = 0
+    for tick in range(ticks):
+        clock.now += TICK
+        sensors.get("battery")  # another screen showing the battery level
+        if tick % int(1 / TICK) == 0:
+            bar.update()
+            updates += 1
+
+    redraws = bar.redraws - start_redraws
+    print(f"{MINUTES} simulated minutes, {updates} bar updates, {ticks} battery lookups by a second consumer")
+    print(f"label writes: {redraws / MINUTES:.1f} per minute (rewriting every label: {3 * updates / MINUTES:.0f})")
+    naive = {"battery": ticks + updates, "ble": updates, "wifi": updates, "clock": updates}
+    for name, reads in sensors.reads.items():
+        print(f"  {name:8s} {reads / MINUTES:6.1f} reads per minute (uncached: {naive[name] / MINUTES:.0f})")
+    print(f"bar shows: {' | '.join(bar.texts)}")
+
+
+if __name__ == "__main__":
+    main()
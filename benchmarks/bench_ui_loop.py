@@ -0,0 +1,68 @@
+'''bench_ui_loop.py - Idle time and keypress-to-redraw latency of the event-driven menu loop.
+
+Feeds keys into the real menu through a QueueKeySource at a typing-like pace and prints the loop's
+LoopStats report, once for a menu whose options all fit (no scroll timer) and once where the
+highlighted option overflows and scrolls.
+
+Usage: python benchmarks/bench_ui_loop.py
+'''
+
+import asyncio
+import os
+import sys
+
+from bench_setup import simulate
+
+simulate()
+
+from interface_modules import menu_interface, ui_loop
+
+SHORT = ["Option %d" % i for i in range(20)]
+LONG = ["Peer %d: Toggle relay channel %d on the garage gadget next to the door" % (i, i) for i in range(20)]
+
+
+class RecordingLoop(ui_loop.UIEventLoop):
+    last = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        RecordingLoop.last = self
+
+
+async def drive(options, keys, interval):
+    source = ui_loop.QueueKeySource()
+    menu = asyncio.create_task(menu_interface.run_menu(options, source))
+    for key in keys:
+        await asyncio.sleep(interval)
+        source.feed(key)
+    await asyncio.sleep(interval)
+    source.feed("\n")
+    await menu
+
+
+def run(options, keys="ssswsssswwss", interval=0.1):
+    saved = ui_loop.UIEventLoop
+    ui_loop.UIEventLoop = RecordingLoop
+    try:
+        asyncio.run(drive(options, keys, interval))
+    finally:
+        ui_loop.UIEventLoop = saved
+    return RecordingLoop.last.stats.report()
+
+
+def main():
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results = [("no scrolling", run(SHORT)), ("scrolling", run(LONG))]
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+    for name, report in results:
+        print(name)
+        for key, value in report.items():
+            print("  %-20s %s" % (key, round(value, 3) if isinstance(value, float) else value))
+
+
+if __name__ == "__main__":
+    main()
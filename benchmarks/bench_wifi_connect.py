@@ -0,0 +1,202 @@
+'''bench_wifi_connect.py - Time to an interactive menu while Wi-Fi connects at boot.
+
+A FakeWiFiRadio with NETWORKS access points spread over the channels blocks like the real radio:
+CHANNEL_DELAY seconds per channel scanned and CONNECT_DELAY per connect. Its first FAILED_CONNECTS
+connects fail, each blocking for the whole connect timeout, as when the access point does not
+answer. The saved default network is in range. Two boots are compared:
+  - blocking: scan all channels, then connect and retry, then draw the menu
+  - manager: WiFiManager.start() on a Scheduler and draw the menu straight away, pressing DOWN every
+    KEY_INTERVAL seconds while it scans and its connect job makes one attempt every CONNECT_TICK
+For each, the benchmark reports the time until the menu is drawn and until Wi-Fi is connected.
+For the manager boot it also reports the key-to-redraw latency while connecting and the longest
+time the event loop was blocked, which is one failed wifi.radio.connect() waiting out its timeout.
+Retry backoff, the connect tick and the connect timeout are scaled down from seconds, to RETRY_BASE,
+CONNECT_TICK and CONNECT_TIMEOUT (a tenth of wifi_network.CONNECT_TIMEOUT). The boot fails the check if a key waited longer than that.
+It also checks that the network table is sorted by signal and that stale networks age out. Then it
+picks a new network in the Wi-Fi menu, types its password and makes it the default, and checks that
+the credentials survive a reload. Exits non-zero if a check fails.
+
+Usage: python benchmarks/bench_wifi_connect.py
+'''
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from bench_setup import simulate
+
+import simulator
+
+simulate(wifi=True)
+
+from connectivity import wifi_network
+from connectivity.wifi_network import CredentialStore, NetworkTable, WiFiManager
+from interface_modules import menu_interface, ui_loop
+from scheduler import Scheduler
+
+NETWORKS = 20
+CHANNEL_DELAY = 0.05
+CONNECT_DELAY = 0.4
+FAILED_CONNECTS = 2
+RETRY_BASE = 0.2
+CONNECT_TICK = 0.1
+CONNECT_TIMEOUT = wifi_network.CONNECT_TIMEOUT / 10
+KEY_INTERVAL = 0.05
+HOME = "HomeNet"
+
+
+def make_radio():
+    networks = [simulator.FakeNetwork("Net %d" % i, bytes([2, 0, 0, 0, 0, i]), -40 - i * 2, 1 + i % 11) for i in range(NETWORKS)]
+    networks.append(simulator.FakeNetwork(HOME, b"\x02\x00\x00\x00\x01\x00", -55, 6))
+    return simulator.FakeWiFiRadio(networks, {HOME: "hunter22"}, CHANNEL_DELAY, CONNECT_DELAY, FAILED_CONNECTS)
+
+
+def make_credentials(directory):
+    credentials = CredentialStore(os.path.join(directory, "wifi.json"))
+    credentials.remember(HOME, "hunter22", default=True)
+    return CredentialStore(credentials.path)
+
+
+def blocking_boot(directory):
+    """Scan everything, connect with retries, then show the menu; returns (menu ms, connected ms)."""
+    radio = make_radio()
+    start = time.perf_counter()
+    networks = radio.start_scanning_networks(start_channel=1, stop_channel=11)
+    radio.stop_scanning_networks()
+    timeout = CONNECT_TIMEOUT * 5   # the old 10 s timeout, scaled the same way
+    credentials = make_credentials(directory)
+    credentials.load()
+    delay = RETRY_BASE
+    while not radio.connected:
+        for network in sorted(networks, key=lambda n: -n.rssi):
+            password = credentials.get(network.ssid)
+            if password is not None:
+                try:
+                    radio.connect(network.ssid, password, timeout=timeout)
+                    break
+                except ConnectionError:
+                    pass
+        else:
+            time.sleep(delay)
+            delay *= 2
+    connected = time.perf_counter() - start
+    return connected * 1000, connected * 1000
+
+
+class RecordingLoop(ui_loop.UIEventLoop):
+    last = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        RecordingLoop.last = self
+
+
+async def manager_boot(directory):
+    radio = make_radio()
+    manager = WiFiManager(radio, credentials=make_credentials(directory))
+    scheduler = Scheduler()
+    start_ns = time.monotonic_ns()
+    source = ui_loop.QueueKeySource()
+    menu = asyncio.create_task(menu_interface.run_menu(["Option %d" % i for i in range(40)], source))
+    jobs = asyncio.create_task(scheduler.run())
+    manager.start(scheduler)
+    await asyncio.sleep(0)
+    stalls = []   # how late each key press came, i.e. how long the event loop was blocked
+    while not radio.connected:
+        source.feed("\x1b[B")
+        due = time.monotonic_ns() + int(KEY_INTERVAL * 1e9)
+        await asyncio.sleep(KEY_INTERVAL)
+        stalls.append((time.monotonic_ns() - due) / 1e6)
+    connected_ns = time.monotonic_ns()
+    source.feed("\n")
+    await menu
+    manager.stop()
+    jobs.cancel()
+    stats = RecordingLoop.last.stats
+    menu_ms = (stats.started_ns - start_ns) / 1e6
+    return menu_ms, (connected_ns - start_ns) / 1e6, stats.report(), max(stalls), manager
+
+
+async def menu_flow(directory):
+    """Pick the strongest network in the menu, type its password and save it as the boot default."""
+    radio = make_radio()
+    radio.passwords["Net 0"] = "pw"
+    radio.fail_connects = 0
+    manager = WiFiManager(radio, credentials=make_credentials(directory))
+    await manager.scan()
+    source = ui_loop.QueueKeySource()
+    for chunk in ("\n", "p", "w", "\n", "\n"):
+        source.feed(chunk)
+    ssid = await wifi_network.run_wifi_menu(manager, source)
+    manager.stop_scanning()
+    return ssid
+
+
+def check_table():
+    failures = []
+    clock = simulator.FakeClock()
+    table = NetworkTable(max_age=90, clock=clock.monotonic)
+    table.start_round()
+    for network in make_radio().networks:
+        table.observe(network)
+    table.observe(simulator.FakeNetwork(HOME, b"\x02\x00\x00\x00\x02\x00", -30, 11))  # a stronger AP of the same network
+    rssis = [record.rssi for record in table.by_signal()]
+    if rssis != sorted(rssis, reverse=True) or table.get(HOME).rssi != -30 or table.get(HOME).channel != 11:
+        failures.append("table is not sorted by signal or did not keep the strongest access point")
+    clock.now = 60
+    table.start_round()
+    table.observe(simulator.FakeNetwork("Net 0", bytes([2, 0, 0, 0, 0, 0]), -40, 1))
+    clock.now = 100
+    table.expire()
+    if len(table) != 1 or table.get("Net 0") is None:
+        failures.append("stale networks were not dropped (%d left)" % len(table))
+    return failures
+
+
+def main():
+    wifi_network.RETRY_BASE = RETRY_BASE
+    wifi_network.CONNECT_TIMEOUT = CONNECT_TIMEOUT
+    wifi_network.CONNECT_TICK = CONNECT_TICK
+    directory = tempfile.mkdtemp()
+    saved = ui_loop.UIEventLoop
+    ui_loop.UIEventLoop = RecordingLoop
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        blocking_menu, blocking_connected = blocking_boot(directory)
+        menu_ms, connected_ms, report, stall, manager = asyncio.run(manager_boot(directory))
+        picked = asyncio.run(menu_flow(directory))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+        ui_loop.UIEventLoop = saved
+    print(f"{NETWORKS + 1} networks, {CHANNEL_DELAY * 1000:.0f} ms per channel, {CONNECT_DELAY * 1000:.0f} ms per connect, "
+          f"first {FAILED_CONNECTS} connects fail")
+    print(f"blocking: menu after {blocking_menu:7.1f} ms, connected after {blocking_connected:7.1f} ms")
+    print(f"manager : menu after {menu_ms:7.1f} ms, connected after {connected_ms:7.1f} ms "
+          f"({manager.attempts} attempts, {manager.scans} scans)")
+    print(f"          {report['keys']} keys while connecting, key latency avg {report['key_latency_avg_ms']:.1f} ms, "
+          f"longest the UI loop was blocked {stall:.1f} ms")
+
+    failures = check_table()
+    if manager.ssid != HOME or manager.state != "connected":
+        failures.append("manager did not connect to the saved default network")
+    if menu_ms > 50:
+        failures.append("menu waited for Wi-Fi")
+    if stall > max(CONNECT_TIMEOUT, CONNECT_DELAY) * 1000 + 50:
+        failures.append("a key waited longer than one connect timeout")
+    reloaded = CredentialStore(os.path.join(directory, "wifi.json"))
+    if picked != "Net 0" or not reloaded.load() or reloaded.get("Net 0") != "pw" or reloaded.default != "Net 0" \
+            or reloaded.get(HOME) != "hunter22":
+        failures.append("the network picked in the menu was not connected and saved as the default")
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+'''suite.py - Benchmark suite for the whole controller on the simulator, with results saved as JSON.
+
+Each scenario runs in a fresh Python process against the simulator package (see simulator/__init__.py),
+so the modules a scenario imports and the state they keep do not leak into the next one:
+  - boot: runs code.py with the SD card in a temporary directory, closes the menu with Esc once the
+    background work is done, and reports the boot phases code.py recorded and the frames drawn
+  - menu: moves through a 60-option menu, filters it and closes it; time per key and per redraw from
+    the profiler, label writes per key
+  - backlight: steps the backlight screen up and down; time per key, label writes per key
+  - export: writes the command list of COMMANDS commands to the SD card cold (no file yet), warm
+    (unchanged) and after peers appended commands; time, writes and sectors programmed for each
+  - ble_typing: pastes text into the BLE keyboard in bursts, with HID reports taking REPORT_DELAY
+    seconds; characters per second and time per HID send
+Every scenario also checks that it ended in the right state (option selected, brightness reached, file
+contents, characters sent); a failed check is reported and makes the suite exit non-zero.
+
+Results are written as {"commit", "python", "results": {scenario: {metric: value}}} to --output,
+benchmarks/results/<commit>.json by default. With --compare, each metric is printed next to its value
+in an earlier results file, with the change in percent; --no-run compares an existing --output file
+instead of running the suite again.
+
+Usage: python benchmarks/suite.py [--scenario NAME ...] [--output FILE] [--compare BASE.json] [--no-run]
+'''
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_setup import ROOT, simulate
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+KEY_INTERVAL = 0.005
+COMMANDS = 200
+APPENDED = 20
+REPORT_DELAY = 0.0005
+PASTE = ("The quick brown fox jumps over the lazy dog. " * 10)[:400]
+BURST = 40
+
+
+def quiet():
+    """Send the device modules' prints to /dev/null; returns the real stdout."""
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    return real_stdout
+
+
+def restore(real_stdout):
+    sys.stdout.close()
+    sys.stdout = real_stdout
+
+
+def boot(display, failures):
+    import runpy
+    import simulator
+    simulator.install_sdcard(tempfile.mkdtemp())
+    from interface_modules import ui_loop
+    # Esc once the SD card work and the first status bar update had time to finish
+    keys = simulator.ScriptedKeySource(["\x1b"], interval=0.3, on_read=display.refresh)
+    ui_loop.StdinKeySource = keys
+    real_stdout = quiet()
+    try:
+        scope = runpy.run_path(os.path.join(ROOT, "code.py"))
+    finally:
+        restore(real_stdout)
+    display.refresh()
+    phases = dict(scope["boot_phases"])
+    for phase in ("imports", "registry", "menu drawn", "command list export"):
+        if phase not in phases:
+            failures.append("boot did not reach phase " + phase)
+    if not display.frames or not any("Sample Command" in row for row in display.frames[0][1]):
+        failures.append("the first frame does not show the command menu")
+    result = {"frames": len(display.frames)}
+    for phase, at in phases.items():
+        result[phase.replace(" ", "_") + "_ms"] = at
+    return result
+
+
+def menu(display, failures):
+    import simulator
+    from interface_modules import menu_interface
+    from profiler import get_profiler
+    options = ["Option %d" % i for i in range(60)]
+    # Down past the first page, back up, filter to the options containing 42, then select the match
+    script = ["s"] * 30 + ["w"] * 10 + ["/", "4", "2", "\n"]
+    keys = simulator.ScriptedKeySource(script, KEY_INTERVAL, display.refresh)
+    profiler = get_profiler()
+    profiler.reset()
+    profiler.enable()
+    mutations = simulator.FakeLabel.mutations
+    real_stdout = quiet()
+    try:
+        selected = asyncio.run(menu_interface.run_menu(options, keys))
+    finally:
+        restore(real_stdout)
+    profiler.enable(False)
+    mutations = simulator.FakeLabel.mutations - mutations
+    if selected != 42:
+        failures.append("the menu selected %s, expected option 42" % selected)
+    key = profiler.stats("menu.key")
+    redraw = profiler.stats("menu.redraw")
+    return {
+        "keys": len(script),
+        "key_avg_us": key["avg_us"],
+        "key_max_us": key["max_us"],
+        "redraws": redraw["calls"],
+        "redraw_avg_us": redraw["avg_us"],
+        "redraw_max_us": redraw["max_us"],
+        "label_writes_per_key": mutations / len(script),
+        "frames": len(display.frames),
+    }
+
+
+def backlight(display, failures):
+    import simulator
+    from backlight import backlight
+    display.brightness = 0.5
+    script = ["d"] * 15 + ["a"] * 5 + ["\n"]   # up to the top (clamped), then down a quarter
+    keys = simulator.ScriptedKeySource(script, 0, display.refresh)
+    mutations = simulator.FakeLabel.mutations
+    real_stdout = quiet()
+    try:
+        start = time.perf_counter_ns()
+        asyncio.run(backlight.run_backlight_menu(keys))
+        elapsed = time.perf_counter_ns() - start
+    finally:
+        restore(real_stdout)
+    mutations = simulator.FakeLabel.mutations - mutations
+    if abs(display.brightness - 0.75) > 1e-6:
+        failures.append("the backlight ended at %.2f, expected 0.75" % display.brightness)
+    slider = backlight.get_slider_str(display.brightness)
+    if not any(slider in row for row in display.refresh()):
+        failures.append("the backlight screen does not show the brightness it ended at")
+    return {
+        "keys": len(script),
+        "per_key_us": elapsed / len(script) / 1000,
+        "label_writes_per_key": mutations / len(script),
+        "frames": len(display.frames),
+    }
+
+
+def export(display, failures):
+    import simulator
+    import command_registry
+    from command_registry import Command, CommandTable, register_commands
+    directory = tempfile.mkdtemp()
+    card = simulator.install_sdcard(directory)
+    table = CommandTable()
+    register_commands([Command("Peer %d: Toggle relay %d" % (i, i), "Toggle relay channel %d" % i, print, [i])
+                       for i in range(COMMANDS)], table)
+    path = os.path.join(directory, "cardputer_commandlist.json")
+    result = {"commands": COMMANDS}
+
+    def run(step):
+        card.reset()
+        real_stdout = quiet()
+        try:
+            start = time.perf_counter_ns()
+            command_registry.write_commandlist_to_file("cardputer", table)
+            elapsed = time.perf_counter_ns() - start
+        finally:
+            restore(real_stdout)
+        result[step + "_ms"] = elapsed / 1e6
+        result[step + "_writes"] = card.writes
+        result[step + "_sectors"] = card.sectors
+        with open(path) as f:
+            if f.read() != command_registry.prepare_commandlist_for_ai(table):
+                failures.append("the command list on the card after the %s export is wrong" % step)
+
+    run("cold")
+    run("warm")
+    if result["warm_writes"]:
+        failures.append("exporting an unchanged command list wrote to the card")
+    register_commands([Command("Peer %d: Read sensor" % i, "Read sensor %d" % i, print, [i])
+                       for i in range(COMMANDS, COMMANDS + APPENDED)], table)
+    run("append")
+    return result
+
+
+def ble_typing(display, failures):
+    import simulator
+    simulator.install_ble()
+    from keyboard import ble_keyboard
+    from profiler import get_profiler
+    simulator.FakeHIDKeyboard.report_delay = REPORT_DELAY
+    bursts = [PASTE[i:i + BURST] for i in range(0, len(PASTE), BURST)]
+    keys = simulator.ScriptedKeySource(bursts, KEY_INTERVAL)
+    profiler = get_profiler()
+    profiler.reset()
+    profiler.enable()
+    hid = ble_keyboard.k
+    expected = hid.reports + 2 * len(PASTE)   # press and release per character
+
+    async def type_bursts():
+        keyboard = asyncio.create_task(ble_keyboard.main(keys))
+        start = time.perf_counter()
+        while hid.reports < expected and time.perf_counter() - start < 30:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        keyboard.cancel()
+        return elapsed
+
+    real_stdout = quiet()
+    try:
+        elapsed = asyncio.run(type_bursts())
+    finally:
+        restore(real_stdout)
+    profiler.enable(False)
+    if hid.reports != expected:
+        failures.append("the BLE keyboard sent %d of %d reports" % (hid.reports - expected + 2 * len(PASTE),
+                                                                     2 * len(PASTE)))
+    send = profiler.stats("hid.send")
+    return {
+        "chars": len(PASTE),
+        "chars_per_s": len(PASTE) / elapsed,
+        "hid_sends": send["calls"],
+        "hid_send_avg_us": send["avg_us"],
+        "report_delay_ms": REPORT_DELAY * 1000,
+    }
+
+
+SCENARIOS = {
+    "boot": boot,
+    "menu": menu,
+    "backlight": backlight,
+    "export": export,
+    "ble_typing": ble_typing,
+}
+
+
+def run_scenario(name):
+    """Run one scenario in this process and print {"result", "failures"} as JSON."""
+    display = simulate()
+    failures = []
+    result = SCENARIOS[name](display, failures)
+    print(json.dumps({"result": result, "failures": failures}))
+
+
+def commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True)
+    except OSError:
+        return "unknown"
+    if out.returncode:
+        return "unknown"
+    return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+
+
+def run_suite(names):
+    """Run each scenario in its own process; returns (results, failures)."""
+    results = {}
+    failures = []
+    for name in names:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-scenario", name],
+                                 capture_output=True, text=True, timeout=300)
+        if process.returncode:
+            failures.append("%s: exited with %d\n%s" % (name, process.returncode, process.stderr.strip()))
+            continue
+        output = json.loads(process.stdout.strip().splitlines()[-1])
+        results[name] = output["result"]
+        failures += ["%s: %s" % (name, failure) for failure in output["failures"]]
+    return results, failures
+
+
+def print_results(results):
+    for name, metrics in results.items():
+        print(name)
+        for metric, value in metrics.items():
+            print(f"  {metric:28s} {value:12.3f}" if isinstance(value, float) else f"  {metric:28s} {value:12}")
+
+
+def compare(base, results):
+    """Print every metric next to its value in base, with the change in percent."""
+    base_results = base["results"]
+    print(f"{'':34s} {base['commit']:>12s} {'now':>12s} {'change':>8s}")
+    for name, metrics in results.items():
+        print(name)
+        for metric, value in metrics.items():
+            old = base_results.get(name, {}).get(metric)
+            if old is None:
+                print(f"  {metric:32s} {'-':>12s} {value:12.3f}")
+            elif old:
+                print(f"  {metric:32s} {old:12.3f} {value:12.3f} {(value - old) / old * 100:+7.1f}%")
+            else:
+                print(f"  {metric:32s} {old:12.3f} {value:12.3f} {'':>8s}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the controller benchmarks on the simulator.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="run only this scenario (repeatable)")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", metavar="BASE", help="results file of an earlier run to compare with")
+    parser.add_argument("--no-run", action="store_true", help="compare the existing --output file, do not run")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)   # how run_suite() starts each scenario
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        run_scenario(args.run_scenario)
+        return
+
+    if args.no_run:
+        if not args.output or not args.compare:
+            parser.error("--no-run needs --output and --compare")
+        with open(args.output) as f:
+            current = json.load(f)
+        with open(args.compare) as f:
+            compare(json.load(f), current["results"])
+        return
+
+    results, failures = run_suite(args.scenario or list(SCENARIOS))
+    current = {"commit": commit(), "python": platform.python_version(), "time": int(time.time()),
+               "results": results}
+    output = args.output or os.path.join(RESULTS_DIR, current["commit"] + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(current, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    else:
+        print_results(results)
+    print(f"results written to {output}")
+    for failure in failures:
+        print("FAIL: " + failure)
+    if failures:
+        sys.exit(1)
+    print("checks OK")
+
+
+if __name__ == "__main__":
+    main()
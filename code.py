@@ -1,30 +1,29 @@
+import time
+boot_start = time.monotonic_ns()
+import asyncio
 from interface_modules import menu_interface
 import command_registry as command_registry
-from battery.battery import get_battery_voltage
-
-def mount_sdcard():
-    """Mount the SD card using SPI and mount it at '/sd'."""
-    import digitalio
-    import board
-    import adafruit_sdcard
-    import storage
-    import os
-    cs = digitalio.DigitalInOut(board.SD_CS)
-    spi = board.SD_SPI()
-    sdcard = adafruit_sdcard.SDCard(spi, cs)
-    print("SD Card mounted")
-    try:
-        vfs = storage.VfsFat(sdcard)
-        storage.mount(vfs, "/sd", readonly=False)
-        print("SD Card mounted at /sd")
-        print(os.listdir("/sd"))
-        return sdcard
-    except Exception as e:
-        print(f"Error mounting SD Card: {e}")
-sdcard = mount_sdcard()
+from interface_modules.status_bar import get_status_bar
+from scheduler import get_scheduler
+from sd_storage import get_storage, TICK_INTERVAL
+from profiler import get_profiler, profile_report_command
+
+# (phase, milliseconds since boot) in the order the phases finished; see boot_report()
+boot_phases = []
 
+def mark_phase(phase):
+    boot_phases.append((phase, (time.monotonic_ns() - boot_start) / 1e6))
 
+def boot_report():
+    """Print how long each boot phase took and when it finished."""
+    previous = 0
+    for phase, at in boot_phases:
+        print(f"{phase:28s} {at - previous:8.1f} ms  (at {at:8.1f} ms)")
+        previous = at
 
+mark_phase("imports")
+# Count time and heap per profiled section (menu, commands, SD writes, HID sends); see the Profiler command
+get_profiler().enable()
 
 def display_command_menu(commands):
     return menu_interface.display_command_menu(commands)
@@ -35,25 +34,110 @@ def sample_action():
 def sample_action2(param1, param2):
     print(f"Sample action 2 executed with {param1} and {param2}")
 
-# Register commands into the command registry
-device_name = "cardputer"
-registry = command_registry.get_registry(device_name)
-command_registry.register_command(command_registry.Command("Sample Command: Do something", "Executes a sample action", sample_action), registry)
-command_registry.register_command(command_registry.Command("Battery Voltage: Get battery voltage", "Get the current battery voltage as a percentage", get_battery_voltage), registry)
-# Retrieve all commands
-commands = registry
-
-# Write the command list to a file (for AI function calling or other uses)
-device_name = "cardputer"
-#mount_sdcard()
-command_registry.write_commandlist_to_file(device_name, commands, registry)
-print(f"Command list written to {device_name}_commandlist.json")
-
-# Read back the command list from the file (demonstration purpose)
-commandlist_from_file = registry
-print("Command list loaded from file:", commandlist_from_file)
-
-# Display the list of commands using the menu interface and execute the selected command
-selected_command = display_command_menu(commands)
-print("Executing selected command...")
-selected_command.execute()
\ No newline at end of file
+def battery_voltage():
+    # Imported on first use: battery.battery sets up the ADC when it is imported
+    from battery.battery import get_battery_voltage
+    return get_battery_voltage()
+
+async def export_commandlist(device_name, commands):
+    """Mount the SD card, add the peers' commands and write the command list in the background while the menu is already usable.
+
+    Each step is blocking SPI work, so the task yields between steps to let the menu handle keys.
+    """
+    import os
+    await asyncio.sleep(0)
+    mounted = get_storage().mount()
+    mark_phase("sd mount")
+    await asyncio.sleep(0)
+    if not mounted:
+        return
+    print(os.listdir(command_registry.SD_ROOT))
+    mark_phase("sd listing")
+    await asyncio.sleep(0)
+    # Commands of peer gadgets, from their config files on the card; only changed files are parsed
+    from connectivity.peer_config import register_peer_commands
+    register_peer_commands(commands)
+    mark_phase("peer commands")
+    await asyncio.sleep(0)
+    # Write the command list to a file (for AI function calling or other uses)
+    command_registry.write_commandlist_to_file(device_name, commands)
+    print(f"Command list written to {device_name}_commandlist.json")
+    mark_phase("command list export")
+
+async def battery_telemetry():
+    """Sample the battery in the background; its history is logged to the SD card once that is mounted."""
+    from battery.battery import telemetry
+    telemetry.log_path = f"{command_registry.SD_ROOT}/battery.log"
+    # Below LOW_BATTERY percent the storage service writes every log record through
+    get_storage().battery = lambda: telemetry.percent
+    await telemetry.run()
+
+def wifi_connect(scheduler):
+    """Scan and connect to a saved Wi-Fi network in the background; the menu stays usable meanwhile.
+
+    Returns the WiFiManager, or None on a board without Wi-Fi.
+    """
+    try:
+        from connectivity.wifi_network import get_wifi_manager
+        manager = get_wifi_manager()
+    except ImportError:
+        return None
+    manager.start(scheduler)
+    return manager
+
+async def main():
+    # Register commands into the command registry
+    device_name = "cardputer"
+    registry = command_registry.CommandTable()
+    command_registry.register_command(command_registry.Command("Sample Command: Do something", "Executes a sample action", sample_action), registry)
+    command_registry.register_command(command_registry.Command("Battery Voltage: Get battery voltage", "Get the current battery voltage as a percentage", battery_voltage), registry)
+    from connectivity.connection_logger import connection_log_command
+    command_registry.register_command(connection_log_command(), registry)
+    command_registry.register_command(profile_report_command(), registry)
+    # Retrieve all commands
+    commands = registry
+    mark_phase("registry")
+
+    # Draw the menu from the in-memory registry straight away; the menu task draws before its first await
+    menu = asyncio.create_task(menu_interface.run_command_menu(commands))
+    await asyncio.sleep(0)
+    mark_phase("menu drawn")
+
+    # SD card mount, listing and export run while the menu is up
+    export = asyncio.create_task(export_commandlist(device_name, commands))
+    battery = asyncio.create_task(battery_telemetry())
+    status = asyncio.create_task(get_status_bar().run())
+
+    scheduler = get_scheduler()
+    jobs = asyncio.create_task(scheduler.run())
+    # Connect attempts run one per scheduler tick, between the menu's key polls
+    wifi = wifi_connect(scheduler)
+    # Writes buffered for the SD card go out once they are FLUSH_AGE seconds old
+    scheduler.every(TICK_INTERVAL, "SD card flush", get_storage().tick)
+
+    # Selected commands run as scheduler jobs (once, in the background or periodically) and the menu
+    # comes back straight away, until it is closed with Esc
+    selected_command = await menu
+    await export
+    boot_report()
+    while selected_command is not None:
+        if scheduler.find(selected_command.name) is not None:
+            print(f"{selected_command.name} is already running")
+        else:
+            print(f"Scheduling {selected_command.name} ({selected_command.mode})")
+            scheduler.submit(selected_command)
+        selected_command = await menu_interface.run_command_menu(commands)
+    scheduler.print_report()
+    scheduler.cancel_all()
+    jobs.cancel()
+    status.cancel()
+    if wifi is not None:
+        wifi.stop()
+    battery.cancel()
+    try:
+        await battery  # lets it log the samples taken since its last flush
+    except asyncio.CancelledError:
+        pass
+    get_storage().close()
+
+asyncio.run(main())
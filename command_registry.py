@@ -4,39 +4,27 @@ This module provides a global command registry used to register and manage comma
 Each command is defined by a name, description, and a callback function to execute.
 Eventually this will be used to register commands from other modules for the AI to use via function calling.
 """
+import binascii
 import json
 import os
-import storage
-import board
-import adafruit_sdcard
-
-
-
-def mount_sdcard():
-    """Mount the SD card using SPI and mount it at '/sd'."""
-    import digitalio
-    import board
-    import adafruit_sdcard
-    import storage
-    import os
-    cs = digitalio.DigitalInOut(board.SD_CS)
-    spi = board.SD_SPI()
-    sdcard = adafruit_sdcard.SDCard(spi, cs)
-    print("SD Card mounted")
-    try:
-        vfs = storage.VfsFat(sdcard)
-        storage.mount(vfs, "/sd", readonly=False)
-        print("SD Card mounted at /sd")
+import struct
 
-        print(os.listdir("/sd"))
-        return sdcard
-    except Exception as e:
-        print(f"Error mounting SD Card: {e}")
-    
+from interface_modules.option_search import SearchIndex
+from profiler import section
+from sd_storage import SD_ROOT, SECTOR_SIZE as SD_BLOCK_SIZE, get_storage, mount_sdcard
+
+# How a command runs when selected (see scheduler.py)
+ONE_SHOT = "one-shot"        # run once
+BACKGROUND = "background"    # the callback returns a coroutine that keeps running as a task
+PERIODIC = "periodic"        # run every `period` seconds
+
+_EXECUTE = section("command.execute")
 
 
 class Command:
-    def __init__(self, name, description, callback, args=None, kwargs=None):
+    __slots__ = ("name", "description", "callback", "args", "kwargs", "mode", "period", "_schema")
+
+    def __init__(self, name, description, callback, args=None, kwargs=None, mode=ONE_SHOT, period=None):
         """
         Initialize a Command.
         name: The display name or text of the command.
@@ -44,108 +32,612 @@ class Command:
         callback: A function to call when the command is executed.
         args: A list of arguments to pass to the callback function.
         kwargs: A dictionary of keyword arguments to pass to the callback function.
+        mode: ONE_SHOT, BACKGROUND or PERIODIC; how the scheduler runs the command.
+        period: Seconds between runs of a PERIODIC command.
         """
         self.name = name
         self.description = description
         self.callback = callback
         self.args = args
         self.kwargs = kwargs
+        self.mode = mode
+        self.period = period
+        self._schema = None  # cached JSON tool entry, see schema_json()
+
+    def schema_json(self):
+        """Return this command's entry in the OpenAI tools list as a JSON string, cached until its arguments change."""
+        if self._schema is None:
+            self._schema = json.dumps(command_schema(self))
+        return self._schema
+
+    def schema_fragment(self):
+        """Return the JSON tool entry as bytes for writing to a file, filling the cache like schema_json()."""
+        return self.schema_json().encode()
+
+    def invalidate_schema(self):
+        self._schema = None
+
+    def execute(self):
+        """Run the callback and return its result; for a peer command that is a coroutine to await."""
+        with _EXECUTE:
+            return self.callback(*self.args if self.args else [], **self.kwargs if self.kwargs else {})
+
+
+class CommandView:
+    """A command stored in a CommandTable, read and written through the table's columns.
+
+    Behaves like a Command (same attributes, execute, schema_json); views are created on access and hold
+    nothing but the table and the row number.
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    @property
+    def name(self):
+        return self.table.names[self.index]
+
+    @property
+    def description(self):
+        return self.table.descriptions[self.index]
+
+    @property
+    def callback(self):
+        return self.table.callbacks[self.index]
+
+    @property
+    def args(self):
+        return self.table.args[self.index]
+
+    @args.setter
+    def args(self, args):
+        self.table.args[self.index] = args
+
+    @property
+    def kwargs(self):
+        return self.table.kwargs[self.index]
+
+    @kwargs.setter
+    def kwargs(self, kwargs):
+        self.table.kwargs[self.index] = kwargs
+
+    @property
+    def mode(self):
+        schedule = self.table.schedules[self.index]
+        return ONE_SHOT if schedule is None else schedule[0]
+
+    @property
+    def period(self):
+        schedule = self.table.schedules[self.index]
+        return None if schedule is None else schedule[1]
+
+    def schema_json(self):
+        schemas = self.table.schemas
+        if schemas[self.index] is None:
+            schemas[self.index] = json.dumps(command_schema(self))
+        return schemas[self.index]
+
+    def schema_fragment(self):
+        return self.schema_json().encode()
+
+    def invalidate_schema(self):
+        self.table.schemas[self.index] = None
 
     def execute(self):
-        self.callback(*self.args if self.args else [], **self.kwargs if self.kwargs else {})
+        args = self.args
+        kwargs = self.kwargs
+        with _EXECUTE:
+            return self.callback(*args if args else [], **kwargs if kwargs else {})
+
+
+class CommandTable:
+    """Command registry stored as parallel arrays of names, descriptions, callbacks and arguments.
+
+    Used in place of a dict of Command objects: register_command(command, table) copies the command into
+    the columns, and table[name] or table[i] returns a CommandView. Descriptions are interned, so commands
+    from many peers sharing the same description keep a single copy of it. The names list can
+    be handed to the menu directly; treat it as read-only. The SearchIndex for the menu's type-to-filter is
+    built over the names list on the first filter query and then kept, catching up with commands
+    registered since; a table that is never filtered pays nothing for it.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.descriptions = []
+        self.callbacks = []
+        self.args = []
+        self.kwargs = []
+        self.schemas = []
+        self.schedules = []   # None for one-shot commands, else (mode, period)
+        self._positions = {}  # name -> row
+        self._strings = {}    # intern table for descriptions
+        self._search = None   # SearchIndex over names, built by search_index()
+
+    def search_index(self):
+        """Return the SearchIndex of the command names, building it on first use or after commands were removed."""
+        if self._search is None:
+            self._search = SearchIndex(self.names)
+        else:
+            self._search.update()
+        return self._search
+
+    def intern(self, text):
+        return self._strings.setdefault(text, text)
+
+    def __setitem__(self, name, command):
+        row = self._positions.get(name)
+        if row is None:
+            row = len(self.names)
+            self._positions[name] = row
+            self.names.append(name)
+            for column in (self.descriptions, self.callbacks, self.args, self.kwargs, self.schemas, self.schedules):
+                column.append(None)
+        self.descriptions[row] = self.intern(command.description)
+        self.callbacks[row] = command.callback
+        self.args[row] = command.args
+        self.kwargs[row] = command.kwargs
+        self.schemas[row] = None
+        self.schedules[row] = _schedule(command)
+
+    def extend(self, commands):
+        """Register many commands at once: new ones are appended column by column instead of row by row."""
+        new = []
+        first_new = len(self.names)
+        for command in commands:
+            row = self._positions.get(command.name)
+            if row is None:
+                self._positions[command.name] = first_new + len(new)
+                new.append(command)
+            elif row >= first_new:
+                new[row - first_new] = command
+            else:
+                self[command.name] = command
+        if not new:
+            return
+        self.names.extend(c.name for c in new)
+        self.descriptions.extend(self.intern(c.description) for c in new)
+        self.callbacks.extend(c.callback for c in new)
+        self.args.extend(c.args for c in new)
+        self.kwargs.extend(c.kwargs for c in new)
+        self.schemas.extend([None] * len(new))
+        self.schedules.extend(_schedule(c) for c in new)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._positions[key]
+        elif key < 0:
+            key += len(self.names)
+        if not 0 <= key < len(self.names):
+            raise IndexError("command index out of range")
+        return CommandView(self, key)
+
+    def __delitem__(self, name):
+        row = self._positions.pop(name)
+        for column in (self.names, self.descriptions, self.callbacks, self.args, self.kwargs, self.schemas, self.schedules):
+            column.pop(row)
+        # Rows after the removed one move up; existing views of them are no longer valid
+        for i in range(row, len(self.names)):
+            self._positions[self.names[i]] = i
+        self._search = None  # option numbers shifted; rebuilt on next use
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        for i in range(len(self.names)):
+            yield CommandView(self, i)
+
+    def values(self):
+        return iter(self)
+
+    def clear(self):
+        for column in (self.names, self.descriptions, self.callbacks, self.args, self.kwargs, self.schemas, self.schedules):
+            column.clear()
+        self._positions.clear()
+        self._strings.clear()
+        self._search = None
+
+
+def _schedule(command):
+    mode = getattr(command, "mode", ONE_SHOT)
+    return None if mode == ONE_SHOT else (mode, command.period)
+
+
+def _commandlist_paths(device_name):
+    return f"{SD_ROOT}/{device_name}_commandlist.json", f"{SD_ROOT}/{device_name}_commandlist.idx"
+
+
+class ChunkWriter:
+    """Buffers writes to a binary file and hands them on in whole blocks of the SD card's block size."""
+
+    def __init__(self, f, block_size=SD_BLOCK_SIZE):
+        self.f = f
+        self.buffer = bytearray(block_size)
+        self.used = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        view = memoryview(data)
+        size = len(self.buffer)
+        while view:
+            n = min(size - self.used, len(view))
+            self.buffer[self.used:self.used + n] = view[:n]
+            self.used += n
+            view = view[n:]
+            if self.used == size:
+                self.f.write(self.buffer)
+                self.used = 0
+
+    def flush(self):
+        if self.used:
+            self.f.write(memoryview(self.buffer)[:self.used])
+            self.used = 0
+
+
+# Command list index: a header, one fixed-size record per command, then all names back to back.
+# Records give each command's CRC and the position of its body in the .json file and of its name in the
+# name blob, so a page of names or a single command can be read without loading the rest.
+_INDEX_MAGIC = b"CRX1"
+_INDEX_HEADER = "<4sII"    # magic, content hash, command count
+_INDEX_RECORD = "<IIIIH"   # body crc, body offset, body length, name offset, name length
+_INDEX_HEADER_SIZE = struct.calcsize(_INDEX_HEADER)
+_INDEX_RECORD_SIZE = struct.calcsize(_INDEX_RECORD)
+
+
+def _read_index_header(f):
+    """Return (content_hash, count) from an open index file, or None if it is not a valid index."""
+    data = f.read(_INDEX_HEADER_SIZE)
+    if len(data) != _INDEX_HEADER_SIZE:
+        return None
+    magic, content_hash, count = struct.unpack(_INDEX_HEADER, data)
+    if magic != _INDEX_MAGIC:
+        return None
+    return content_hash, count
+
+
+def stream_commandlist(f, commands, first=0, offset=None, index=None, content_hash=0, count=0):
+    """Write the command list to the binary file handle f one entry at a time, in SD-block-sized chunks.
+
+    The output is byte-identical to prepare_commandlist_for_ai. Entries come from the per-command schema
+    cache and are written one at a time, so on top of that cache the write needs one entry's bytes plus
+    the block buffers, whatever the size of the registry.
+    With first > 0, the file is assumed to already hold entries before it, and writing starts at offset (the
+    end of entry first - 1), so the caller can rewrite just the tail of an existing file.
+    index: Optional binary file handle; the index for the whole list (see CommandIndex) is written to it in
+    the same pass, with content_hash and count in its header.
+    """
+    out = ChunkWriter(f)
+    records = ChunkWriter(index) if index is not None else None
+    if records is not None:
+        records.write(struct.pack(_INDEX_HEADER, _INDEX_MAGIC, content_hash, count))
+    if first == 0:
+        out.write(_TOOLS_HEADER)
+    else:
+        f.seek(offset)
+    start = len(_TOOLS_HEADER)
+    name_offset = 0
+    for i, command in enumerate(_iter_commands(commands)):
+        if i < first and records is None:
+            continue
+        fragment = command.schema_fragment()
+        if i >= first:
+            if i:
+                out.write(_TOOLS_SEPARATOR)
+            out.write(fragment)
+        if records is not None:
+            name_length = len(command.name.encode())
+            records.write(struct.pack(_INDEX_RECORD, binascii.crc32(fragment), start, len(fragment), name_offset, name_length))
+            start += len(fragment) + len(_TOOLS_SEPARATOR)
+            name_offset += name_length
+    out.write(_TOOLS_FOOTER)
+    out.flush()
+    if records is not None:
+        for command in _iter_commands(commands):
+            records.write(command.name)
+        records.flush()
 
 
 def write_commandlist_to_file(device_name, commands):
-    """Write a commandlist to a file on the SD card."""
+    """Write a commandlist to a file on the SD card.
+
+    An index next to the file (see CommandIndex) records a CRC, offset and length for every entry plus a hash
+    of the whole list. If the hash matches, the SD card is not touched at all; otherwise only the entries from the first
+    changed one onwards are rewritten in place, which covers the common case of peers appending commands;
+    the index is deleted before that and written again afterwards, so an interrupted rewrite is never
+    trusted. A full rewrite and the index go through the storage service's atomic replace, so a crash leaves the old
+    or the new version. Both files are streamed from the per-command schema cache, so an entry is only
+    serialized again after add_command_args/add_keyword_args changed it, and the write itself needs no
+    memory in proportion to the number of commands.
+    commands may be a registry dict or any iterable of Commands that can be traversed twice.
+    """
     try:
-        filepath = f"/sd/{device_name}_commandlist.json"
-        if not (filepath) in os.listdir("/sd"):
-            with open(filepath, "w") as f:
-                f.write(prepare_commandlist_for_ai(commands))
+        filepath, index_path = _commandlist_paths(device_name)
+        storage = get_storage()
+        storage.recover(filepath)
+        storage.recover(index_path)
+        try:
+            old_size = os.stat(filepath)[6]
+            index = open(index_path, "rb")
+        except OSError:
+            old_size = None
+            index = None
+
+        # First pass: hash the new list and find the first entry that differs from the index
+        content_hash = 0
+        first = None
+        end = len(_TOOLS_HEADER)  # end of the previous entry
+        first_end = end
+        count = 0
+        old_hash = None
+        try:
+            header = _read_index_header(index) if index else None
+            if header:
+                old_hash, old_count = header
+            for command in _iter_commands(commands):
+                fragment = command.schema_fragment()
+                content_hash = binascii.crc32(fragment, content_hash)
+                start = end + len(_TOOLS_SEPARATOR) if count else end
+                if first is None:
+                    if old_hash is None or count >= old_count or \
+                            struct.unpack(_INDEX_RECORD, index.read(_INDEX_RECORD_SIZE))[:3] != (binascii.crc32(fragment), start, len(fragment)):
+                        first = count
+                        first_end = end
+                end = start + len(fragment)
+                count += 1
+            if first is None:
+                if old_hash == content_hash and old_count == count:
+                    return
+                first = count
+                first_end = end
+        finally:
+            if index:
+                index.close()
+        new_size = end + len(_TOOLS_FOOTER)
+
+        # Second pass: rewrite the tail of the command list (or all of it) and the index
+        rewrite = old_hash is None or first == 0
+        with storage.replace(index_path) as index:
+            if not rewrite:
+                # The old index still matches the untouched prefix of the file, so if a crash cut the
+                # in-place rewrite short it would vouch for a half-written file. Remove it first: with
+                # no index the next write replaces the whole file.
+                os.remove(index_path)
+                with open(filepath, "r+b") as f:
+                    if new_size < old_size and not hasattr(f, "truncate"):
+                        rewrite = True  # cannot shrink the file in place
+                    else:
+                        stream_commandlist(f, commands, first, first_end, index, content_hash, count)
+                        if new_size < old_size:
+                            f.truncate()
+            if rewrite:
+                with storage.replace(filepath) as f:
+                    stream_commandlist(f, commands, index=index, content_hash=content_hash, count=count)
     except Exception as e:
         print(f"Error writing commandlist to file: {e}")
 
 
-def get_registry(device_name):
-    """Read a commandlist from a file on the SD card."""
-    filepath = f"/sd/{device_name}_commandlist.json"
-    if not (filepath) in os.listdir("/sd"):
+class CommandNames:
+    """Read-only sequence of command names from a CommandIndex, loaded a page at a time."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return self.index.name(i)
+
+    def __iter__(self):
+        for i in range(len(self.index)):
+            yield self.index.name(i)
+
+
+class CommandIndex:
+    """Lazy view of a command list stored on the SD card.
+
+    Only the index header is read up front. Names are read a page of records at a time when the menu asks
+    for them, and a command's full schema is read from the .json file only when it is selected or exported.
+    The index is read-only: indexing it returns the live Command from local_commands, or None for entries
+    that have no callback on this device.
+    local_commands: Optional registry (dict or CommandTable) holding the commands that can be run.
+    """
+
+    page_size = 8
+
+    def __init__(self, device_name, local_commands=None):
+        self.filepath, self.index_path = _commandlist_paths(device_name)
+        self.local_commands = local_commands
+        with open(self.index_path, "rb") as f:
+            header = _read_index_header(f)
+        if header is None:
+            raise ValueError(f"Not a command index: {self.index_path}")
+        self.content_hash, self.count = header
+        self.names = CommandNames(self)
+        self._page_start = -1
+        self._page_records = []
+        self._page_names = []
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.command(i)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.command(i)
+
+    def _load_page(self, i):
+        start = i - i % self.page_size
+        if start == self._page_start:
+            return
+        count = min(self.page_size, self.count - start)
+        with open(self.index_path, "rb") as f:
+            f.seek(_INDEX_HEADER_SIZE + start * _INDEX_RECORD_SIZE)
+            data = f.read(count * _INDEX_RECORD_SIZE)
+            records = [struct.unpack_from(_INDEX_RECORD, data, n * _INDEX_RECORD_SIZE) for n in range(count)]
+            # Names are stored in order, so the whole page of names is one contiguous read
+            names_start = records[0][3]
+            f.seek(_INDEX_HEADER_SIZE + self.count * _INDEX_RECORD_SIZE + names_start)
+            names = f.read(records[-1][3] + records[-1][4] - names_start)
+        self._page_records = records
+        self._page_names = [names[r[3] - names_start:r[3] - names_start + r[4]].decode() for r in records]
+        self._page_start = start
+
+    def _check(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("command index out of range")
+        self._load_page(i)
+        return i - self._page_start
+
+    def name(self, i):
+        n = self._check(i)
+        return self._page_names[n]
+
+    def schema_json(self, i):
+        """Return the stored JSON tool entry of command i, read straight from the command list file."""
+        n = self._check(i)
+        record = self._page_records[n]
+        with open(self.filepath, "rb") as f:
+            f.seek(record[1])
+            return f.read(record[2]).decode()
+
+    def command(self, i):
+        """Return command i from the local registry, which holds its callback, or None if it is not there.
+
+        The file only stores schemas, so a command registered by another device or an earlier boot cannot be
+        run from it; its entry can still be read with name(i) and schema_json(i).
+        """
+        name = self.name(i)
+        if self.local_commands and name in self.local_commands:
+            return self.local_commands[name]
+        return None
+
+
+def get_registry(device_name, local_commands=None):
+    """Open the commandlist stored on the SD card as a lazily loaded CommandIndex, or return None if there is none."""
+    try:
+        return CommandIndex(device_name, local_commands)
+    except (OSError, ValueError):
         return None
-    with open(filepath, "r") as f:
-        command_registry = json.load(f)
-    return command_registry
     
 
 def register_command(command, command_registry):
-    """Register a new command into the global registry."""
+    """Register a new command into the global registry (a CommandTable, or a plain dict of name -> Command)."""
     command_registry[command.name] = command
 
 
+def register_commands(commands, command_registry):
+    """Register a batch of commands, in one pass over the registry's columns when it is a CommandTable."""
+    if hasattr(command_registry, "extend"):
+        command_registry.extend(commands)
+    else:
+        for command in commands:
+            command_registry[command.name] = command
+
+
 def get_commands(device_name):
-    """Return the list of registered commands."""
+    """Return the registered commands as a sequence; commands are only read from the SD card when accessed.
+
+    Items are None unless passed through get_registry with local_commands; see CommandIndex.
+    """
     command_registry = get_registry(device_name)
-    return list(command_registry.values())
+    return command_registry if command_registry is not None else []
 
 
 def clear_commands(device_name):
     """Clear the registered commands."""
-    command_registry = get_registry(device_name)
-    command_registry.clear()
-    write_commandlist_to_file(device_name, command_registry)
+    write_commandlist_to_file(device_name, [])
 
 def add_command_args(command, args):
     """Add arguments to a command."""
     command.args = args
+    command.invalidate_schema()
 
 
 def add_keyword_args(command, kwargs):
     """Add keyword arguments to a command."""
     command.kwargs = kwargs
+    command.invalidate_schema()
 
 
-def prepare_commandlist_for_ai(commands):
-    """Format a list of commands for AI function calling in OpenAI tools format."""
-    tools = []
-    
-    for command in commands:
-        parameters = {}
-        if command.args:
-            parameters["type"] = "object"
-            parameters["properties"] = {}
-            for i, arg in enumerate(command.args):
-                parameters["properties"][f"arg{i}"] = {
-                    "type": "string",
-                    "description": f"Argument {i} for {command.name}"
-                }
-            parameters["required"] = [f"arg{i}" for i in range(len(command.args))]
-        elif command.kwargs:
-            parameters["type"] = "object"
-            parameters["properties"] = {
-                k: {
-                    "type": "string",
-                    "description": f"Keyword argument {k} for {command.name}"
-                } for k in command.kwargs
-            }
-            parameters["required"] = list(command.kwargs.keys())
-        else:
-            parameters = {
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        
-        parameters["additionalProperties"] = False
-
-        tools.append({
-            "type": "function",
-            "function": {
-                "name": command.name,
-                "description": command.description,
-                "parameters": parameters,
-                "strict": True
+def _iter_commands(commands):
+    """Accept either a registry dict (name -> Command) or any iterable of Commands."""
+    if hasattr(commands, "values"):
+        return commands.values()
+    return commands
+
+
+def command_schema(command):
+    """Return the OpenAI tools entry for a single command as a dict."""
+    parameters = {}
+    if command.args:
+        parameters["type"] = "object"
+        parameters["properties"] = {}
+        for i, arg in enumerate(command.args):
+            parameters["properties"][f"arg{i}"] = {
+                "type": "string",
+                "description": f"Argument {i} for {command.name}"
             }
-        })
+        parameters["required"] = [f"arg{i}" for i in range(len(command.args))]
+    elif command.kwargs:
+        parameters["type"] = "object"
+        parameters["properties"] = {
+            k: {
+                "type": "string",
+                "description": f"Keyword argument {k} for {command.name}"
+            } for k in command.kwargs
+        }
+        parameters["required"] = list(command.kwargs.keys())
+    elif getattr(command.callback, "params", None):
+        # Peer commands take their values at call time; only the names come from the signature.
+        parameters["type"] = "object"
+        parameters["properties"] = {
+            name: {
+                "type": "string",
+                "description": f"Argument {name} for {command.name}"
+            } for name in command.callback.params
+        }
+        parameters["required"] = list(command.callback.params)
+    else:
+        parameters = {
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
     
-    return json.dumps({"tools": tools})
+    parameters["additionalProperties"] = False
+
+    return {
+        "type": "function",
+        "function": {
+            "name": command.name,
+            "description": command.description,
+            "parameters": parameters,
+            "strict": True
+        }
+    }
+
 
+# The command list is {"tools": [entry, entry, ...]} exactly as json.dumps would write it
+_TOOLS_HEADER = '{"tools": ['
+_TOOLS_SEPARATOR = ", "
+_TOOLS_FOOTER = "]}"
+
+
+def prepare_commandlist_for_ai(commands):
+    """Format a list of commands for AI function calling in OpenAI tools format.
 
+    Each command's entry is serialized once and cached on the Command, so repeated calls only join strings.
+    """
+    return _TOOLS_HEADER + _TOOLS_SEPARATOR.join(command.schema_json() for command in _iter_commands(commands)) + _TOOLS_FOOTER
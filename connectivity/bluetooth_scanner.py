@@ -1,13 +1,355 @@
-'''bluetooth_scanner.py - Stub for Bluetooth deep scanning functionality.
+'''bluetooth_scanner.py - Streaming Bluetooth LE scanner that logs nearby devices to the SD card.
 
-This module scans for all nearby Bluetooth devices, capturing device MAC addresses and available services/properties.
-The results are intended to be saved to the SD card in a designated logging format.
+Advertisements flow through three stages:
+  - scan_radio() reads advertisements in short scan windows and puts one entry per advertisement on an
+    AdvertisementQueue, which drops the oldest entry if the consumer falls behind
+  - BLEScanner folds each entry into a DeviceTable keyed by MAC, which keeps the last-seen time and
+    RSSI statistics of every device and evicts the least recently seen one when it is full
+  - ScanLog collects a JSON line for each new or changed device (and a summary line when a device is
+    evicted or the scan ends) and hands them to the storage service (sd_storage) in batches
+Service discovery (connecting and listing the GATT services and characteristics) is slow and costs
+power, so it only runs for devices that are new or whose advertised name or services changed. A connect
+blocks until the device answers or times out, so those devices are queued and connected to one at a time
+between scan windows and after the scan, never from the consumer; the results are logged as "details" lines.
+
+An entry is a tuple (time, mac, rssi, name, services, connectable, address): time.monotonic() when it
+was received, the MAC as "aa:bb:..", the advertised name and service UUIDs, and the radio's address
+object (None when replaying). Passing record= to scan_radio() writes each entry as a JSON list per
+line, which is the fixture format benchmarks/bench_ble_scanner.py replays.
 '''
 
-def scan_bluetooth_devices():
-    # TODO: Implement scanning of Bluetooth devices to capture MAC addresses, services, and properties.
-    pass
+import json
+import time
+from collections import OrderedDict
+
+from sd_storage import get_storage
+
+NEW = 0
+CHANGED = 1
+SEEN = 2
+
+SCAN_WINDOW = 1.0   # seconds per start_scan() call; the consumer runs between windows
+YIELD_EVERY = 8     # advertisements read before letting the consumer run, within a window
+LOG_BATCH = 2048    # bytes of log lines collected before they are appended to the file
+DISCOVERY_TIMEOUT = 1.5   # seconds a GATT connect may block the event loop
+
+
+class DeviceRecord:
+    __slots__ = ("mac", "name", "services", "connectable", "address", "details",
+                 "first_seen", "last_seen", "count", "rssi_min", "rssi_max", "rssi_total")
+
+    def __init__(self, mac, now):
+        self.mac = mac
+        self.name = None
+        self.services = None
+        self.connectable = False
+        self.address = None
+        self.details = None   # result of service discovery
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 0
+        self.rssi_min = 0
+        self.rssi_max = -255
+        self.rssi_total = 0
+
+    def summary(self):
+        return {"event": "summary", "time": int(time.time()), "mac": self.mac, "name": self.name,
+                "seen_for": round(self.last_seen - self.first_seen, 1), "count": self.count,
+                "rssi_min": self.rssi_min, "rssi_max": self.rssi_max, "rssi_avg": round(self.rssi_total / self.count, 1)}
+
+
+class DeviceTable:
+    def __init__(self, capacity=128, on_evict=None):
+        """
+        capacity: Devices kept; the least recently seen is evicted to make room for a new one.
+        on_evict: Called with each evicted DeviceRecord.
+        """
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self.devices = OrderedDict()  # mac -> DeviceRecord, least recently seen first
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.devices)
+
+    def observe(self, entry):
+        """Fold an advertisement entry into the table and return (record, NEW, CHANGED or SEEN)."""
+        now, mac, rssi, name, services, connectable, address = entry
+        devices = self.devices
+        record = devices.pop(mac, None)
+        if record is None:
+            if len(devices) >= self.capacity:
+                oldest = next(iter(devices))
+                evicted = devices.pop(oldest)
+                self.evicted += 1
+                if self.on_evict is not None:
+                    self.on_evict(evicted)
+            record = DeviceRecord(mac, now)
+            status = NEW
+        elif name != record.name or services != record.services or connectable != record.connectable:
+            status = CHANGED
+        else:
+            status = SEEN
+        devices[mac] = record  # most recently seen last
+        if status != SEEN:
+            record.name = name
+            record.services = services
+            record.connectable = connectable
+        if address is not None:
+            record.address = address
+        record.last_seen = now
+        record.count += 1
+        record.rssi_total += rssi
+        if rssi < record.rssi_min:
+            record.rssi_min = rssi
+        if rssi > record.rssi_max:
+            record.rssi_max = rssi
+        return record, status
+
+
+class AdvertisementQueue:
+    """Bounded FIFO between the radio and the scanner; when full, the oldest entry is dropped."""
+
+    def __init__(self, maxsize=64):
+        import asyncio
+        self.items = [None] * maxsize
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return self.count
+
+    def put(self, entry):
+        size = len(self.items)
+        if self.count == size:
+            self.head = (self.head + 1) % size
+            self.count -= 1
+            self.dropped += 1
+        self.items[(self.head + self.count) % size] = entry
+        self.count += 1
+        self._ready.set()
+
+    def get_nowait(self):
+        entry = self.items[self.head]
+        self.items[self.head] = None
+        self.head = (self.head + 1) % len(self.items)
+        self.count -= 1
+        return entry
+
+    async def get(self):
+        while not self.count:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.get_nowait()
+
+
+class ScanLog:
+    def __init__(self, path, batch_bytes=LOG_BATCH, max_pending=256):
+        """Append JSON lines to path, batch_bytes at a time; at most max_pending lines wait for a missing card."""
+        self.path = path
+        self.batch_bytes = batch_bytes
+        self.max_pending = max_pending
+        self.pending = []
+        self.size = 0
+        self.lines = 0
+        self.writes = 0
+
+    def add(self, event):
+        line = json.dumps(event) + "\n"
+        self.pending.append(line)
+        self.size += len(line)
+        self.lines += 1
+        if self.size >= self.batch_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        if not get_storage().append(self.path, "".join(self.pending)):
+            print("Scan log is not being written; is the SD card in?")
+            if len(self.pending) > self.max_pending:
+                del self.pending[:len(self.pending) - self.max_pending]
+                self.size = sum(len(line) for line in self.pending)
+            return
+        self.pending = []
+        self.size = 0
+        self.writes += 1
+
+    def close(self):
+        """Flush the lines and write them out to the card."""
+        self.flush()
+        get_storage().close(self.path)
+
+
+def advertisement_entry(advertisement, now):
+    """Return the entry tuple for an adafruit_ble Advertisement received at now."""
+    address = advertisement.address
+    mac = ":".join("%02x" % b for b in reversed(address.address_bytes))
+    name = advertisement.complete_name or advertisement.short_name or ""
+    services = getattr(advertisement, "services", None)
+    services = tuple(str(service.uuid) for service in services) if services else ()
+    return (now, mac, advertisement.rssi, name, services, advertisement.connectable, address)
+
+
+def gatt_discovery(radio, timeout=DISCOVERY_TIMEOUT):
+    """Return a discover function that connects to a device and lists its services and characteristics."""
+    def discover(record):
+        if record.address is None:
+            return None
+        try:
+            connection = radio.connect(record.address, timeout=timeout)
+        except Exception as e:
+            print(f"Could not connect to {record.mac}: {e}")
+            return None
+        try:
+            services = []
+            for service in connection._bleio_connection.discover_remote_services():
+                services.append([str(service.uuid),
+                                 [[str(c.uuid), c.properties] for c in service.characteristics]])
+            return services
+        except Exception as e:
+            print(f"Service discovery on {record.mac} failed: {e}")
+            return None
+        finally:
+            connection.disconnect()
+    return discover
+
+
+async def scan_radio(radio, queue, duration=None, window=SCAN_WINDOW, record=None, between=None,
+                     yield_every=YIELD_EVERY):
+    """Scan for duration seconds (forever for None), putting an entry per advertisement on queue.
+
+    record: Optional text file to which every entry is written as a JSON list, for replaying later.
+    between: Optional function called between scan windows, while the radio is not scanning.
+    yield_every: Advertisements read before yielding to the other tasks.
+    """
+    import asyncio
+    from adafruit_ble.advertising import Advertisement
+    from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
+    start = time.monotonic()
+    while duration is None or time.monotonic() - start < duration:
+        read = 0
+        for advertisement in radio.start_scan(ProvideServicesAdvertisement, Advertisement, timeout=window):
+            entry = advertisement_entry(advertisement, time.monotonic())
+            queue.put(entry)
+            if record is not None:
+                record.write(json.dumps(list(entry[:6])) + "\n")
+            read += 1
+            if read % yield_every == 0:
+                await asyncio.sleep(0)
+        radio.stop_scan()
+        await asyncio.sleep(0)
+        if between is not None:
+            between()
+            await asyncio.sleep(0)
+
+
+class BLEScanner:
+    def __init__(self, log_path=None, capacity=128, discover=None, queue_size=64):
+        """
+        log_path: JSON lines file on the SD card, or None to keep results in memory only.
+        discover: Function taking a DeviceRecord and returning its services (e.g. gatt_discovery(radio)),
+                  called for new and changed connectable devices; None skips discovery. Up to capacity
+                  devices wait for it at a time, see discover_next().
+        """
+        self.queue = AdvertisementQueue(queue_size)
+        self.table = DeviceTable(capacity, self._evicted)
+        self.log = ScanLog(log_path) if log_path else None
+        self.discover = discover
+        self.to_discover = OrderedDict()  # mac -> DeviceRecord waiting for service discovery, oldest first
+        self.processed = 0
+        self.discoveries = 0
+        self.skipped = 0   # devices not queued for discovery because the queue was full
+
+    def _evicted(self, record):
+        if self.log is not None:
+            self.log.add(record.summary())
+
+    def handle(self, entry):
+        record, status = self.table.observe(entry)
+        self.processed += 1
+        if status == SEEN:
+            return
+        if self.discover is not None and record.connectable:
+            if record.mac in self.to_discover or len(self.to_discover) < self.table.capacity:
+                self.to_discover[record.mac] = record
+            else:
+                self.skipped += 1
+        if self.log is not None:
+            self.log.add({"event": "new" if status == NEW else "changed", "time": int(time.time()),
+                          "mac": record.mac, "name": record.name, "rssi": entry[2], "connectable": record.connectable,
+                          "services": list(record.services), "details": record.details})
+
+    def discover_next(self):
+        """Run service discovery for the device that has waited longest; returns False if none is waiting."""
+        if not self.to_discover:
+            return False
+        mac = next(iter(self.to_discover))
+        record = self.to_discover.pop(mac)
+        record.details = self.discover(record)
+        self.discoveries += 1
+        if self.log is not None:
+            self.log.add({"event": "details", "time": int(time.time()), "mac": mac, "details": record.details})
+        return True
+
+    async def discover_all(self):
+        """Run discovery for every waiting device, one per event loop turn."""
+        import asyncio
+        while self.discover_next():
+            await asyncio.sleep(0)
+
+    async def consume(self):
+        """Handle entries from the queue until cancelled."""
+        queue = self.queue
+        while True:
+            self.handle(await queue.get())
+            while queue.count:
+                self.handle(queue.get_nowait())
+
+    def close(self):
+        """Handle what is still queued, discover waiting devices, log a summary of every device and flush the log."""
+        while self.queue.count:
+            self.handle(self.queue.get_nowait())
+        while self.discover_next():
+            pass
+        if self.log is not None:
+            for record in self.table.devices.values():
+                self.log.add(record.summary())
+            self.log.close()
+
+    async def run(self, radio, duration=None, record=None):
+        import asyncio
+        consumer = asyncio.create_task(self.consume())
+        try:
+            await scan_radio(radio, self.queue, duration, record=record,
+                             between=self.discover_next if self.discover is not None else None)
+            # Let the consumer catch up, then connect to whatever still waits for discovery
+            await asyncio.sleep(0)
+            await self.discover_all()
+        finally:
+            consumer.cancel()
+            try:
+                await consumer
+            except asyncio.CancelledError:
+                pass
+            self.close()
+
+
+def scan_bluetooth_devices(duration=60, discover_services=True):
+    """Scan for duration seconds and log every device seen, with its services, to the SD card."""
+    import asyncio
+    import adafruit_ble
+    from command_registry import SD_ROOT
+    if not get_storage().mount():
+        print("No SD card; the scan is not logged")
+    radio = adafruit_ble.BLERadio()
+    scanner = BLEScanner(f"{SD_ROOT}/ble_scan.jsonl", discover=gatt_discovery(radio) if discover_services else None)
+    asyncio.run(scanner.run(radio, duration))
+    print(f"Scanned {scanner.processed} advertisements from {len(scanner.table) + scanner.table.evicted} devices")
+    return scanner
 
 
 if __name__ == '__main__':
-    scan_bluetooth_devices() 
\ No newline at end of file
+    scan_bluetooth_devices()
@@ -1,12 +1,463 @@
-'''connection_logger.py - Stub for generic connection logging.
+'''connection_logger.py - Scans for Wi-Fi networks and Bluetooth devices every minute and logs them in a compact binary format.
 
-This module scans for available connections every minute and logs detailed properties of each connection.
+Log format (all integers little-endian):
+  - The file is split into segments of SEGMENT_SIZE bytes (8 SD card blocks).
+  - Segment 0 starts with the file header: SEGMENT_HEADER with magic b"CLG1" and the segment size.
+  - Every later segment k starts with an index block: SEGMENT_HEADER with magic b"CIDX", the first and
+    last timestamp and record count of segment k-1, then the ids of the devices seen in it.
+  - After that come fixed-size RECORD entries, one per connection seen in a scan: timestamp, device id,
+    name id, RSSI, channel, kind (KIND_WIFI/KIND_BLE) and auth mode. A record never spans a segment;
+    the rest of a segment that cannot hold another one is zero-filled.
+  - Device MACs/BSSIDs and names/SSIDs are interned: records hold numbers into a string table kept in
+    `<log>.str` as length-prefixed UTF-8 strings, numbered in order. New strings are appended there
+    before any record using them is written to the log.
+  - The device index `<log>.dev` repeats the device lists of the index blocks back to back: for every
+    finished segment, DEVICE_ENTRY (segment number, device count) and then the device ids.
+Because index blocks sit at known offsets, ConnectionLogReader finds a time range by binary search over
+a handful of index blocks. A device is found by reading the device index, which is a fraction of the
+size of the index blocks and read in large sequential chunks, and then only the segments that contain
+it. Timestamps must not go backwards (they come from time.time() once per scan).
+Both files are appended through the storage service (sd_storage), which batches the scans' records into
+sector-sized writes.
 '''
 
-def log_connections():
-    # TODO: Implement scanning of open connections and logging their properties.
-    pass
+import os
+import struct
+import time
+
+from sd_storage import get_storage
+
+SEGMENT_SIZE = 4096
+SEGMENT_HEADER = "<4sIIHH"   # magic, first timestamp (segment size in the file header), last timestamp, records, devices
+SEGMENT_HEADER_SIZE = struct.calcsize(SEGMENT_HEADER)
+RECORD = "<IHHbBBB"          # timestamp, device id, name id, rssi, channel, kind, auth mode
+RECORD_SIZE = struct.calcsize(RECORD)
+FILE_MAGIC = b"CLG1"
+INDEX_MAGIC = b"CIDX"
+INDEX_READ = 512    # bytes read to get an index block
+DEVICE_ENTRY = "<IH"         # segment, device count; followed by that many device ids
+DEVICE_ENTRY_SIZE = struct.calcsize(DEVICE_ENTRY)
+DEVICE_INDEX_READ = 4096     # bytes read at a time from the device index
+
+KIND_WIFI = 0
+KIND_BLE = 1
+
+# Bits of a Wi-Fi record's auth mode, in order
+AUTH_MODES = ("OPEN", "WEP", "WPA", "WPA2", "WPA3", "PSK", "ENTERPRISE")
+
+SCAN_INTERVAL = 60  # seconds
+BLE_WINDOW = 0.2    # seconds per Bluetooth scan window; the radio iterator blocks for up to this long
+
+
+def _strings_path(path):
+    return path + ".str"
+
+
+def _devices_path(path):
+    return path + ".dev"
+
+
+def _encode_string(text):
+    """UTF-8 encode text for the string table, cut to 255 bytes at a character boundary."""
+    data = text.encode()
+    if len(data) > 255:
+        cut = 255
+        while data[cut] & 0xC0 == 0x80:   # data[cut] continues the character before it
+            cut -= 1
+        data = data[:cut]
+    return data
+
+
+def _read_strings(path):
+    strings = []
+    try:
+        with open(_strings_path(path), "rb") as f:
+            data = f.read()
+    except OSError:
+        return strings
+    offset = 0
+    while offset < len(data):
+        length = data[offset]
+        strings.append(data[offset + 1:offset + 1 + length].decode())
+        offset += 1 + length
+    return strings
+
+
+class ConnectionLogWriter:
+    def __init__(self, path, segment_size=SEGMENT_SIZE):
+        """Open (or create) the log at path; records are buffered until flush()."""
+        self.path = path
+        storage = get_storage()
+        storage.flush(path)
+        storage.flush(_strings_path(path))
+        storage.flush(_devices_path(path))
+        self.strings = {}       # text -> id
+        for number, text in enumerate(_read_strings(path)):
+            self.strings[text] = number
+        self.new_strings = bytearray()
+        self.pending = bytearray()
+        self.device_index = bytearray()   # device index entries of segments closed in pending
+        self.records = 0
+        self.writes = 0
+        self._reset_segment()
+        try:
+            size = os.stat(path)[6]
+        except OSError:
+            size = 0
+        self.flushed = size     # bytes of the log already in the file
+        if size:
+            with open(path, "rb") as f:
+                self.segment_size = struct.unpack(SEGMENT_HEADER, f.read(SEGMENT_HEADER_SIZE))[1]
+                self._recover(f, size)
+        else:
+            self.segment_size = segment_size
+            self.pending += struct.pack(SEGMENT_HEADER, FILE_MAGIC, segment_size, 0, 0, 0)
+
+    def _reset_segment(self):
+        self.first = 0
+        self.last = 0
+        self.count = 0
+        self.devices = set()
+
+    def _recover(self, f, size):
+        """Rebuild the statistics of the last, unfinished segment of an existing log."""
+        start = (size - 1) // self.segment_size * self.segment_size
+        f.seek(start)
+        data = f.read(size - start)
+        if start == 0:
+            offset = SEGMENT_HEADER_SIZE
+        else:
+            offset = SEGMENT_HEADER_SIZE + 2 * struct.unpack_from(SEGMENT_HEADER, data)[4]
+        while offset + RECORD_SIZE <= len(data):
+            timestamp, device = struct.unpack_from("<IH", data, offset)
+            if not timestamp:
+                break
+            self._count(timestamp, device)
+            offset += RECORD_SIZE
+
+    def _count(self, timestamp, device):
+        if not self.count:
+            self.first = timestamp
+        self.last = timestamp
+        self.count += 1
+        self.devices.add(device)
+
+    def intern(self, text):
+        """Return the id of text in the string table, adding it if it is new."""
+        number = self.strings.get(text)
+        if number is None:
+            number = len(self.strings)
+            self.strings[text] = number
+            data = _encode_string(text)
+            self.new_strings.append(len(data))
+            self.new_strings += data
+        return number
+
+    def add(self, timestamp, device, name, rssi, channel=0, kind=KIND_WIFI, auth=0):
+        """Buffer one record; device and name are strings (MAC/BSSID and SSID/device name)."""
+        position = (self.flushed + len(self.pending)) % self.segment_size
+        if position == 0 or position + RECORD_SIZE > self.segment_size:
+            # Close the segment: zero-fill it and start the next one with its index block
+            if position:
+                self.pending += bytes(self.segment_size - position)
+            devices = sorted(self.devices)
+            ids = struct.pack("<%dH" % len(devices), *devices)
+            closed = (self.flushed + len(self.pending)) // self.segment_size - 1
+            self.pending += struct.pack(SEGMENT_HEADER, INDEX_MAGIC, self.first, self.last, self.count, len(devices))
+            self.pending += ids
+            self.device_index += struct.pack(DEVICE_ENTRY, closed, len(devices))
+            self.device_index += ids
+            self._reset_segment()
+        device_id = self.intern(device)
+        self.pending += struct.pack(RECORD, timestamp, device_id, self.intern(name),
+                                    max(-128, min(127, rssi)), channel, kind, auth)
+        self.records += 1
+        self._count(timestamp, device_id)
+
+    def flush(self):
+        """Hand new strings, then the buffered records and device index entries, to the storage service.
+
+        New strings are written out straight away, so no record on the card refers to a string that is
+        not. Raises OSError if they cannot be; the records are kept for the next flush.
+        """
+        storage = get_storage()
+        strings_path = _strings_path(self.path)
+        if self.new_strings and storage.append(strings_path, self.new_strings):
+            self.new_strings = bytearray()
+        # Strings handed over by an earlier flush may still be buffered if writing them failed then
+        storage.flush(strings_path)
+        if self.new_strings or storage.pending(strings_path):
+            raise OSError("could not write " + strings_path)
+        if self.pending:
+            if not storage.append(self.path, self.pending):
+                return
+            self.flushed += len(self.pending)
+            self.pending = bytearray()
+            self.writes += 1
+        # If these are lost, the reader falls back to the index blocks for the segments they cover
+        if self.device_index and storage.append(_devices_path(self.path), self.device_index):
+            self.device_index = bytearray()
+
+
+class ConnectionLogReader:
+    def __init__(self, path):
+        self.path = path
+        storage = get_storage()
+        storage.flush(path)
+        storage.flush(_strings_path(path))
+        storage.flush(_devices_path(path))
+        self.f = open(path, "rb")
+        self.size = os.stat(path)[6]
+        magic, self.segment_size = struct.unpack(SEGMENT_HEADER, self.f.read(SEGMENT_HEADER_SIZE))[:2]
+        if magic != FILE_MAGIC:
+            raise ValueError("not a connection log")
+        self.strings = _read_strings(path)
+        self._ids = None
+        self._summaries = {}   # segment -> (first, last, count, devices) from the next segment's index block
+        self.segments = (self.size + self.segment_size - 1) // self.segment_size
+        self.reads = 0         # file reads and bytes read, for comparing query strategies
+        self.bytes_read = 0
+
+    def close(self):
+        self.f.close()
+
+    def _read(self, offset, length):
+        self.f.seek(offset)
+        data = self.f.read(length)
+        self.reads += 1
+        self.bytes_read += len(data)
+        return data
+
+    def summary(self, segment):
+        """Return (first, last, count, device ids) of a finished segment, or None for the last one."""
+        if segment + 1 >= self.segments:
+            return None
+        result = self._summaries.get(segment)
+        if result is None:
+            offset = (segment + 1) * self.segment_size
+            data = self._read(offset, INDEX_READ)  # usually the whole index block in one SD card block
+            magic, first, last, count, device_count = struct.unpack_from(SEGMENT_HEADER, data)
+            if magic != INDEX_MAGIC:
+                raise ValueError("corrupt index block in segment %d" % (segment + 1))
+            end = SEGMENT_HEADER_SIZE + 2 * device_count
+            if end > len(data):
+                data += self._read(offset + len(data), end - len(data))
+            devices = struct.unpack_from("<%dH" % device_count, data, SEGMENT_HEADER_SIZE)
+            result = (first, last, count, devices)
+            self._summaries[segment] = result
+        return result
+
+    def device_segments(self, device_id):
+        """Return (segments, covered): the finished segments holding device_id according to the device
+        index, and the number of segments from the start of the log that the index covers.
+        """
+        segments = []
+        covered = 0
+        try:
+            f = open(_devices_path(self.path), "rb")
+        except OSError:
+            return segments, covered
+        with f:
+            data = b""
+            offset = 0
+            while True:
+                chunk = f.read(DEVICE_INDEX_READ)
+                if not chunk:
+                    break
+                self.reads += 1
+                self.bytes_read += len(chunk)
+                data = data[offset:] + chunk
+                offset = 0
+                while offset + DEVICE_ENTRY_SIZE <= len(data):
+                    segment, count = struct.unpack_from(DEVICE_ENTRY, data, offset)
+                    end = offset + DEVICE_ENTRY_SIZE + 2 * count
+                    if end > len(data):
+                        break
+                    if segment + 1 >= self.segments:
+                        return segments, covered   # not finished in the log yet
+                    if device_id in struct.unpack_from("<%dH" % count, data, offset + DEVICE_ENTRY_SIZE):
+                        segments.append(segment)
+                    covered = segment + 1
+                    offset = end
+        return segments, covered
+
+    def records(self, segment):
+        """Yield the raw record tuples of a segment."""
+        start = segment * self.segment_size
+        data = self._read(start, min(self.segment_size, self.size - start))
+        if segment == 0:
+            offset = SEGMENT_HEADER_SIZE
+        else:
+            offset = SEGMENT_HEADER_SIZE + 2 * struct.unpack_from(SEGMENT_HEADER, data)[4]
+        while offset + RECORD_SIZE <= len(data):
+            record = struct.unpack_from(RECORD, data, offset)
+            if not record[0]:
+                return
+            yield record
+            offset += RECORD_SIZE
+
+    def device_id(self, device):
+        if self._ids is None:
+            self._ids = {text: number for number, text in enumerate(self.strings)}
+        return self._ids.get(device)
+
+    def _first_segment(self, start):
+        """Return the first segment that may hold records at or after start, by binary search."""
+        low, high = 0, self.segments - 1  # the last segment has no summary and is always a candidate
+        while low < high:
+            middle = (low + high) // 2
+            if self.summary(middle)[1] < start:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start=None, end=None, device=None):
+        """Yield (timestamp, device, name, rssi, channel, kind, auth) for records in [start, end] of device.
+
+        Any of the filters may be None. Only the index blocks needed and the segments that can match are read;
+        for a device, the segments come from the device index and only those it does not cover yet are
+        checked against their index blocks.
+        """
+        device_id = None
+        covered = 0
+        first = self._first_segment(start) if start is not None else 0
+        segments = range(first, self.segments)
+        if device is not None:
+            device_id = self.device_id(device)
+            if device_id is None:
+                return
+            listed, covered = self.device_segments(device_id)
+            segments = [s for s in listed if s >= first] + list(range(max(first, covered), self.segments))
+        strings = self.strings
+        for segment in segments:
+            if segment >= covered:
+                summary = self.summary(segment)
+                if summary is not None:
+                    if end is not None and summary[0] > end:
+                        return
+                    if device_id is not None and device_id not in summary[3]:
+                        continue
+            for timestamp, dev, name, rssi, channel, kind, auth in self.records(segment):
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp > end:
+                    return
+                if device_id is not None and dev != device_id:
+                    continue
+                yield (timestamp, strings[dev], strings[name], rssi, channel, kind, auth)
+
+
+async def scan_wifi(writer, timestamp, manager=None):
+    """Add a record for every Wi-Fi access point in range; returns how many were found.
+
+    The scan goes through the WiFiManager (the shared one by default), so it takes the radio lock
+    instead of colliding with the background scan, and yields to the menu between channels.
+    """
+    import wifi
+    from connectivity.wifi_network import get_wifi_manager
+    found = [0]
+
+    def observe(network):
+        bssid = ":".join("%02x" % b for b in network.bssid)
+        auth = 0
+        for bit, mode in enumerate(AUTH_MODES):
+            if getattr(wifi.AuthMode, mode, None) in network.authmode:
+                auth |= 1 << bit
+        writer.add(timestamp, bssid, network.ssid, network.rssi, network.channel, KIND_WIFI, auth)
+        found[0] += 1
+
+    await (manager or get_wifi_manager()).scan(observe)
+    return found[0]
+
+
+async def scan_ble(writer, timestamp, radio, duration=5):
+    """Add a record for every Bluetooth device advertising within duration seconds (once per device).
+
+    Advertisements are read in short scan windows and the task yields after each one, so the menu
+    keeps running during the scan.
+    """
+    import asyncio
+    from connectivity.bluetooth_scanner import AdvertisementQueue, scan_radio
+    queue = AdvertisementQueue()
+    seen = {}
+
+    async def consume():
+        while True:
+            entry = await queue.get()
+            seen[entry[1]] = entry
+
+    consumer = asyncio.create_task(consume())
+    try:
+        await scan_radio(radio, queue, duration, window=BLE_WINDOW, yield_every=1)
+        await asyncio.sleep(0)
+    finally:
+        consumer.cancel()
+    while queue.count:
+        entry = queue.get_nowait()
+        seen[entry[1]] = entry
+    for _, mac, rssi, name, _, connectable, _ in seen.values():
+        writer.add(timestamp, mac, name, rssi, 0, KIND_BLE, 1 if connectable else 0)
+    return len(seen)
+
+
+async def log_scan(writer, ble_radio=None, wifi_manager=None):
+    """Scan once and write the scan's records to the log in one go."""
+    timestamp = int(time.time())
+    try:
+        await scan_wifi(writer, timestamp, wifi_manager)
+    except Exception as e:
+        print(f"Wi-Fi scan failed: {e}")
+    if ble_radio is not None:
+        try:
+            await scan_ble(writer, timestamp, ble_radio)
+        except Exception as e:
+            print(f"Bluetooth scan failed: {e}")
+    try:
+        writer.flush()
+    except OSError as e:
+        print(f"Error writing connection log: {e}")
+
+
+async def run_connection_logger(writer, interval=SCAN_INTERVAL, ble_radio=None):
+    """Scan every interval seconds, writing each scan's records to the log in one go."""
+    import asyncio
+    while True:
+        await log_scan(writer, ble_radio)
+        await asyncio.sleep(interval)
+
+
+def connection_log_command(ble=False):
+    """A periodic Command that logs one scan every SCAN_INTERVAL seconds, for the job scheduler."""
+    from command_registry import Command, PERIODIC, SD_ROOT
+    state = {}
+
+    def scan():
+        if "writer" not in state:
+            state["writer"] = ConnectionLogWriter(f"{SD_ROOT}/connections.log")
+            if ble:
+                import adafruit_ble
+                state["radio"] = adafruit_ble.BLERadio()
+        return log_scan(state["writer"], state.get("radio"))
+
+    return Command("Connection Logger: Log Wi-Fi networks every minute", "Scan for Wi-Fi networks every minute and log them to the SD card",
+                   scan, mode=PERIODIC, period=SCAN_INTERVAL)
+
+
+def log_connections(ble=True):
+    """Scan for connections every minute and log their properties to the SD card."""
+    import asyncio
+    from command_registry import SD_ROOT
+    if not get_storage().mount():
+        print("No SD card; connections are not logged")
+        return
+    radio = None
+    if ble:
+        import adafruit_ble
+        radio = adafruit_ble.BLERadio()
+    writer = ConnectionLogWriter(f"{SD_ROOT}/connections.log")
+    asyncio.run(run_connection_logger(writer, ble_radio=radio))
 
 
 if __name__ == '__main__':
-    log_connections() 
\ No newline at end of file
+    log_connections()
@@ -1,12 +1,389 @@
-'''espnow_manager.py - Stub for ESP-NOW functionality.
+'''espnow_manager.py - ESP-NOW discovery of the commands peer gadgets offer.
 
-This module sends out a packet with a special init code to trigger a response that details callable function parameters. The responses are then logged to the SD card in the device's configuration files.
+The controller broadcasts a DISCOVER frame with an init code; every gadget running a
+DiscoveryResponder answers with its name and command signatures, and the results are saved to
+CONFIG_DIR/<MAC> on the SD card (see peer_config.py) and turned into command_registry.Command entries.
+
+Frames are FRAME_HEADER (type, flags, sequence number, fragment index, fragment count) followed by
+at most MAX_PAYLOAD bytes, so one frame fits the 250 bytes ESP-NOW allows:
+  - MSG_DISCOVER, broadcast: INIT_CODE, then two bytes per peer whose answer is complete (the last
+    two bytes of its MAC), so rebroadcasts only wake up peers whose answer got lost
+  - MSG_SIGNATURES, peer to controller: one fragment of the peer's JSON signature document
+    {"name": ..., "commands": [[name, description, [arg, ...]], ...]}; a command whose results may be
+    reused for a while (a sensor read) has a fourth element, the number of seconds to cache them
+  - MSG_RESEND, controller to peer: a bitmap of the fragments still missing
+  - MSG_CALL and MSG_RESULT: running a peer's commands, see remote_command.py
+Every discovery round has its own sequence number, and answers are reassembled per (MAC, sequence),
+so any number of peers can answer at once. A peer whose fragments stop arriving before it is
+complete is asked for the missing ones, with exponential backoff between attempts.
+
+Transports have two methods: send(mac, data) and receive(), which returns (mac, data) or None
+without waiting. ESPNowTransport is the radio; simulator/loopback.py has an in-process one.
 '''
 
-def manage_espnow():
-    # TODO: Implement ESP-NOW functionality: sending init code and processing responses
-    pass
+import json
+import os
+import struct
+import time
+
+from sd_storage import SD_ROOT, get_storage
+
+BROADCAST = b"\xff" * 6
+INIT_CODE = b"CPD1"
+
+MSG_DISCOVER = 0xC1
+MSG_SIGNATURES = 0xC2
+MSG_RESEND = 0xC3
+MSG_CALL = 0xC4
+MSG_RESULT = 0xC5
+
+FRAME_HEADER = "<BBHBB"  # type, flags, sequence, fragment index, fragment count
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_HEADER)
+MAX_FRAME = 250
+MAX_PAYLOAD = MAX_FRAME - FRAME_HEADER_SIZE
+
+RETRY_BASE = 0.05        # seconds of silence before asking a peer for missing fragments; doubles per attempt
+MAX_RETRIES = 4
+BROADCASTS = 4           # DISCOVER frames per round, BROADCAST_GAP apart
+BROADCAST_GAP = 0.15
+SETTLE = 0.3             # a round ends once nothing new has arrived for this long after the last broadcast
+POLL = 0.005             # seconds between polls of the transport
+
+# One file per peer, named after its MAC in hex digits, plus the index peer_config.py keeps. They are on
+# the SD card because CIRCUITPY is read-only to code while it is writable over USB.
+CONFIG_DIR = f"{SD_ROOT}/peers"
+
+
+def make_config_dir(config_dir):
+    """Create config_dir if it does not exist yet; raises OSError if the card is not writable."""
+    try:
+        os.stat(config_dir)
+    except OSError:
+        os.mkdir(config_dir)
+
+
+def mac_text(mac):
+    return ":".join("%02x" % b for b in mac)
+
+
+def pack_frame(kind, sequence, payload=b"", index=0, count=1):
+    return struct.pack(FRAME_HEADER, kind, 0, sequence, index, count) + payload
+
+
+def unpack_frame(data):
+    """Return (type, sequence, index, count, payload), or None if data is not one of our frames."""
+    if len(data) < FRAME_HEADER_SIZE or not MSG_DISCOVER <= data[0] <= MSG_RESULT:
+        return None
+    kind, _, sequence, index, count = struct.unpack_from(FRAME_HEADER, data)
+    return kind, sequence, index, count, data[FRAME_HEADER_SIZE:]
+
+
+def fragment(document):
+    """Split an encoded document into payloads of at most MAX_PAYLOAD bytes (at most 255 of them)."""
+    count = max(1, (len(document) + MAX_PAYLOAD - 1) // MAX_PAYLOAD)
+    if count > 255:
+        raise ValueError("signature document too large")
+    return [document[i * MAX_PAYLOAD:(i + 1) * MAX_PAYLOAD] for i in range(count)]
+
+
+class DiscoveryResponder:
+    """The peer side: answers DISCOVER and RESEND frames with this gadget's signatures."""
+
+    def __init__(self, transport, mac, name, commands):
+        """commands: List of (name, description, [argument names]) or (name, description, [argument names], cache ttl)."""
+        self.transport = transport
+        self.tag = bytes(mac[-2:])
+        document = json.dumps({"name": name, "commands": [list(c[:2]) + [list(c[2])] + list(c[3:]) for c in commands]})
+        self.fragments = fragment(document.encode())
+
+    def handle(self, mac, data):
+        frame = unpack_frame(data)
+        if frame is None:
+            return
+        kind, sequence, _, _, payload = frame
+        count = len(self.fragments)
+        if kind == MSG_DISCOVER:
+            if payload[:len(INIT_CODE)] != INIT_CODE:
+                return
+            known = payload[len(INIT_CODE):]
+            for i in range(0, len(known) - 1, 2):
+                if known[i:i + 2] == self.tag:
+                    return
+            wanted = range(count)
+        elif kind == MSG_RESEND:
+            wanted = [i for i in range(min(count, len(payload) * 8)) if payload[i // 8] & (1 << (i % 8))]
+        else:
+            return
+        for i in wanted:
+            self.transport.send(mac, pack_frame(MSG_SIGNATURES, sequence, self.fragments[i], i, count))
+
+    def poll(self):
+        """Answer every frame waiting on the transport."""
+        while True:
+            received = self.transport.receive()
+            if received is None:
+                return
+            self.handle(*received)
+
+
+class PeerState:
+    __slots__ = ("fragments", "received", "attempts", "next_retry", "done")
+
+    def __init__(self, count, now):
+        self.fragments = [None] * count
+        self.received = 0
+        self.attempts = 0
+        self.next_retry = now + RETRY_BASE
+        self.done = False
+
+    def missing_bitmap(self):
+        bitmap = bytearray((len(self.fragments) + 7) // 8)
+        for i, part in enumerate(self.fragments):
+            if part is None:
+                bitmap[i // 8] |= 1 << (i % 8)
+        return bytes(bitmap)
+
+
+class DiscoveryEngine:
+    def __init__(self, transport, clock=time.monotonic):
+        self.transport = transport
+        self.clock = clock
+        self.sequence = 0
+        self.frames_sent = 0
+        self.retries = 0
+
+    def _send(self, mac, data):
+        self.transport.send(mac, data)
+        self.frames_sent += 1
+
+    async def discover(self, timeout=5.0):
+        """Run one discovery round and return {mac bytes: {"name": ..., "commands": [...]}}.
+
+        Peers that did not answer completely within timeout seconds, or after MAX_RETRIES requests for
+        their missing fragments, are left out.
+        """
+        import asyncio
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        sequence = self.sequence
+        peers = {}     # mac -> PeerState
+        results = {}
+        clock = self.clock
+        start = clock()
+        broadcasts = 0
+        next_broadcast = start
+        last_news = start
+        while True:
+            now = clock()
+            if broadcasts < BROADCASTS and now >= next_broadcast:
+                known = b"".join(mac[-2:] for mac in results)[:MAX_PAYLOAD - len(INIT_CODE)]
+                self._send(BROADCAST, pack_frame(MSG_DISCOVER, sequence, INIT_CODE + known))
+                broadcasts += 1
+                next_broadcast = now + BROADCAST_GAP
+                last_news = now
+            while True:
+                received = self.transport.receive()
+                if received is None:
+                    break
+                mac, data = received
+                frame = unpack_frame(data)
+                if frame is None or frame[0] != MSG_SIGNATURES or frame[1] != sequence:
+                    continue
+                _, _, index, count, payload = frame
+                mac = bytes(mac)
+                state = peers.get(mac)
+                if state is None:
+                    state = peers[mac] = PeerState(count, now)
+                if state.done or index >= len(state.fragments) or state.fragments[index] is not None:
+                    continue
+                state.fragments[index] = bytes(payload)
+                state.received += 1
+                state.next_retry = now + RETRY_BASE * (1 << state.attempts)
+                last_news = now
+                if state.received == len(state.fragments):
+                    state.done = True
+                    try:
+                        results[mac] = json.loads(b"".join(state.fragments))
+                    except ValueError:
+                        print(f"Discarding malformed signatures from {mac_text(mac)}")
+            pending = False
+            for mac, state in peers.items():
+                if state.done or state.attempts > MAX_RETRIES:
+                    continue
+                pending = True
+                if now >= state.next_retry:
+                    state.attempts += 1
+                    state.next_retry = now + RETRY_BASE * (1 << state.attempts)
+                    if state.attempts <= MAX_RETRIES:
+                        self._send(mac, pack_frame(MSG_RESEND, sequence, state.missing_bitmap()))
+                        self.retries += 1
+            if now - start >= timeout:
+                break
+            if broadcasts >= BROADCASTS and not pending and now - last_news >= SETTLE:
+                break
+            await asyncio.sleep(POLL)
+        return results
+
+
+def save_peer_config(mac, document, config_dir=CONFIG_DIR):
+    """Write a peer's signatures to config_dir/<MAC> (hex digits, no separators)."""
+    commands = []
+    for c in document.get("commands", ()):
+        entry = {"name": c[0], "description": c[1], "args": c[2]}
+        if len(c) > 3 and c[3]:
+            entry["ttl"] = c[3]
+        commands.append(entry)
+    path = "%s/%s" % (config_dir, "".join("%02x" % b for b in mac))
+    try:
+        make_config_dir(config_dir)
+        get_storage().write_atomic(path, json.dumps({"mac": mac_text(mac), "name": document.get("name", ""), "commands": commands}))
+    except OSError as e:
+        print(f"Could not save config for {mac_text(mac)}: {e}")
+
+
+def peer_commands(mac, document):
+    """Return Command entries, named "<peer name>: <command>", for a peer's signature document.
+
+    Their callbacks are RemoteCommands, which run the command on the peer. The signature's argument
+    names only go into the schema; values are passed when the command is called.
+    """
+    from command_registry import Command
+    from connectivity.remote_command import RemoteCommand
+    peer = document.get("name") or mac_text(mac)
+    commands = []
+    for entry in document.get("commands", ()):
+        name, description, args = entry[:3]
+        ttl = entry[3] if len(entry) > 3 else 0
+        commands.append(Command(f"{peer}: {name}", description, RemoteCommand(mac, name, ttl, params=args or ())))
+    return commands
+
+
+async def discover_commands(transport, registry=None, timeout=5.0, config_dir=CONFIG_DIR):
+    """Discover peers, save their configs and return their Commands, registering them if registry is given."""
+    results = await DiscoveryEngine(transport).discover(timeout)
+    commands = []
+    for mac, document in results.items():
+        if config_dir is not None:
+            save_peer_config(mac, document, config_dir)
+        commands.extend(peer_commands(mac, document))
+    if registry is not None:
+        from command_registry import register_command
+        for command in commands:
+            register_command(command, registry)
+    return commands
+
+
+class ESPNowTransport:
+    """Transport over the ESP-NOW radio. ESP-NOW only sends to registered peers and the peer table is
+    small, so unicast peers are added on first use and the least recently added is dropped when full."""
+
+    MAX_PEERS = 16
+
+    def __init__(self, espnow_instance=None):
+        import espnow
+        self.espnow = espnow
+        self.e = espnow_instance or espnow.ESPNow()
+        self.broadcast = espnow.Peer(mac=BROADCAST)
+        self.e.peers.append(self.broadcast)
+        self.peers = {}   # mac -> espnow.Peer for unicast peers
+        self.order = []   # unicast MACs in the order they were added
+
+    def send(self, mac, data):
+        mac = bytes(mac)
+        if mac == BROADCAST:
+            peer = self.broadcast
+        else:
+            peer = self.peers.get(mac)
+            if peer is None:
+                if len(self.order) >= self.MAX_PEERS:
+                    self.e.peers.remove(self.peers.pop(self.order.pop(0)))
+                peer = self.espnow.Peer(mac=mac)
+                self.e.peers.append(peer)
+                self.peers[mac] = peer
+                self.order.append(mac)
+        self.e.send(data, peer)
+
+    def receive(self):
+        packet = self.e.read()
+        if packet is None:
+            return None
+        return bytes(packet.mac), bytes(packet.msg)
+
+
+class FrameRouter:
+    """Shares one transport between readers of different frame types.
+
+    channel(*kinds) returns a transport whose receive() only yields frames of those types. Frames read
+    on behalf of another channel are queued for it (up to queue_size each, oldest dropped first), so a
+    discovery round running during a remote call does not take the call's results, or the other way
+    round. Frames no channel asked for are dropped.
+    """
+
+    def __init__(self, transport, queue_size=64):
+        self.transport = transport
+        self.queue_size = queue_size
+        self.queues = {}  # frame type -> [(mac, data), ...]
+
+    def channel(self, *kinds):
+        for kind in kinds:
+            self.queues.setdefault(kind, [])
+        return RoutedTransport(self, kinds)
+
+    def send(self, mac, data):
+        self.transport.send(mac, data)
+
+    def receive(self, kinds):
+        for kind in kinds:
+            queue = self.queues[kind]
+            if queue:
+                return queue.pop(0)
+        while True:
+            packet = self.transport.receive()
+            if packet is None:
+                return None
+            data = packet[1]
+            kind = data[0] if data else None
+            if kind in kinds:
+                return packet
+            queue = self.queues.get(kind)
+            if queue is not None:
+                if len(queue) >= self.queue_size:
+                    queue.pop(0)
+                queue.append(packet)
+
+
+class RoutedTransport:
+    """One FrameRouter channel: send() goes straight out, receive() returns only its frame types."""
+
+    def __init__(self, router, kinds):
+        self.router = router
+        self.kinds = kinds
+
+    def send(self, mac, data):
+        self.router.send(mac, data)
+
+    def receive(self):
+        return self.router.receive(self.kinds)
+
+
+_transport = None
+
+
+def get_transport():
+    """The FrameRouter over the ESPNowTransport shared by discovery and remote commands (the radio
+    supports one ESPNow instance). Readers take a channel() for the frame types they handle."""
+    global _transport
+    if _transport is None:
+        _transport = FrameRouter(ESPNowTransport())
+    return _transport
+
+
+def manage_espnow(registry=None):
+    """Discover the commands of the gadgets in range over ESP-NOW and return them."""
+    import asyncio
+    commands = asyncio.run(discover_commands(get_transport().channel(MSG_SIGNATURES), registry))
+    print(f"Discovered {len(commands)} peer commands")
+    return commands
 
 
 if __name__ == '__main__':
-    manage_espnow() 
\ No newline at end of file
+    manage_espnow()
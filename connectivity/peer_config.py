@@ -0,0 +1,173 @@
+'''peer_config.py - Cached loading of the peer configs in espnow_manager.CONFIG_DIR on the SD card.
+
+Each peer gadget has a file named after its MAC (12 hex digits, see espnow_manager.save_peer_config)
+holding its name and commands. PeerConfigStore keeps an index of
+those files: for each MAC the file's mtime, size and CRC32 and the parsed name and commands. On
+refresh() only files whose mtime or size changed are read, and only those whose CRC changed as well
+are parsed again. The index is saved to index.json in the same directory, so a boot with no changed
+files does one listdir, one stat per file and one read of the index, and parses no config file at all.
+Everything is read and written once the SD card is mounted; writes go through the storage service's
+atomic replace.
+
+register(registry) adds the commands of every peer to a command registry in one batch and keeps it in
+step with later refreshes: commands of peers whose file changed or disappeared are replaced or removed.
+'''
+
+import binascii
+import json
+import os
+
+from connectivity.espnow_manager import CONFIG_DIR, make_config_dir, peer_commands
+from sd_storage import get_storage
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+
+
+def is_config_name(name):
+    """Config files are named after the peer's MAC: 12 hex digits, no separators."""
+    if len(name) != 12:
+        return False
+    try:
+        int(name, 16)
+    except ValueError:
+        return False
+    return True
+
+
+class PeerConfig:
+    __slots__ = ("mtime", "size", "crc", "name", "commands")
+
+    def __init__(self, mtime, size, crc, name, commands):
+        self.mtime = mtime
+        self.size = size
+        self.crc = crc
+        self.name = name
+        self.commands = commands   # [[name, description, [arg, ...]], ...], plus a cache ttl for some
+
+    def document(self):
+        """The entry as a signature document, the form espnow_manager.peer_commands takes."""
+        return {"name": self.name, "commands": self.commands}
+
+
+def parse_config(data):
+    """Return (name, commands) from the contents of a config file; raises ValueError if it is malformed."""
+    config = json.loads(data)
+    commands = []
+    for command in config.get("commands", ()):
+        if isinstance(command, dict):
+            entry = [command["name"], command.get("description", ""), command.get("args") or []]
+            if command.get("ttl"):
+                entry.append(command["ttl"])
+        else:
+            entry = [command[0], command[1], command[2] or []] + list(command[3:4])
+        commands.append(entry)
+    return config.get("name", ""), commands
+
+
+class PeerConfigStore:
+    def __init__(self, config_dir=CONFIG_DIR, index_path=None):
+        self.config_dir = config_dir
+        self.index_path = index_path or f"{config_dir}/{INDEX_NAME}"
+        self.entries = {}      # file name (MAC hex digits) -> PeerConfig
+        self.registered = {}   # file name -> names of the commands register() added for that peer
+        self.dirty = False     # entries differ from the saved index
+        self.parsed = 0        # config files parsed and read, for benchmarks
+        self.reads = 0
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            get_storage().recover(self.index_path)
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != INDEX_VERSION:
+            return
+        for name, (mtime, size, crc, peer, commands) in index.get("files", {}).items():
+            self.entries[name] = PeerConfig(mtime, size, crc, peer, commands)
+
+    def save(self):
+        """Write the index if it changed since it was loaded or last saved."""
+        if not self.dirty:
+            return
+        files = {name: [e.mtime, e.size, e.crc, e.name, e.commands] for name, e in self.entries.items()}
+        try:
+            make_config_dir(self.config_dir)
+            get_storage().write_atomic(self.index_path, json.dumps({"version": INDEX_VERSION, "files": files}))
+            self.dirty = False
+        except OSError as e:
+            print(f"Could not save peer config index: {e}")
+
+    def refresh(self):
+        """Bring the index up to date with the config files; returns (changed, removed) file names."""
+        try:
+            names = [name for name in os.listdir(self.config_dir) if is_config_name(name)]
+        except OSError:
+            names = []
+        changed = []
+        for name in names:
+            path = f"{self.config_dir}/{name}"
+            stat = os.stat(path)
+            size, mtime = stat[6], stat[8]
+            entry = self.entries.get(name)
+            if entry is not None and entry.mtime == mtime and entry.size == size:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            self.reads += 1
+            crc = binascii.crc32(data)
+            self.dirty = True
+            if entry is not None and entry.crc == crc and entry.size == len(data):
+                entry.mtime = mtime   # rewritten with the same contents
+                continue
+            try:
+                peer, commands = parse_config(data)
+            except (ValueError, KeyError, IndexError, TypeError):
+                print(f"Skipping malformed peer config {name}")
+                if self.entries.pop(name, None) is not None:
+                    changed.append(name)
+                continue
+            self.parsed += 1
+            self.entries[name] = PeerConfig(mtime, size, crc, peer, commands)
+            changed.append(name)
+        present = set(names)
+        removed = [name for name in self.entries if name not in present]
+        for name in removed:
+            del self.entries[name]
+        if removed:
+            self.dirty = True
+        return changed, removed
+
+    def commands(self, name):
+        """Return the Command entries of one peer."""
+        return peer_commands(binascii.unhexlify(name), self.entries[name].document())
+
+    def register(self, registry):
+        """Refresh, then add the commands of new or changed peers to registry and drop those of removed ones.
+
+        Returns how many commands were added. The index is saved afterwards if it changed.
+        """
+        changed, removed = self.refresh()
+        for name in changed + removed:
+            for command_name in self.registered.pop(name, ()):
+                if command_name in registry:
+                    del registry[command_name]
+        commands = []
+        for name in self.entries:
+            if name not in self.registered:
+                peer = self.commands(name)
+                self.registered[name] = [command.name for command in peer]
+                commands.extend(peer)
+        from command_registry import register_commands
+        register_commands(commands, registry)
+        self.save()
+        return len(commands)
+
+
+def register_peer_commands(registry, config_dir=CONFIG_DIR):
+    """Add the commands of every peer with a config file to registry; returns the store for later refreshes."""
+    store = PeerConfigStore(config_dir)
+    store.register(registry)
+    return store
@@ -0,0 +1,264 @@
+'''remote_command.py - Running commands on peer gadgets over ESP-NOW.
+
+A peer command's callback is a RemoteCommand. Calling it returns a coroutine that sends the call to
+the peer and waits for the reply, so Command.execute() on a peer command gives the caller something
+to await. The calls go through a RemoteDispatcher, using the frames of espnow_manager:
+  - MSG_CALL, controller to peer: the sequence number is the request id, and the payload is the JSON
+    [command name, [args], {kwargs}]. A call must fit in one frame.
+  - MSG_RESULT, peer to controller: the same request id, with the JSON [1, value] or [0, error text]
+    split into fragments like a signature document.
+Any number of calls can be in flight at once. Each waits on its own Event, and replies are matched
+to calls by request id and MAC. A call that gets no complete reply within its timeout raises
+asyncio.TimeoutError. Cancelling the awaiting task drops the call, and a late reply is ignored.
+Commands whose signature has a cache TTL, such as sensor reads, keep their results in a
+ResultCache. Calls with the same arguments within that many seconds are answered without the radio.
+
+CommandServer is the peer side. It runs local handlers for MSG_CALL frames and sends back the results.
+'''
+
+import json
+import time
+
+from connectivity.espnow_manager import (MAX_PAYLOAD, MSG_CALL, MSG_RESULT, POLL, fragment, mac_text,
+                                          pack_frame, unpack_frame)
+
+DEFAULT_TIMEOUT = 2.0   # seconds
+IDLE_CHECK = 0.05       # seconds the receiver waits for a packet before checking whether any call is still pending
+
+
+class RemoteError(Exception):
+    """The peer ran the command and it failed; the message is the peer's error text."""
+
+
+class AsyncTransport:
+    """Async interface over a polled transport (send(mac, data), receive() -> (mac, data) or None)."""
+
+    def __init__(self, transport, poll=POLL):
+        self.transport = transport
+        self.poll = poll
+
+    async def send(self, mac, data):
+        self.transport.send(mac, data)
+
+    async def receive(self, timeout=None):
+        """Wait for the next packet and return (mac, data), or None if none arrived within timeout seconds."""
+        import asyncio
+        waited = 0
+        while True:
+            packet = self.transport.receive()
+            if packet is not None:
+                return packet
+            if timeout is not None and waited >= timeout:
+                return None
+            await asyncio.sleep(self.poll)
+            waited += self.poll
+
+
+class ResultCache:
+    def __init__(self, clock=time.monotonic, capacity=32):
+        self.clock = clock
+        self.capacity = capacity
+        self.entries = {}   # key -> (expiry time, value)
+
+    def get(self, key):
+        """Return (True, value) for a live entry, else (False, None)."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        if self.clock() >= entry[0]:
+            del self.entries[key]
+            return False, None
+        return True, entry[1]
+
+    def put(self, key, value, ttl):
+        if len(self.entries) >= self.capacity and key not in self.entries:
+            now = self.clock()
+            for stale in [k for k, (expiry, _) in self.entries.items() if expiry <= now]:
+                del self.entries[stale]
+            if len(self.entries) >= self.capacity:
+                del self.entries[min(self.entries, key=lambda k: self.entries[k][0])]
+        self.entries[key] = (self.clock() + ttl, value)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class PendingCall:
+    __slots__ = ("mac", "event", "fragments", "received", "result")
+
+    def __init__(self, mac, event):
+        self.mac = mac
+        self.event = event
+        self.fragments = None
+        self.received = 0
+        self.result = None
+
+    def add(self, index, count, payload):
+        """Store one fragment of the reply; returns True once the reply is complete."""
+        if self.fragments is None:
+            self.fragments = [None] * count
+        if index >= len(self.fragments) or self.fragments[index] is not None:
+            return False
+        self.fragments[index] = bytes(payload)
+        self.received += 1
+        return self.received == len(self.fragments)
+
+
+class RemoteDispatcher:
+    def __init__(self, transport, cache=None):
+        """transport: An AsyncTransport, or anything with the same async send and receive."""
+        self.transport = transport
+        self.cache = cache if cache is not None else ResultCache()
+        self.pending = {}       # request id -> PendingCall
+        self.next_id = 0
+        self._receiver = None   # task reading replies while calls are pending
+        self.calls = 0          # calls sent, cache hits and timeouts, for benchmarks
+        self.cache_hits = 0
+        self.timeouts = 0
+
+    def _request_id(self):
+        while True:
+            self.next_id = (self.next_id + 1) & 0xFFFF
+            if self.next_id not in self.pending:
+                return self.next_id
+
+    def handle(self, mac, data):
+        """Route one received packet to the call it answers; other packets are ignored."""
+        frame = unpack_frame(data)
+        if frame is None or frame[0] != MSG_RESULT:
+            return
+        kind, request_id, index, count, payload = frame
+        call = self.pending.get(request_id)
+        if call is None or call.mac != bytes(mac) or call.result is not None:
+            return
+        if call.add(index, count, payload):
+            try:
+                call.result = json.loads(b"".join(call.fragments))
+            except ValueError:
+                call.result = [0, "malformed reply"]
+            call.event.set()
+
+    async def _receive_replies(self):
+        try:
+            while self.pending:
+                packet = await self.transport.receive(IDLE_CHECK)
+                if packet is not None:
+                    self.handle(*packet)
+        finally:
+            self._receiver = None
+
+    async def call(self, mac, name, args=(), kwargs=None, timeout=DEFAULT_TIMEOUT, ttl=0):
+        """Run command name on the peer at mac and return its result.
+
+        Raises asyncio.TimeoutError if no complete reply arrives within timeout seconds, and RemoteError
+        if the command failed on the peer. With ttl > 0, a result is cached for ttl seconds and reused for
+        calls with the same arguments.
+        """
+        import asyncio
+        mac = bytes(mac)
+        key = None
+        if ttl:
+            key = (mac, name, json.dumps([list(args), kwargs or {}]))
+            hit, value = self.cache.get(key)
+            if hit:
+                self.cache_hits += 1
+                return value
+        payload = json.dumps([name, list(args), kwargs or {}]).encode()
+        if len(payload) > MAX_PAYLOAD:
+            raise ValueError("call to %s does not fit in one frame" % name)
+        request_id = self._request_id()
+        call = PendingCall(mac, asyncio.Event())
+        self.pending[request_id] = call
+        try:
+            await self.transport.send(mac, pack_frame(MSG_CALL, request_id, payload))
+            self.calls += 1
+            if self._receiver is None:
+                self._receiver = asyncio.create_task(self._receive_replies())
+            try:
+                await asyncio.wait_for(call.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+        finally:
+            del self.pending[request_id]
+        ok, value = call.result
+        if not ok:
+            raise RemoteError(value)
+        if key is not None:
+            self.cache.put(key, value, ttl)
+        return value
+
+
+_dispatcher = None
+
+
+def get_dispatcher():
+    """The dispatcher RemoteCommands use by default, over the shared ESP-NOW radio."""
+    global _dispatcher
+    if _dispatcher is None:
+        from connectivity.espnow_manager import get_transport
+        _dispatcher = RemoteDispatcher(AsyncTransport(get_transport().channel(MSG_RESULT)))
+    return _dispatcher
+
+
+class RemoteCommand:
+    """Callback of a peer command: calling it returns a coroutine that runs the command on the peer.
+
+    params holds the argument names from the peer's signature; they describe the command in its schema
+    and are not values, so the Command itself carries no fixed args.
+    """
+
+    __slots__ = ("mac", "name", "ttl", "timeout", "dispatcher", "params")
+
+    def __init__(self, mac, name, ttl=0, timeout=DEFAULT_TIMEOUT, dispatcher=None, params=()):
+        self.mac = bytes(mac)
+        self.name = name
+        self.ttl = ttl
+        self.timeout = timeout
+        self.dispatcher = dispatcher
+        self.params = tuple(params)
+
+    def __call__(self, *args, **kwargs):
+        dispatcher = self.dispatcher or get_dispatcher()
+        return dispatcher.call(self.mac, self.name, args, kwargs, self.timeout, self.ttl)
+
+    def __repr__(self):
+        return "<RemoteCommand %s on %s>" % (self.name, mac_text(self.mac))
+
+
+class CommandServer:
+    """The peer side: runs handlers for MSG_CALL frames and replies with their results."""
+
+    def __init__(self, transport, handlers):
+        """handlers: Dict of command name -> function; its return value must be JSON-serializable."""
+        self.transport = transport
+        self.handlers = handlers
+
+    def handle(self, mac, data):
+        frame = unpack_frame(data)
+        if frame is None or frame[0] != MSG_CALL:
+            return
+        request_id = frame[1]
+        try:
+            name, args, kwargs = json.loads(frame[4])
+            handler = self.handlers.get(name)
+            if handler is None:
+                reply = [0, "unknown command %s" % name]
+            else:
+                reply = [1, handler(*args, **kwargs)]
+        except Exception as e:
+            reply = [0, str(e)]
+        try:
+            parts = fragment(json.dumps(reply).encode())
+        except ValueError as e:
+            parts = fragment(json.dumps([0, str(e)]).encode())
+        for i, part in enumerate(parts):
+            self.transport.send(mac, pack_frame(MSG_RESULT, request_id, part, i, len(parts)))
+
+    def poll(self):
+        """Answer every call waiting on the transport."""
+        while True:
+            received = self.transport.receive()
+            if received is None:
+                return
+            self.handle(*received)
@@ -1,12 +1,395 @@
-'''wifi_network.py - Stub for WiFi network connection functionality.
+'''wifi_network.py - Wi-Fi network selection, saved credentials and background connecting.
 
 This module uses the menu interface to allow the user to select a WiFi network, enter a password, and optionally set a default network for boot.
+
+Nothing here blocks the UI for a whole scan or connect:
+  - WiFiManager.scan() scans one channel at a time and yields to the other tasks between channels.
+    Results go into a NetworkTable: one record per SSID (its strongest access point), sorted by
+    RSSI and dropped STALE_AFTER seconds after it was last seen. The menu lists the table as it is,
+    so it opens at once. The background task rescans every SCAN_INTERVAL seconds.
+  - Saved networks are kept on the SD card in a CredentialStore: one JSON file with the passwords
+    keyed by SSID and the default network, loaded once and looked up by SSID. It is rewritten with
+    the storage service's atomic replace, so a crash while saving does not lose the saved networks.
+  - WiFiManager.start() starts the background scan and a periodic scheduler job that connects to
+    the saved networks the latest scan saw (the default first, then by signal). Each run of the job
+    makes at most one attempt, between the menu's key polls; once every network of a round failed,
+    the next round waits a backoff that doubles up to RETRY_MAX. Each connect passes the channel and
+    BSSID found by the scan, so the radio does not scan again. wifi.radio.connect() still blocks the
+    event loop for that one attempt: a network in range answers well within it, but one that does
+    not answer holds the menu for CONNECT_TIMEOUT, so that is kept short, and networks that have
+    dropped out of the scan are not tried at all.
+The credentials file is read on first use. If the SD card is not mounted yet (at boot), the attempt
+counts as failed and the next retry reads it again.
 '''
 
+import json
+import os
+import time
+
+from sd_storage import get_storage
+
+SCAN_INTERVAL = 30        # seconds between background scans while not connected
+CONNECTED_SCAN_INTERVAL = 120
+STALE_AFTER = 90          # seconds a network stays listed after it was last seen
+CHANNELS = range(1, 12)
+CONNECT_TIMEOUT = 2       # seconds; blocks the UI loop for this long when an access point does not answer
+CONNECT_TICK = 1          # seconds between runs of the connect job, each making at most one attempt
+RETRY_BASE = 2            # seconds before the first retry; doubles up to RETRY_MAX
+RETRY_MAX = 60
+CREDENTIALS_FILE = "wifi.json"
+
+RESCAN = "Rescan"
+
+
+class NetworkRecord:
+    __slots__ = ("ssid", "bssid", "rssi", "channel", "secure", "seen")
+
+    def __init__(self, ssid, bssid, rssi, channel, secure, seen):
+        self.ssid = ssid
+        self.bssid = bssid
+        self.rssi = rssi
+        self.channel = channel
+        self.secure = secure
+        self.seen = seen
+
+    def label(self):
+        return "%s  %d dBm%s" % (self.ssid, self.rssi, "" if self.secure else "  open")
+
+
+class NetworkTable:
+    def __init__(self, max_age=STALE_AFTER, clock=time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self.networks = {}      # ssid -> NetworkRecord
+        self.round_start = 0    # start of the current scan
+        self.last_round = 0     # start of the latest finished scan
+        self.version = 0        # bumped whenever the listing changes
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.networks)
+
+    def start_round(self):
+        self.round_start = self.clock()
+
+    def end_round(self):
+        """Finish the current scan: networks it did not see are no longer in range, old ones expire."""
+        self.last_round = self.round_start
+        self.expire()
+
+    def in_range(self, record):
+        """Whether the latest finished scan (or the one under way) saw the network."""
+        return record.seen >= self.last_round
+
+    def observe(self, network):
+        """Add one scan result. An SSID keeps its strongest access point of the current scan."""
+        ssid = network.ssid
+        if not ssid:
+            return
+        now = self.clock()
+        bssid = bytes(network.bssid)
+        record = self.networks.get(ssid)
+        if record is None:
+            import wifi
+            secure = wifi.AuthMode.OPEN not in network.authmode
+            self.networks[ssid] = NetworkRecord(ssid, bssid, network.rssi, network.channel, secure, now)
+        elif record.bssid == bssid or network.rssi > record.rssi or record.seen < self.round_start:
+            if record.rssi == network.rssi and record.bssid == bssid:
+                record.seen = now
+                return
+            record.bssid = bssid
+            record.rssi = network.rssi
+            record.channel = network.channel
+            record.seen = now
+        else:
+            return
+        self._sorted = None
+        self.version += 1
+
+    def expire(self):
+        """Drop networks not seen for max_age seconds."""
+        limit = self.clock() - self.max_age
+        stale = [ssid for ssid, record in self.networks.items() if record.seen < limit]
+        for ssid in stale:
+            del self.networks[ssid]
+        if stale:
+            self._sorted = None
+            self.version += 1
+
+    def by_signal(self):
+        """The records, strongest first."""
+        if self._sorted is None:
+            self._sorted = sorted(self.networks.values(), key=lambda record: -record.rssi)
+        return self._sorted
+
+    def get(self, ssid):
+        return self.networks.get(ssid)
+
+
+class CredentialStore:
+    def __init__(self, path=None):
+        if path is None:
+            from command_registry import SD_ROOT
+            path = f"{SD_ROOT}/{CREDENTIALS_FILE}"
+        self.path = path
+        self.passwords = {}   # ssid -> password
+        self.default = None
+        self.loaded = False
+
+    def load(self):
+        """Read the file; returns False if it cannot be read yet (SD card not mounted). A missing file is empty."""
+        try:
+            get_storage().recover(self.path)
+            with open(self.path) as f:
+                data = json.load(f)
+        except ValueError:
+            data = {}
+        except OSError:
+            directory = self.path.rsplit("/", 1)[0]
+            try:
+                os.stat(directory)
+            except OSError:
+                return False
+            data = {}
+        self.passwords = data.get("networks", {})
+        self.default = data.get("default")
+        self.loaded = True
+        return True
+
+    def get(self, ssid):
+        return self.passwords.get(ssid)
+
+    def save(self):
+        get_storage().write_atomic(self.path, json.dumps({"default": self.default, "networks": self.passwords}))
+
+    def remember(self, ssid, password, default=False):
+        if not self.loaded:
+            self.load()
+        self.passwords[ssid] = password
+        if default:
+            self.default = ssid
+        self.save()
+
+    def forget(self, ssid):
+        if not self.loaded:
+            self.load()
+        self.passwords.pop(ssid, None)
+        if self.default == ssid:
+            self.default = None
+        self.save()
+
+
+class WiFiManager:
+    def __init__(self, radio=None, table=None, credentials=None, clock=time.monotonic):
+        if radio is None:
+            import wifi
+            radio = wifi.radio
+        self.radio = radio
+        self.table = table if table is not None else NetworkTable(clock=clock)
+        self.credentials = credentials if credentials is not None else CredentialStore()
+        self.clock = clock
+        self.state = "idle"        # idle, connecting, waiting (for a retry) or connected
+        self.ssid = None           # network connected to
+        self.attempts = 0
+        self.scans = 0
+        import asyncio
+        self._lock = asyncio.Lock()       # the radio cannot scan and connect at once
+        self._scanner = None
+        self._scheduler = None
+        self._connector = None     # the periodic connect job
+        self._round = []           # networks left to try in this round
+        self._retry_at = 0
+        self._delay = RETRY_BASE
+
+    async def scan(self, observe=None):
+        """Scan every channel into the table, yielding between channels.
+
+        observe: Optional function also called with every access point found, for other users of the
+        scan results (the connection logger) that need more than the table keeps.
+        """
+        import asyncio
+        table = self.table
+        async with self._lock:
+            table.start_round()
+            for channel in CHANNELS:
+                try:
+                    for network in self.radio.start_scanning_networks(start_channel=channel, stop_channel=channel):
+                        table.observe(network)
+                        if observe is not None:
+                            observe(network)
+                finally:
+                    self.radio.stop_scanning_networks()
+                await asyncio.sleep(0)
+        table.end_round()
+        self.scans += 1
+
+    async def scan_forever(self):
+        import asyncio
+        while True:
+            try:
+                await self.scan()
+            except Exception as e:
+                print(f"Wi-Fi scan failed: {e}")
+            await asyncio.sleep(CONNECTED_SCAN_INTERVAL if self.radio.connected else SCAN_INTERVAL)
+
+    def start_scanning(self):
+        """Start the background scan task if it is not running."""
+        import asyncio
+        if self._scanner is None or self._scanner.done():
+            self._scanner = asyncio.create_task(self.scan_forever())
+        return self._scanner
+
+    def stop_scanning(self):
+        if self._scanner is not None:
+            self._scanner.cancel()
+            self._scanner = None
+        self._scheduler = None
+        self._connector = None     # the periodic connect job
+        self._round = []           # networks left to try in this round
+        self._retry_at = 0
+        self._delay = RETRY_BASE
+
+    def candidates(self):
+        """Saved networks the latest scan saw: the default first, then by signal strength."""
+        credentials = self.credentials
+        table = self.table
+        known = [record for record in table.by_signal()
+                 if table.in_range(record) and credentials.get(record.ssid) is not None]
+        default = self.table.get(credentials.default) if credentials.default else None
+        if default in known:
+            known.remove(default)
+            known.insert(0, default)
+        return known
+
+    async def connect(self, ssid, password):
+        """Connect to ssid; returns True on success."""
+        record = self.table.get(ssid)
+        channel = record.channel if record is not None else 0
+        bssid = record.bssid if record is not None else None
+        async with self._lock:
+            self.state = "connecting"
+            self.attempts += 1
+            try:
+                self.radio.connect(ssid, password, channel=channel, bssid=bssid, timeout=CONNECT_TIMEOUT)
+            except (ConnectionError, OSError) as e:
+                print(f"Could not connect to {ssid}: {e}")
+                self.state = "idle"
+                return False
+        self.state = "connected"
+        self.ssid = ssid
+        return True
+
+    def _wait(self):
+        """End a connect round: the next one starts after the backoff, which doubles each time."""
+        self.state = "waiting"
+        self._round = []
+        self._retry_at = self.clock() + self._delay
+        self._delay = min(self._delay * 2, RETRY_MAX)
+
+    async def connect_step(self):
+        """One run of the connect job: try the next saved network in range, if any is due.
+
+        Makes at most one connect attempt, so the UI loop is held for one CONNECT_TIMEOUT at most.
+        Returns the SSID once connected, else None. A dropped connection is picked up again.
+        """
+        if self.radio.connected:
+            self.state = "connected"
+            self._delay = RETRY_BASE
+            return self.ssid
+        if self.clock() < self._retry_at:
+            return None
+        if not self._round:
+            if not (self.credentials.loaded or self.credentials.load()):
+                self._wait()
+                return None
+            if not self.candidates() and (self._scanner is None or self._scanner.done()):
+                await self.scan()
+            self._round = self.candidates()
+            if not self._round:
+                self._wait()
+                return None
+        record = self._round.pop(0)
+        if await self.connect(record.ssid, self.credentials.get(record.ssid)):
+            self._round = []
+            self._delay = RETRY_BASE
+            return record.ssid
+        if not self._round:
+            self._wait()
+        return None
+
+    def start(self, scheduler=None):
+        """Background Wi-Fi at boot: keep the network table fresh and connect to a saved network.
+
+        Connecting is a periodic job of scheduler (the shared one by default); returns the job.
+        """
+        if scheduler is None:
+            from scheduler import get_scheduler
+            scheduler = get_scheduler()
+        self.start_scanning()
+        if self._connector is None or not self._connector.active:
+            self._scheduler = scheduler
+            self._connector = scheduler.every(CONNECT_TICK, "Wi-Fi connect", self.connect_step)
+        return self._connector
+
+    def stop(self):
+        """Stop the background scan and the connect job."""
+        self.stop_scanning()
+        if self._connector is not None:
+            self._scheduler.cancel(self._connector)
+            self._connector = None
+
+
+_manager = None
+
+
+def get_wifi_manager():
+    """The WiFiManager shared by the boot job and the menu."""
+    global _manager
+    if _manager is None:
+        _manager = WiFiManager()
+    return _manager
+
+
+async def run_wifi_menu(manager=None, source=None):
+    """Pick a network from the scan table, enter its password if it is not saved, and connect.
+
+    Returns the SSID connected to, or None.
+    """
+    from interface_modules.menu_interface import run_menu, read_text
+    manager = manager or get_wifi_manager()
+    manager.start_scanning()
+    while True:
+        records = list(manager.table.by_signal())
+        options = [record.label() for record in records] + [RESCAN]
+        selected = await run_menu(options, source)
+        if selected is None:
+            return None
+        if selected < len(records):
+            break
+        await manager.scan()
+    record = records[selected]
+    credentials = manager.credentials
+    if not credentials.loaded:
+        credentials.load()
+    password = credentials.get(record.ssid)
+    if password is None:
+        password = "" if not record.secure else await read_text(f"Password for {record.ssid}: ", source, secret=True)
+        if password is None:
+            return None
+    if not await manager.connect(record.ssid, password):
+        return None
+    default = await run_menu([f"Connect to {record.ssid} at boot", "Only this time"], source) == 0
+    try:
+        credentials.remember(record.ssid, password, default)
+    except OSError as e:
+        print(f"Could not save Wi-Fi credentials: {e}")
+    return record.ssid
+
+
 def wifi_menu():
-    # TODO: Implement the WiFi network menu interface for selecting network and entering password
-    pass
+    import asyncio
+    return asyncio.run(run_wifi_menu())
 
 
 if __name__ == '__main__':
-    wifi_menu() 
\ No newline at end of file
+    wifi_menu()
@@ -1,197 +1,302 @@
-'''menu_interface.py - Stub for a terminal-style selection menu interface.
+'''menu_interface.py - Selection menus and text entry on the Cardputer display.
 
-This module provides a simple menu that supports highlighted selection, pagination, and scrolling for long entries.
-Scrolling definitely doesn't work.
+Menu holds the state of a selection menu (highlight, pages, scrolling of long entries, type-to-filter)
+and run_menu() drives it on a UIEventLoop; display_menu() is the blocking form for callers outside
+asyncio. run_command_menu() and display_command_menu() list a command registry or CommandIndex and return
+the Command picked, and read_text() prompts for a line of text (passwords with secret=True).
 '''
 
-def display_menu(options):
-    """Display a list of options with highlighted selection and pagination using displayio."""
-    import board
-    import displayio
-    import terminalio
-    from adafruit_display_text import label
-    import time
-    import cardputer_keyboard
-    import sys
+from interface_modules.menu_renderer import SELECTED_COLOR, NORMAL_COLOR, format_option, LayoutCache
+from profiler import profiled, section
+
+SCROLL_DELAY = 0.3  # seconds between scroll steps of the highlighted option
+
+_KEY = section("menu.key")
+_REDRAW = section("menu.redraw")
+
+
+class Menu:
+    """Selection, pagination, scrolling and filter state of a menu, with the UI loop callbacks that change it.
+
+    Line texts come from a LayoutCache, so scrolling and redrawing between key presses only index into
+    precomputed strings instead of re-partitioning and slicing option text. Only the visible window of
+    options is ever laid out, so the length of the option list does not affect a redraw.
+
+    Keys: w/s or UP/DOWN move one line, PGUP/PGDN one page, HOME/END jump to the first/last option.
+    '/' starts type-to-filter: typed characters narrow the list, backspace removes one, ESC drops the
+    filter and Enter selects the highlighted match. ESC outside the filter closes the menu without a selection.
+    """
+
+    def __init__(self, options, renderer, visible_count, available_total, search_index=None, prompt=None):
+        """
+        search_index: option_search.SearchIndex over options, or a function returning one; called, or
+            built from options if not given, on the first '/'.
+        prompt: Optional function called with the text to show for the filter query ("" when not filtering).
+        """
+        self.options = options
+        self.view = options  # options currently listed: all of them, or a FilteredOptions
+        self.renderer = renderer
+        self.visible_count = visible_count
+        self.layouts = LayoutCache(options, available_total)
+        self.search_index = search_index
+        self.filter = None    # OptionFilter while type-to-filter is active
+        self.prompt = prompt
+        self.prompt_text = None
+        self.selected = 0
+        self.page = 0
+        self.scroll = 0
+        self.frames = ()  # scroll frames of the selected option
+        self.loop = None
+        self.cancelled = False
+
+    def select(self, index):
+        """Highlight option index of the current view, scrolling the page to it if needed."""
+        if index < self.page:
+            self.page = index
+        elif index >= self.page + self.visible_count:
+            self.page = index - self.visible_count + 1
+        self.selected = index
+        self.layouts.retain(self.page, self.page + self.visible_count)
+        self.frames = self.layouts.frames(index) if index < len(self.view) else ()
+        self.scroll = 0
+        if self.loop is not None:
+            self.loop.set_timer(len(self.frames) > 1)
+
+    def selected_option(self):
+        """Return the index in options of the highlighted option, or None if the filter matches nothing or the menu was closed."""
+        if self.cancelled or self.selected >= len(self.view):
+            return None
+        if self.view is self.options:
+            return self.selected
+        return self.view.source_index(self.selected)
+
+    def resize(self, available_total):
+        """Re-layout all options for a new line width."""
+        self.layouts.invalidate(self.view, available_total)
+        self.select(self.selected)
+
+    def start_filter(self):
+        from interface_modules.option_search import OptionFilter
+        if self.search_index is None:
+            from interface_modules.option_search import SearchIndex
+            self.search_index = SearchIndex(self.options)
+        elif callable(self.search_index):
+            self.search_index = self.search_index()
+        self.filter = OptionFilter(self.search_index)
+
+    def set_filter(self, matches):
+        """Show only the options numbered in matches (all of them for None), keeping the selection if it is listed."""
+        from interface_modules.option_search import FilteredOptions
+        current = self.selected_option()
+        if matches is None:
+            view = self.options
+            index = current if current is not None else 0
+        else:
+            view = FilteredOptions(self.options, matches)
+            index = 0
+            if current is not None and current in matches:
+                index = matches.index(current)
+        self.view = view
+        self.layouts.invalidate(view)
+        self.page = 0
+        self.select(index)
+
+    def on_timer(self):
+        self.scroll += 1
+        if self.scroll >= len(self.frames):
+            self.scroll = 0
+
+    def on_key(self, key):
+        with _KEY:
+            return self._handle_key(key)
+
+    def _handle_key(self, key):
+        if key in ("\n", "\r"):
+            return self.selected_option() is not None
+        last = len(self.view) - 1
+        selected_index = self.selected
+        if self.filter is not None and key not in ("UP", "DOWN", "PGUP", "PGDN", "HOME", "END"):
+            if key == "ESC":
+                self.filter = None
+                self.set_filter(None)
+            elif key in ("\x7f", "\x08"):
+                self.set_filter(self.filter.backspace())
+            elif len(key) == 1 and key >= " ":
+                self.set_filter(self.filter.type(key))
+            return False
+        if key in ("w", "UP"):
+            if selected_index > 0:
+                selected_index -= 1
+        elif key in ("s", "DOWN"):
+            if selected_index < last:
+                selected_index += 1
+        elif key == "PGUP":
+            selected_index = max(0, selected_index - self.visible_count)
+        elif key == "PGDN":
+            selected_index = max(0, min(last, selected_index + self.visible_count))
+        elif key == "HOME":
+            selected_index = 0
+        elif key == "END":
+            selected_index = max(0, last)
+        elif key == "/":
+            self.start_filter()
+            return False
+        elif key == "ESC":
+            self.cancelled = True
+            return True
+        if selected_index != self.selected:
+            self.select(selected_index)
+        return False
+
+    def redraw(self):
+        # The renderer only touches lines whose text or color changed
+        with _REDRAW:
+            renderer = self.renderer
+            count = len(self.view)
+            for i in range(self.visible_count):
+                option_index = self.page + i
+                if option_index >= count:
+                    renderer.set_line(i, "")
+                elif option_index == self.selected:
+                    renderer.set_line(i, self.frames[self.scroll], SELECTED_COLOR)
+                else:
+                    renderer.set_line(i, self.layouts.normal(option_index), NORMAL_COLOR)
+            if self.prompt is not None:
+                text = "" if self.filter is None else f"/{self.filter.query}  ({count} found)"
+                if text != self.prompt_text:
+                    self.prompt(text)
+                    self.prompt_text = text
+
+
+@profiled("menu.display")
+def display_menu(options, source=None):
+    """Display a list of options with highlighted selection and pagination using displayio.
 
-    # Create the main display group
-    main_group = displayio.Group()
+    Returns the index of the option selected with Enter, or None if the menu was closed with ESC.
+    """
+    import asyncio
+    return asyncio.run(run_menu(options, source))
 
-    # Create a full-screen black background
-    splash_bitmap = displayio.Bitmap(board.DISPLAY.width, board.DISPLAY.height, 1)
-    splash_palette = displayio.Palette(1)
-    splash_palette[0] = 0x000000  # black
-    bg_sprite = displayio.TileGrid(splash_bitmap, pixel_shader=splash_palette, x=0, y=0)
-    main_group.append(bg_sprite)
 
+def open_menu_screen(options, search_index=None):
+    """Lay out the menu on the shared scene and return its Menu, ready for select(0) and a UI loop."""
+    import board
+    import terminalio
+    from interface_modules.menu_renderer import LineRenderer
+    from interface_modules.screen_manager import get_screen_manager
+    from interface_modules.status_bar import get_status_bar, STATUS_BAR_HEIGHT
+
+    screen = get_screen_manager()
+    screen.open()
 
     # Calculate line spacing and visible lines, accounting for the status bar height
-    line_height = terminalio.FONT.get_bounding_box()[1]  # font height
+    char_width, line_height = terminalio.FONT.get_bounding_box()[:2]
     spacing = 2
     line_spacing = line_height + spacing
-    status_bar_height = 20  # Height of status bar area
+    status_bar_height = STATUS_BAR_HEIGHT
     visible_count = (board.DISPLAY.height - status_bar_height) // line_spacing
 
-    # Initialize pagination and selection
-    selected_index = 0
-    page_offset = 0
-
-    # Create label objects for each visible line (reuse them during updates)
+    # One pooled label per visible line (reused during updates)
     labels = []
     for i in range(visible_count):
-        option_index = page_offset + i
-        if option_index < len(options):
-            if option_index == selected_index:
-                text = "> " + options[option_index]
-                text_color = 0x00FF00
-            else:
-                text = "  " + options[option_index]
-                text_color = 0x007700
-        else:
-            text = ""
-            text_color = 0x007700
-        lbl = label.Label(
-            terminalio.FONT, 
-            text=text, 
-            color=text_color, 
-            x=2, 
-            y=status_bar_height + i * line_spacing + line_height
-        )
-        labels.append(lbl)
-        main_group.append(lbl)
-
-    display = board.DISPLAY
-    # Show the menu
-    display.root_group = main_group
+        labels.append(screen.label(2, status_bar_height + i * line_spacing + line_height, "", NORMAL_COLOR))
+    renderer = LineRenderer(labels)
+
+    available_total = (board.DISPLAY.width - 4) // char_width
+    # The status bar also shows the filter query while filtering
+    return Menu(options, renderer, visible_count, available_total, search_index, get_status_bar().set_message)
+
+
+async def run_menu(options, source=None, search_index=None):
+    """Async version of display_menu, for callers that run other tasks alongside the menu.
+
+    source: Key source for the UI loop; defaults to the serial console.
+    search_index: option_search.SearchIndex over options for type-to-filter, or a function returning one.
+    """
+    import asyncio
+    import cardputer_keyboard
+    from interface_modules.ui_loop import UIEventLoop, StdinKeySource
+
+    menu = open_menu_screen(options, search_index)
 
     print("Use 'w' to move up, 's' to move down, and press Enter to select the highlighted option.")
+    print("PgUp/PgDn move a page, Home/End jump to the first/last option, '/' filters the list and Esc closes the menu.")
     cardputer_keyboard.attach_serial()
 
-    # Interactive loop using non-blocking serial input and scrolling for long highlighted text
-    last_scroll_time = time.monotonic()
-    scroll_delay = 0.3
-    scroll_offset = 0
-    char_width = terminalio.FONT.get_bounding_box()[0]
-    available_chars = (display.width - 4) // char_width
-    available_total = available_chars
-
-    while True:
-        current_time = time.monotonic()
-        # Recalculate available characters for option text (not including prefix) each loop iteration
-        available_chars = (display.width - 4) // char_width
-        available_total = available_chars
-
-        # Determine the text portion to scroll for the highlighted option
-        current_text = options[selected_index]
-        if ':' in current_text:
-            static, sep, scroll_text = current_text.partition(':')
-            static = static + sep
-            available_for_scroll = available_total - len(static) - 1  # one space between static and scroll
-            if available_for_scroll < 0:
-                available_for_scroll = 0
-            text_to_scroll = scroll_text.strip()
-        else:
-            text_to_scroll = current_text
-            available_for_scroll = available_total
-
-        # Update scroll offset if the text to scroll exceeds available space
-        if len(text_to_scroll) > available_for_scroll and (current_time - last_scroll_time >= scroll_delay):
-            last_scroll_time = current_time
-            scroll_offset = (scroll_offset + 1) % (len(text_to_scroll) + 3)  # add gap of 3 spaces
-
-        # Update all visible labels with potential scrolling for the highlighted option
-        for i in range(visible_count):
-            option_index = page_offset + i
-            if option_index < len(options):
-                if option_index == selected_index:
-                    prefix = "> "
-                    text = options[option_index]
-                    # If the text has a colon, keep the static part and scroll only the remainder
-                    if ':' in text:
-                        static, sep, scroll_text = text.partition(':')
-                        static = static + sep
-                        available_for_scroll = available_total - len(static) - 1
-                        if available_for_scroll < 0:
-                            available_for_scroll = 0
-                        if len(scroll_text.strip()) > available_for_scroll:
-                            extended = scroll_text.strip() + "   "
-                            display_scroll = extended[scroll_offset:scroll_offset+available_for_scroll]
-                        else:
-                            display_scroll = scroll_text.strip()
-                        display_text = static + " " + display_scroll
-                    else:
-                        if len(text) > available_total:
-                            extended = text + "   "
-                            display_text = extended[scroll_offset:scroll_offset+available_total]
-                        else:
-                            display_text = text
-                    labels[i].text = prefix + display_text
-                    labels[i].color = 0x00FF00
-                else:
-                    prefix = "  "
-                    text = options[option_index]
-                    if len(text) > available_total:
-                        display_text = text[:available_total]
-                    else:
-                        display_text = text
-                    labels[i].text = prefix + display_text
-                    labels[i].color = 0x007700
-            else:
-                labels[i].text = ""
-
-        # Non-blocking check for user input
-        user_input = sys.stdin.read(1)
-        if user_input:
-            # Check for arrow key escape sequence
-            if user_input == "\x1b":
-                seq = sys.stdin.read(2)
-                if seq == "[A":
-                    user_input = "w"
-                elif seq == "[B":
-                    user_input = "s"
-
-            if user_input == "w":
-                if selected_index > 0:
-                    selected_index -= 1
-                    if selected_index < page_offset:
-                        page_offset = selected_index
-                    scroll_offset = 0
-            elif user_input == "s":
-                if selected_index < len(options) - 1:
-                    selected_index += 1
-                    if selected_index >= page_offset + visible_count:
-                        page_offset = selected_index - visible_count + 1
-                    scroll_offset = 0
-            elif user_input in ["\n", "\r"]:
-                break
-
-        time.sleep(0.05)
-
-    print("Selected option:", options[selected_index])
-    time.sleep(1)  # Pause briefly before ending the menu
-    return selected_index
+    loop = UIEventLoop(source or StdinKeySource(), menu.on_key, menu.redraw, menu.on_timer, timer_interval=SCROLL_DELAY)
+    menu.loop = loop
+    menu.select(0)
+    await loop.run()
 
-def display_command_menu(commands):
-    """Given a list of Command objects, display their names as options, then return the selected Command object."""
-    options = [cmd.name for cmd in commands]
-    selected_index = display_menu(options)
-    return commands[selected_index]
+    selected = menu.selected_option()
+    menu.prompt("")
+    if selected is None:
+        return None
+    print("Selected option:", options[selected])
+    await asyncio.sleep(1)  # Pause briefly before ending the menu
+    return selected
+
+class TextInput:
+    """Single-line text entry for the UI loop: printable keys append, backspace deletes, Enter accepts and
+    ESC cancels (text is then None). With secret, the line shows '*' in place of each character."""
+
+    def __init__(self, label, prompt, secret=False, text=""):
+        self.label = label
+        self.prompt = prompt
+        self.secret = secret
+        self.text = text
+        self.shown = None
+
+    def on_key(self, key):
+        if key in ("\n", "\r"):
+            return True
+        if key == "ESC":
+            self.text = None
+            return True
+        if key in ("\x7f", "\x08"):
+            self.text = self.text[:-1]
+        elif len(key) == 1 and key >= " ":
+            self.text += key
+        return False
+
+    def redraw(self):
+        text = self.prompt + ("*" * len(self.text) if self.secret else self.text) + "_"
+        if text != self.shown:
+            self.label.text = text
+            self.shown = text
 
-# Initialize the menu interface:
-def initialize_menu_interface():
-    # Example usage of the command registry with the menu interface
-    from command_registry import register_command, Command, get_commands
 
-    def sample_action():
-        print("Sample action executed!")
+async def read_text(prompt, source=None, secret=False, text=""):
+    """Ask for one line of text on its own screen; returns it, or None if ESC was pressed."""
+    import terminalio
+    from interface_modules.screen_manager import get_screen_manager
+    from interface_modules.status_bar import STATUS_BAR_HEIGHT
+    from interface_modules.ui_loop import UIEventLoop, StdinKeySource
+
+    screen = get_screen_manager()
+    screen.open()
+    line_height = terminalio.FONT.get_bounding_box()[1]
+    entry = TextInput(screen.label(2, STATUS_BAR_HEIGHT + line_height, "", NORMAL_COLOR), prompt, secret, text)
+    await UIEventLoop(source or StdinKeySource(), entry.on_key, entry.redraw).run()
+    return entry.text
+
+
+def display_command_menu(commands):
+    """Given a list of Command objects, display their names as options, then return the selected Command object (None on ESC).
 
-    def sample_action2(param1, param2   ):
-        print(f"Sample action 2 executed with {param1} and {param2}")
+    commands may also be a command_registry.CommandIndex, whose names are then read page by page as the menu scrolls.
+    """
+    import asyncio
+    return asyncio.run(run_command_menu(commands))
 
-    register_command(Command("Sample Command: Do something", "Executes a sample action", sample_action))
-    register_command(Command("Sample Command 2: Do something else", "Executes a sample action 2", sample_action2, ["param1", "param2"]))
 
-    commands = get_commands()
-    selected_command = display_command_menu(commands)
-    print("Executing selected command...")
-    selected_command.execute() 
\ No newline at end of file
+async def run_command_menu(commands, source=None):
+    """Async version of display_command_menu."""
+    if hasattr(commands, "names"):
+        options = commands.names
+    else:
+        options = [cmd.name for cmd in commands]
+    # A CommandTable keeps the index of its names once it has been filtered; it is only built on the first '/'
+    search_index = commands.search_index if hasattr(commands, "search_index") else None
+    selected_index = await run_menu(options, source, search_index)
+    return None if selected_index is None else commands[selected_index]
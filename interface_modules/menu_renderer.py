@@ -0,0 +1,132 @@
+'''menu_renderer.py - Dirty-line rendering layer for the menu interface.
+
+Every assignment to a label's .text rebuilds its glyph group and marks its area of the display dirty,
+so the menu loop should only touch labels whose content actually changed. LineRenderer remembers what
+each line currently shows and skips writes that would not change anything.
+
+LayoutCache works out what each option looks like once: its truncated form for ordinary rows and, for
+the highlighted row, every frame of its scroll cycle. Between key presses the menu then only picks
+precomputed strings, so scrolling allocates nothing.
+'''
+
+SELECTED_COLOR = 0x00FF00
+NORMAL_COLOR = 0x007700
+
+
+def format_option(text, selected, available_total, scroll_offset):
+    """Return the (text, color) a menu line shows for an option.
+
+    The highlighted option scrolls when it is too long; if it contains a colon, the part up to and
+    including the colon stays put and only the remainder scrolls. Other options are truncated.
+    """
+    if not selected:
+        if len(text) > available_total:
+            text = text[:available_total]
+        return "  " + text, NORMAL_COLOR
+    if ':' in text:
+        static, sep, scroll_text = text.partition(':')
+        static = static + sep
+        available_for_scroll = available_total - len(static) - 1
+        if available_for_scroll < 0:
+            available_for_scroll = 0
+        scroll_text = scroll_text.strip()
+        if len(scroll_text) > available_for_scroll:
+            extended = scroll_text + "   "
+            scroll_text = extended[scroll_offset:scroll_offset+available_for_scroll]
+        display_text = static + " " + scroll_text
+    elif len(text) > available_total:
+        extended = text + "   "
+        display_text = extended[scroll_offset:scroll_offset+available_total]
+    else:
+        display_text = text
+    return "> " + display_text, SELECTED_COLOR
+
+
+def scroll_cycle(text, available_total):
+    """Return how many scroll steps the highlighted option cycles through, or 1 if it fits on the line."""
+    if ':' in text:
+        static, sep, scroll_text = text.partition(':')
+        available_for_scroll = available_total - len(static) - len(sep) - 1
+        if available_for_scroll < 0:
+            available_for_scroll = 0
+        text = scroll_text.strip()
+    else:
+        available_for_scroll = available_total
+    if len(text) > available_for_scroll:
+        return len(text) + 3  # add gap of 3 spaces
+    return 1
+
+
+class LayoutCache:
+    def __init__(self, options, available_total):
+        """
+        options: The menu's option texts (any sequence).
+        available_total: Number of characters that fit on a line after the 2-character prefix.
+        """
+        self.options = options
+        self.available_total = available_total
+        self._normal = {}          # option index -> text shown when not highlighted
+        self._frames_index = -1    # option whose scroll frames are cached
+        self._frames = ()
+
+    def normal(self, index):
+        """Return the text of option index as an ordinary (not highlighted) row."""
+        text = self._normal.get(index)
+        if text is None:
+            text = format_option(self.options[index], False, self.available_total, 0)[0]
+            self._normal[index] = text
+        return text
+
+    def frames(self, index):
+        """Return every frame of option index's scroll cycle when highlighted (one frame if it fits)."""
+        if index != self._frames_index:
+            text = self.options[index]
+            self._frames = tuple(format_option(text, True, self.available_total, offset)[0]
+                                 for offset in range(scroll_cycle(text, self.available_total)))
+            self._frames_index = index
+        return self._frames
+
+    def retain(self, start, end):
+        """Drop cached rows outside options[start:end], so the cache stays the size of one page."""
+        for index in [i for i in self._normal if not start <= i < end]:
+            del self._normal[index]
+
+    def invalidate(self, options=None, available_total=None):
+        """Forget all layouts, optionally switching to a new option list or line width."""
+        if options is not None:
+            self.options = options
+        if available_total is not None:
+            self.available_total = available_total
+        self._normal = {}
+        self._frames_index = -1
+        self._frames = ()
+
+
+class LineRenderer:
+    def __init__(self, labels):
+        """
+        Wrap a list of already-created label.Label objects, one per visible line.
+        The current text and color of each label is taken as the initial state.
+        """
+        self.labels = labels
+        self.texts = [lbl.text for lbl in labels]
+        self.colors = [lbl.color for lbl in labels]
+        self.mutations = 0  # number of .text/.color assignments actually made
+
+    def set_line(self, index, text, color=None):
+        """Show text (and optionally color) on line index, touching the label only if something changed."""
+        lbl = self.labels[index]
+        if self.texts[index] != text:
+            lbl.text = text
+            self.texts[index] = text
+            self.mutations += 1
+        if color is not None and self.colors[index] != color:
+            lbl.color = color
+            self.colors[index] = color
+            self.mutations += 1
+
+    def invalidate(self):
+        """Forget the cached state so the next set_line call on every line writes to its label."""
+        for i in range(len(self.labels)):
+            self.texts[i] = None
+            self.colors[i] = None
@@ -0,0 +1,149 @@
+'''option_search.py - Type-to-filter support for menus with very large option lists.
+
+SearchIndex is built once, the first time a menu is filtered, and grows as options are added. It maps:
+  - the first one and two characters of every word in an option to the options containing such a word
+    (used for queries of one or two characters, which match the start of any word)
+  - every three-character substring (trigram) to the options containing it (used for longer queries,
+    which match anywhere in the option)
+Everything is case-insensitive. Posting lists are compact arrays of option numbers in ascending order.
+The index refers to the caller's list of option texts instead of copying it.
+
+OptionFilter tracks the query as the user types. Looking a query up touches only the posting lists of
+its trigrams, and each further character only re-checks the options that matched the previous query.
+FilteredOptions is the sequence of matching options the menu shows instead of the full list.
+'''
+
+from array import array
+
+
+def _words(text):
+    return text.lower().replace(":", " ").split()
+
+
+def _trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, names=()):
+        """names: Option texts; option numbers are their positions. A list is kept, not copied: options
+        appended to it later are indexed by update(), or can be added with add().
+        """
+        self.names = names if isinstance(names, list) else list(names)
+        self.indexed = 0     # names[:indexed] are in the posting lists
+        self._prefixes = {}  # 1-2 character word prefix -> array of option numbers
+        self._trigrams = {}  # trigram -> array of option numbers
+        self.update()
+
+    def __len__(self):
+        return self.indexed
+
+    def _post(self, table, key, number):
+        postings = table.get(key)
+        if postings is None:
+            postings = table[key] = array("I")
+        if not postings or postings[-1] != number:
+            postings.append(number)
+
+    def add(self, name):
+        """Append an option, index it and return its number."""
+        self.names.append(name)
+        self.update()
+        return self.indexed - 1
+
+    def update(self):
+        """Index the options appended to names since the last update."""
+        names = self.names
+        for number in range(self.indexed, len(names)):
+            name = names[number]
+            for word in _words(name):
+                self._post(self._prefixes, word[:1], number)
+                if len(word) > 1:
+                    self._post(self._prefixes, word[:2], number)
+            for trigram in _trigrams(name):
+                self._post(self._trigrams, trigram, number)
+        self.indexed = len(names)
+
+    def search(self, query):
+        """Return the numbers of all options matching query, in option order."""
+        query = query.lower()
+        if not query:
+            return list(range(self.indexed))
+        if len(query) < 3:
+            return list(self._prefixes.get(query, ()))
+        # Intersect the posting lists of the query's trigrams, smallest first, then confirm the substring
+        lists = []
+        for trigram in _trigrams(query):
+            postings = self._trigrams.get(trigram)
+            if postings is None:
+                return []
+            lists.append(postings)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for postings in lists[1:]:
+            keep = set(postings)
+            candidates = [n for n in candidates if n in keep]
+            if not candidates:
+                return []
+        if len(query) == 3:
+            return list(candidates)
+        return [n for n in candidates if query in self.names[n].lower()]
+
+
+class OptionFilter:
+    """The current type-to-filter query and its matches, narrowed incrementally as characters are typed."""
+
+    def __init__(self, index):
+        self.index = index
+        self.query = ""
+        self.matches = None   # None means no filter: every option matches
+        self._history = []    # (query, matches) for the current query and each of its prefixes typed before it
+
+    def set_query(self, query):
+        """Change the query and return the matching option numbers (None for an empty query)."""
+        history = self._history
+        while history and not query.startswith(history[-1][0]):
+            history.pop()
+        if history and history[-1][0] == query:
+            matches = history[-1][1]
+        else:
+            if history and len(history[-1][0]) >= 3:
+                # Longer substring query: only options that matched the shorter one can still match
+                lowered = query.lower()
+                names = self.index.names
+                matches = [n for n in history[-1][1] if lowered in names[n].lower()]
+            else:
+                matches = self.index.search(query) if query else None
+            history.append((query, matches))
+        self.query = query
+        self.matches = matches
+        return matches
+
+    def type(self, char):
+        return self.set_query(self.query + char)
+
+    def backspace(self):
+        return self.set_query(self.query[:-1])
+
+    def clear(self):
+        self._history = []
+        self.query = ""
+        self.matches = None
+
+
+class FilteredOptions:
+    """Read-only sequence of the options that match a filter, mapping back to their original numbers."""
+
+    def __init__(self, options, matches):
+        self.options = options
+        self.matches = matches
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __getitem__(self, i):
+        return self.options[self.matches[i]]
+
+    def source_index(self, i):
+        return self.matches[i]
@@ -0,0 +1,77 @@
+'''screen_manager.py - One persistent displayio scene shared by every screen.
+
+Building a screen used to mean a new full-screen Bitmap, Palette and TileGrid and a new Label for
+every line, all of which became garbage when the next screen opened. On a device that runs for days
+that churn fragments the heap. The ScreenManager allocates the background and the status bar once
+and keeps a pool of labels that grows to the most any screen has needed. A screen calls open() and
+then label() for each line it shows; open() hides the labels of the previous screen, and label()
+hands out a pooled label moved into place.
+
+Labels are only written when their position, text or color actually differs, so reopening a
+screen that looks the same as before does no glyph work at all.
+'''
+
+from interface_modules.menu_renderer import NORMAL_COLOR
+
+
+class ScreenManager:
+    def __init__(self, display):
+        import displayio
+        from interface_modules.status_bar import get_status_bar
+
+        self.display = display
+        self.root = displayio.Group()
+        bg_bitmap = displayio.Bitmap(display.width, display.height, 1)
+        bg_palette = displayio.Palette(1)
+        bg_palette[0] = 0x000000  # black
+        self.root.append(displayio.TileGrid(bg_bitmap, pixel_shader=bg_palette, x=0, y=0))
+        self.content = displayio.Group()
+        self.root.append(self.content)
+        get_status_bar().mount(self.root)
+        self.labels = []   # pool, in the order screens take them
+        self.in_use = 0    # labels handed out to the current screen
+        self.opens = 0
+
+    def open(self):
+        """Start a new screen: hide the previous screen's labels and make sure the scene is displayed."""
+        labels = self.labels
+        for i in range(self.in_use):
+            labels[i].hidden = True
+        self.in_use = 0
+        self.opens += 1
+        if self.display.root_group is not self.root:
+            self.display.root_group = self.root
+
+    def label(self, x, y, text="", color=NORMAL_COLOR):
+        """Return the next label of the current screen, placed at (x, y) showing text in color."""
+        if self.in_use == len(self.labels):
+            import terminalio
+            from adafruit_display_text import label
+            lbl = label.Label(terminalio.FONT, text=text, color=color, x=x, y=y)
+            self.labels.append(lbl)
+            self.content.append(lbl)
+        else:
+            lbl = self.labels[self.in_use]
+            if lbl.x != x:
+                lbl.x = x
+            if lbl.y != y:
+                lbl.y = y
+            if lbl.text != text:
+                lbl.text = text
+            if lbl.color != color:
+                lbl.color = color
+            lbl.hidden = False
+        self.in_use += 1
+        return lbl
+
+
+_screen_manager = None
+
+
+def get_screen_manager():
+    """Return the screen manager shared by all screens, creating it on first use."""
+    global _screen_manager
+    if _screen_manager is None:
+        import board
+        _screen_manager = ScreenManager(board.DISPLAY)
+    return _screen_manager
@@ -0,0 +1,54 @@
+'''sensor_cache.py - Shared, rate-limited cache of values read from hardware.
+
+Each source is a function that reads one value (battery level, radio state, the time) and a refresh
+period in seconds. get() returns the cached value and only calls the function again once the period
+has passed, so any number of screens and widgets can ask for a value as often as they like and the
+hardware is still read at most once per period. Use the module-level `sensors` instance so every
+screen shares one cache.
+'''
+
+import time
+
+
+class SensorCache:
+    def __init__(self, clock=time.monotonic):
+        """clock: Function returning the current time in seconds."""
+        self.clock = clock
+        self._sources = {}  # name -> [read, period, value, read_at]
+        self.reads = {}     # name -> number of times its read function was called
+
+    def register(self, name, read, period):
+        """Add or replace a source; read() is called at most once every period seconds."""
+        self._sources[name] = [read, period, None, None]
+        self.reads.setdefault(name, 0)
+
+    def __contains__(self, name):
+        return name in self._sources
+
+    def get(self, name, default=None):
+        """Return the value of a source, reading it first if the cached value is older than its period."""
+        source = self._sources.get(name)
+        if source is None:
+            return default
+        now = self.clock()
+        if source[3] is None or now - source[3] >= source[1]:
+            source[2] = source[0]()
+            source[3] = now
+            self.reads[name] += 1
+        return source[2]
+
+    def peek(self, name, default=None):
+        """Return the cached value of a source without ever reading it."""
+        source = self._sources.get(name)
+        if source is None or source[3] is None:
+            return default
+        return source[2]
+
+    def invalidate(self, name):
+        """Make the next get() of a source read it, e.g. right after its state is known to have changed."""
+        source = self._sources.get(name)
+        if source is not None:
+            source[3] = None
+
+
+sensors = SensorCache()
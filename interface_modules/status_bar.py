@@ -0,0 +1,157 @@
+'''status_bar.py - Status bar shown at the top of every screen.
+
+The bar is one displayio.Group built once; the screen manager mounts it on the scene every screen
+shares (mount() can also move it into another group). It shows the time, the BLE and Wi-Fi state
+(upper case when connected, lower case when up but not connected) and the battery level, or a
+message in place of the radio state while one is set (the menu's filter query, for instance).
+
+Values come from the shared sensor cache, so however many screens and tasks call update(), each
+source is read at most once per its refresh period. A label is only written when its text changes;
+with the clock showing minutes, an idle bar redraws about once a minute.
+'''
+
+import sys
+import time
+
+from interface_modules.sensor_cache import sensors as shared_sensors
+
+STATUS_BAR_HEIGHT = 20
+STATUS_COLOR = 0x00FF00
+UPDATE_INTERVAL = 1.0  # seconds between update() calls in run()
+
+# Refresh periods of the default sources, in seconds
+BATTERY_PERIOD = 10
+RADIO_PERIOD = 5
+CLOCK_PERIOD = 1
+
+
+def read_battery():
+    # Importing battery.battery sets up the ADC and samples it, which is not for the menu-draw path: show
+    # "--" until the telemetry task has imported it, then its latest sample, without sampling here
+    module = sys.modules.get("battery.battery")
+    if module is None:
+        return None
+    return module.telemetry.percent
+
+
+def read_ble():
+    try:
+        import _bleio
+    except ImportError:
+        return None
+    adapter = _bleio.adapter
+    if adapter is None or not adapter.enabled:
+        return None
+    return adapter.connected
+
+
+def read_wifi():
+    try:
+        import wifi
+    except ImportError:
+        return None
+    if not wifi.radio.enabled:
+        return None
+    return wifi.radio.ipv4_address is not None
+
+
+def read_clock():
+    now = time.localtime()
+    return now.tm_hour, now.tm_min
+
+
+def register_default_sources(sensors):
+    """Register the sources the status bar shows, keeping any a caller registered already."""
+    for name, read, period in (("battery", read_battery, BATTERY_PERIOD), ("ble", read_ble, RADIO_PERIOD),
+                               ("wifi", read_wifi, RADIO_PERIOD), ("clock", read_clock, CLOCK_PERIOD)):
+        if name not in sensors:
+            sensors.register(name, read, period)
+
+
+def _radio_text(name, state):
+    if state is None:
+        return " " * len(name)
+    return name.upper() if state else name.lower()
+
+
+class StatusBar:
+    def __init__(self, width, height=STATUS_BAR_HEIGHT, sensors=None):
+        import displayio
+        import terminalio
+        from adafruit_display_text import label
+
+        self.sensors = sensors or shared_sensors
+        register_default_sources(self.sensors)
+        char_width, line_height = terminalio.FONT.get_bounding_box()[:2]
+
+        self.group = displayio.Group()
+        bg_bitmap = displayio.Bitmap(width, height, 1)
+        bg_palette = displayio.Palette(1)
+        bg_palette[0] = 0x000000
+        self.group.append(displayio.TileGrid(bg_bitmap, pixel_shader=bg_palette, x=0, y=0))
+
+        # clock | radios or message | battery, in fixed character columns
+        columns = width // char_width
+        y = height // 2
+        self.message_width = columns - 5 - 4 - 2
+        self.labels = [
+            label.Label(terminalio.FONT, text="", color=STATUS_COLOR, x=2, y=y),
+            label.Label(terminalio.FONT, text="", color=STATUS_COLOR, x=2 + 6 * char_width, y=y),
+            label.Label(terminalio.FONT, text="", color=STATUS_COLOR, x=width - 4 * char_width - 2, y=y),
+        ]
+        for lbl in self.labels:
+            self.group.append(lbl)
+        self.texts = ["", "", ""]
+        self.message = ""
+        self.redraws = 0   # label writes made so far
+        self.parent = None
+
+    def mount(self, group):
+        """Show the bar in a screen's group, taking it out of the screen that showed it before."""
+        if self.parent is not group:
+            if self.parent is not None:
+                self.parent.remove(self.group)
+            group.append(self.group)
+            self.parent = group
+        self.update()
+
+    def set_message(self, text):
+        """Show text in place of the radio state until it is set back to ""."""
+        if text != self.message:
+            self.message = text
+            self.update()
+
+    def update(self):
+        """Refresh the fields from the sensor cache, writing only labels whose text changed."""
+        sensors = self.sensors
+        hour, minute = sensors.get("clock")
+        if self.message:
+            middle = self.message[:self.message_width]
+        else:
+            middle = _radio_text("bt", sensors.get("ble")) + " " + _radio_text("wifi", sensors.get("wifi"))
+        battery = sensors.get("battery")
+        texts = ("%02d:%02d" % (hour, minute), middle, " --%" if battery is None else "%3d%%" % battery)
+        for i in range(3):
+            if texts[i] != self.texts[i]:
+                self.labels[i].text = texts[i]
+                self.texts[i] = texts[i]
+                self.redraws += 1
+
+    async def run(self, interval=UPDATE_INTERVAL):
+        """Keep the bar up to date; run this as one task for the whole program."""
+        import asyncio
+        while True:
+            self.update()
+            await asyncio.sleep(interval)
+
+
+_status_bar = None
+
+
+def get_status_bar():
+    """Return the status bar shared by all screens, creating it on first use."""
+    global _status_bar
+    if _status_bar is None:
+        import board
+        _status_bar = StatusBar(board.DISPLAY.width)
+    return _status_bar
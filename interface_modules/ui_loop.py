@@ -0,0 +1,260 @@
+'''ui_loop.py - Shared asyncio event loop for the interactive screens.
+
+Instead of polling sys.stdin and sleeping a fixed 10-50 ms per iteration, each screen hands UIEventLoop
+three callbacks: on_key for input, on_timer for periodic work (menu scrolling, key auto-repeat) and
+redraw. A key reader task wakes only when input arrives, the timer task only runs while a screen asks
+for it, and redraw is called only after one of them changed something. While nothing happens the
+scheduler has nothing to do, so the CPU can idle.
+
+Key sources are plain objects with an async read() that returns the next chunk of input as a string;
+the loop decodes chunks into keys with keyboard.key_decoder.KeyDecoder.
+StdinKeySource reads the serial console; QueueKeySource is a stand-in that tests, benchmarks and other
+code can feed keys into.
+'''
+
+import asyncio
+import sys
+import time
+
+from keyboard.key_decoder import KeyDecoder, ESC_TIMEOUT
+
+
+def serial_bytes_available():
+    """Return how many bytes are waiting on the serial console (0 where this cannot be checked)."""
+    try:
+        import supervisor
+        return supervisor.runtime.serial_bytes_available
+    except (ImportError, AttributeError):
+        return 0
+
+
+class StdinKeySource:
+    """Key source reading the serial console without busy-waiting."""
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdin
+        self._reader = None
+        self._utf8 = None   # incremental decoder: a character may be split across two reads
+
+    async def read(self):
+        if sys.implementation.name == "cpython":
+            return await self._read_cpython()
+        # CircuitPython/MicroPython asyncio polls streams in its scheduler, so this task sleeps until input arrives
+        if self._reader is None:
+            self._reader = asyncio.StreamReader(self.stream)
+        chunk = await self._reader.read(1)
+        waiting = serial_bytes_available()
+        if waiting:
+            chunk += self.stream.read(waiting)
+        return chunk
+
+    async def _read_cpython(self):
+        import codecs
+        import os
+        if self._utf8 is None:
+            self._utf8 = codecs.getincrementaldecoder("utf-8")("replace")
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.stream.fileno()
+        loop.add_reader(fd, lambda: None if ready.done() else ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+        return self._utf8.decode(os.read(fd, 64))
+
+
+class QueueKeySource:
+    """Stand-in key source: feed() queues input that read() hands out in order."""
+
+    def __init__(self):
+        self.chunks = []
+        self._ready = None
+
+    def feed(self, chunk):
+        self.chunks.append(chunk)
+        if self._ready is not None:
+            self._ready.set()
+
+    async def read(self):
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        while not self.chunks:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.chunks.pop(0)
+
+
+class LoopStats:
+    """Counters describing how a UIEventLoop spent its time, all durations in nanoseconds."""
+
+    def __init__(self):
+        self.started_ns = 0
+        self.stopped_ns = 0
+        self.idle_ns = 0         # time spent waiting for something to happen
+        self.keys = 0
+        self.timer_ticks = 0
+        self.redraws = 0
+        self.redraw_ns = 0       # total time spent inside redraw()
+        self.latency_count = 0   # key events that were followed by a redraw
+        self.latency_total_ns = 0
+        self.latency_max_ns = 0
+
+    def report(self):
+        """Return the stats as a dict, with averages in milliseconds."""
+        elapsed = (self.stopped_ns or time.monotonic_ns()) - self.started_ns
+        return {
+            "elapsed_ms": elapsed / 1e6,
+            "idle_ms": self.idle_ns / 1e6,
+            "idle_fraction": self.idle_ns / elapsed if elapsed else 0,
+            "keys": self.keys,
+            "timer_ticks": self.timer_ticks,
+            "redraws": self.redraws,
+            "redraw_avg_ms": self.redraw_ns / self.redraws / 1e6 if self.redraws else 0,
+            "key_latency_avg_ms": self.latency_total_ns / self.latency_count / 1e6 if self.latency_count else 0,
+            "key_latency_max_ms": self.latency_max_ns / 1e6,
+        }
+
+
+class UIEventLoop:
+    def __init__(self, source, on_key, redraw=None, on_timer=None, timer_interval=0.3, on_keys=None):
+        """
+        source: A key source (StdinKeySource, QueueKeySource or anything with an async read()).
+        on_key: Called with each key as decoded by keyboard.key_decoder (e.g. "a", "\\r", "UP", "CTRL+LEFT");
+            return True to end the loop.
+        on_keys: Optional; if given it is called instead of on_key with the list of all keys that arrived
+            together in one read, for consumers that can handle a burst (e.g. pasted text) in one go.
+        redraw: Called after a key or timer tick, at most once per batch of events.
+        on_timer: Called every timer_interval seconds while the timer is enabled via set_timer().
+        """
+        self.source = source
+        self.on_key = on_key
+        self.on_keys = on_keys
+        self.redraw = redraw
+        self.on_timer = on_timer
+        self.timer_interval = timer_interval
+        self.stats = LoopStats()
+        self._dirty = None
+        self._timer_wanted = None
+        self._timer_on = False
+        self._done = False
+        self._error = None
+        self._key_time = None
+        self.chunk_ns = 0
+        self.decoder = KeyDecoder()
+
+    def set_timer(self, active):
+        """Start or stop calling on_timer; when stopped the timer task just waits."""
+        self._timer_on = active
+        if self._timer_wanted is not None:
+            if active:
+                self._timer_wanted.set()
+            else:
+                self._timer_wanted.clear()
+
+    def request_redraw(self):
+        if self._dirty is not None:
+            self._dirty.set()
+
+    def stop(self):
+        self._done = True
+        self.request_redraw()
+
+    async def _guard(self, coroutine):
+        """Run one of the loop's tasks; an exception in it ends the loop and is raised again by run()."""
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._error = e
+            self.stop()
+
+    async def _read_keys(self):
+        decoder = self.decoder
+        while not self._done:
+            if decoder.waiting():
+                # Part of an escape sequence is pending; if nothing follows soon it was a lone ESC
+                try:
+                    chunk = await asyncio.wait_for(self.source.read(), ESC_TIMEOUT)
+                except asyncio.TimeoutError:
+                    chunk = None
+            else:
+                chunk = await self.source.read()
+            if chunk is None:
+                keys = decoder.flush()
+            else:
+                self.chunk_ns = time.monotonic_ns()  # arrival time of the chunk being handled
+                keys = decoder.feed(chunk)
+                if not keys:
+                    continue
+            if self._key_time is None:
+                self._key_time = self.chunk_ns
+            self.stats.keys += len(keys)
+            if self.on_keys is not None:
+                if self.on_keys(keys):
+                    self.stop()
+                    return
+            else:
+                for key in keys:
+                    if self.on_key(key):
+                        self.stop()
+                        return
+            self.request_redraw()
+
+    async def _run_timer(self):
+        while not self._done:
+            await self._timer_wanted.wait()
+            await asyncio.sleep(self.timer_interval)
+            if self._timer_on and not self._done:
+                self.stats.timer_ticks += 1
+                self.on_timer()
+                self.request_redraw()
+
+    async def run(self):
+        """Run until on_key returns True or stop() is called.
+
+        An exception raised while reading keys or in on_key/on_keys/on_timer stops the loop and is raised here.
+        """
+        stats = self.stats
+        stats.started_ns = time.monotonic_ns()
+        stats.stopped_ns = 0
+        self._dirty = asyncio.Event()
+        self._timer_wanted = asyncio.Event()
+        self._done = False
+        self._error = None
+        self.set_timer(self._timer_on)
+        tasks = [asyncio.create_task(self._guard(self._read_keys()))]
+        if self.on_timer is not None:
+            tasks.append(asyncio.create_task(self._guard(self._run_timer())))
+        if self.redraw is not None:
+            self.redraw()
+        try:
+            while not self._done:
+                waited = time.monotonic_ns()
+                await self._dirty.wait()
+                now = time.monotonic_ns()
+                stats.idle_ns += now - waited
+                self._dirty.clear()
+                if self._done:
+                    break
+                if self.redraw is not None:
+                    self.redraw()
+                    done = time.monotonic_ns()
+                    stats.redraws += 1
+                    stats.redraw_ns += done - now
+                else:
+                    done = now
+                if self._key_time is not None:
+                    latency = done - self._key_time
+                    self._key_time = None
+                    stats.latency_count += 1
+                    stats.latency_total_ns += latency
+                    if latency > stats.latency_max_ns:
+                        stats.latency_max_ns = latency
+            if self._error is not None:
+                raise self._error
+        finally:
+            stats.stopped_ns = time.monotonic_ns()
+            for task in tasks:
+                task.cancel()
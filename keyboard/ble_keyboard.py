@@ -8,7 +8,7 @@ This example acts as a keyboard to peer devices.
 # import board
 import sys
 import time
-import select
+import asyncio
 
 from adafruit_hid.keyboard import Keyboard
 from adafruit_hid.keyboard_layout_us import KeyboardLayoutUS
@@ -20,6 +20,13 @@ from adafruit_ble.advertising.standard import ProvideServicesAdvertisement
 from adafruit_ble.services.standard.hid import HIDService
 from adafruit_ble.services.standard.device_info import DeviceInfoService
 
+from interface_modules.ui_loop import UIEventLoop, StdinKeySource
+from keyboard.keystroke_trace import STAGE_DECODE, STAGE_HID, STAGE_ECHO
+from keyboard.key_decoder import hid_keycodes
+from profiler import section
+
+_HID_SEND = section("hid.send")
+
 
 # Use default HID descriptor
 hid = HIDService()
@@ -48,111 +55,166 @@ kl = KeyboardLayoutUS(k)
 # Define key repeat parameters
 initial_delay = 0.5   # delay before auto-repeat starts (in seconds)
 repeat_interval = 0.1   # interval between repeats (in seconds)
-
-# Reset key hold tracking upon connection
-current_key = None
-is_held = False
-key_press_time = time.monotonic()
-last_key_time = time.monotonic()
-last_repeat_time = time.monotonic()
 hold_refresh_threshold = 0.25  # time within which a repeated key event indicates a hold
 release_timeout = 0.3         # time after which, without new events, the key is considered released
+report_key = '\x14'          # Ctrl+T prints the keystroke latency report when tracing is enabled
 
-while True:
-    while not ble.connected:
-        time.sleep(0.1)
-    print("Start typing:")
-    # Reset key hold tracking upon connection
-    current_key = None
-    is_held = False
-    key_press_time = time.monotonic()
-    last_key_time = time.monotonic()
-    last_repeat_time = time.monotonic()
-    while ble.connected:
-        now = time.monotonic()
-        rlist, _, _ = select.select([sys.stdin], [], [], 0)
-        if rlist:
-            c = sys.stdin.read(1)
-            if c:
-                if c == "\x1b":
-                    # Handle escape sequence for arrow keys and delete
-                    time.sleep(0.01)  # brief pause to allow full sequence
-                    if select.select([sys.stdin], [], [], 0)[0]:
-                        seq = sys.stdin.read(2)
-                        if seq == "[A":
-                            print("Sending UP arrow")
-                            k.send(Keycode.UP_ARROW)
-                            key_val = Keycode.UP_ARROW
-                        elif seq == "[B":
-                            print("Sending DOWN arrow")
-                            k.send(Keycode.DOWN_ARROW)
-                            key_val = Keycode.DOWN_ARROW
-                        elif seq == "[C":
-                            print("Sending RIGHT arrow")
-                            k.send(Keycode.RIGHT_ARROW)
-                            key_val = Keycode.RIGHT_ARROW
-                        elif seq == "[D":
-                            print("Sending LEFT arrow")
-                            k.send(Keycode.LEFT_ARROW)
-                            key_val = Keycode.LEFT_ARROW
-                        elif seq.startswith("[3"):
-                            extra = sys.stdin.read(1)
-                            seq += extra
-                            if seq == "[3~":
-                                print("Sending DELETE")
-                                k.send(Keycode.DELETE)
-                                key_val = Keycode.DELETE
-                            else:
-                                key_val = None
-                        else:
-                            print(f"Unknown escape sequence: {seq}")
-                            key_val = None
-
-                        if key_val is not None:
-                            # If the same key is observed within the threshold, mark it as held
-                            if current_key == key_val and (now - last_key_time) <= hold_refresh_threshold:
-                                is_held = True
-                            else:
-                                current_key = key_val
-                                is_held = False
-                                key_press_time = now
-                            last_key_time = now
-                        # No additional output for escape sequences as they've been handled
-                    else:
-                        # No additional chars; treat as normal character
-                        sys.stdout.write(c)
-                        kl.write(c)
-                        current_key = c
-                        is_held = False
-                        key_press_time = now
-                        last_key_time = now
+# Keycodes for named and modified keys ("UP", "CTRL+LEFT", ...), looked up once per distinct key
+special_keycodes = {}
+
+
+def keycodes_for(key):
+    """Return the HID keycodes for a named key from the key decoder, or None if it has none."""
+    if key not in special_keycodes:
+        special_keycodes[key] = hid_keycodes(key, kl, Keycode)
+    return special_keycodes[key]
+
+
+class KeyRepeater:
+    """Forwards keys to the HID keyboard and auto-repeats a key while it is held.
+
+    trace: Optional keystroke_trace.KeystrokeTrace recording per-stage latency of each key; with a trace,
+    Ctrl+T prints its report instead of being sent.
+    """
+
+    def __init__(self, trace=None):
+        self.loop = None
+        self.trace = trace
+        # Reset key hold tracking upon connection
+        self.current_key = None
+        self.is_held = False
+        self.key_press_time = time.monotonic()
+        self.last_key_time = time.monotonic()
+        self.last_repeat_time = time.monotonic()
+
+    def _handle(self, key, batch=None):
+        """Decode, send and echo one key; returns its key value, or None if it was not sent.
+
+        batch: Optional list; printable characters are added to it instead of being written, so a burst
+        goes out as one HID write (see _send_batch). A named key sends what is in it first, to keep the order.
+        """
+        trace = self.trace
+        if trace is not None:
+            if key == report_key:
+                trace.print_report()
+                return None
+            trace.begin(self.loop.chunk_ns)
+        if len(key) > 1:
+            # Named key decoded from an escape sequence (arrows, delete, function keys, modifiers...)
+            key_val = keycodes_for(key)
+            if key_val is None:
+                print(f"Unknown escape sequence: {key}")
+                return None
+            if trace is not None:
+                trace.mark(STAGE_DECODE)
+            if batch:
+                self._send_batch(batch)
+            with _HID_SEND:
+                k.send(*key_val)
+            if trace is not None:
+                trace.mark(STAGE_HID)
+            print(f"Sending {key}")
+        else:
+            key_val = key
+            printable = ord(key) >= 32 or key in allowed_command_characters
+            if trace is not None:
+                trace.mark(STAGE_DECODE)
+            if printable:
+                if batch is None:
+                    with _HID_SEND:
+                        kl.write(key)
+                    if trace is not None:
+                        trace.mark(STAGE_HID)
                 else:
-                    if ord(c) >= 32 or c in allowed_command_characters:
-                        sys.stdout.write(c)
-                        kl.write(c)
-                    # For normal keys, if the same key is received quickly, mark as held
-                    if current_key == c and (now - last_key_time) <= hold_refresh_threshold:
-                        is_held = True
-                    else:
-                        current_key = c
-                        is_held = False
-                        key_press_time = now
-                    last_key_time = now
-                # Reset auto-repeat timer on physical key event
-                last_repeat_time = now
+                    batch.append(key)
+                sys.stdout.write(key)
+        if trace is not None:
+            trace.mark(STAGE_ECHO)
+            trace.end()
+        return key_val
+
+    def on_key(self, key):
+        now = time.monotonic()
+        key_val = self._handle(key)
+        if key_val is None:
+            return False
+        # If the same key is observed within the threshold, mark it as held
+        if self.current_key == key_val and (now - self.last_key_time) <= hold_refresh_threshold:
+            self.is_held = True
         else:
-            # No new physical event
-            if (is_held and current_key is not None):
-                if ((now - key_press_time) >= initial_delay and (now - last_repeat_time) >= repeat_interval):
-                    if isinstance(current_key, int):
-                        k.send(current_key)
-                    else:
-                        sys.stdout.write(current_key)
-                        kl.write(current_key)
-                    last_repeat_time = now
-            # If no key event for a while, consider the key released
-            if ((now - last_key_time) >= release_timeout):
-                is_held = False
-                current_key = None
-        time.sleep(0.01)
-    ble.start_advertising(advertisement)
\ No newline at end of file
+            self.current_key = key_val
+            self.is_held = False
+            self.key_press_time = now
+        self.last_key_time = now
+        # Reset auto-repeat timer on physical key event
+        self.last_repeat_time = now
+        self.loop.set_timer(self.is_held)
+        return False
+
+    def on_keys(self, keys):
+        """Handle all keys from one read. A single key goes through on_key as usual; in a burst (pasted or
+        macro text) each key is handled the same way, but runs of characters go out as one HID write and
+        repeated characters are not treated as held keys."""
+        if len(keys) == 1:
+            return self.on_key(keys[0])
+        batch = []
+        for key in keys:
+            self._handle(key, batch)
+        self._send_batch(batch)
+        # A burst is not a physical key being held
+        self.current_key = None
+        self.is_held = False
+        self.loop.set_timer(False)
+        return False
+
+    def _send_batch(self, batch):
+        if batch:
+            with _HID_SEND:
+                kl.write("".join(batch))
+            del batch[:]
+
+    def on_timer(self):
+        # No new physical event; only scheduled while a key is held
+        now = time.monotonic()
+        # If no key event for a while, consider the key released
+        if (now - self.last_key_time) >= release_timeout:
+            self.is_held = False
+            self.current_key = None
+            self.loop.set_timer(False)
+            return
+        if (now - self.key_press_time) >= initial_delay and (now - self.last_repeat_time) >= repeat_interval:
+            if isinstance(self.current_key, tuple):
+                with _HID_SEND:
+                    k.send(*self.current_key)
+            else:
+                sys.stdout.write(self.current_key)
+                with _HID_SEND:
+                    kl.write(self.current_key)
+            self.last_repeat_time = now
+
+
+async def watch_connection(loop):
+    while ble.connected:
+        await asyncio.sleep(0.1)
+    loop.stop()
+
+
+async def main(source=None, trace=None):
+    """Run the keyboard; pass a keystroke_trace.KeystrokeTrace as trace to record latency per stage."""
+    source = source or StdinKeySource()
+    while True:
+        while not ble.connected:
+            await asyncio.sleep(0.1)
+        print("Start typing:")
+        repeater = KeyRepeater(trace)
+        loop = UIEventLoop(source, repeater.on_key, on_timer=repeater.on_timer, timer_interval=repeat_interval / 2,
+                           on_keys=repeater.on_keys)
+        repeater.loop = loop
+        watcher = asyncio.create_task(watch_connection(loop))
+        await loop.run()
+        watcher.cancel()
+        ble.start_advertising(advertisement)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,6 +8,11 @@ import sys
 import cardputer_keyboard
 from adafruit_hid.keyboard import Keyboard
 from adafruit_hid.keyboard_layout_us import KeyboardLayoutUS
+from adafruit_hid.keycode import Keycode
+from keyboard.key_decoder import KeyDecoder, hid_keycodes
+from profiler import section
+
+_HID_SEND = section("hid.send")
 
 try:
     import select
@@ -22,6 +27,7 @@ async def run_hid_keyboard():
     # Initialize HID keyboard using adafruit HID library
     keyboard = Keyboard()
     layout = KeyboardLayoutUS(keyboard)
+    decoder = KeyDecoder()
 
     print("HID Keyboard running. Waiting for input...")
 
@@ -45,7 +51,24 @@ async def run_hid_keyboard():
             line = line.rstrip('\n')
             if line:
                 print(f"Received input: {line}")
-                layout.write(line)
+                # A line is complete, so anything still pending in the decoder is flushed with it
+                keys = decoder.feed(line) + decoder.flush()
+                run = []
+                for key in keys:
+                    codes = hid_keycodes(key, layout, Keycode)
+                    if codes is None:
+                        if len(key) == 1:
+                            run.append(key)
+                        continue
+                    if run:
+                        with _HID_SEND:
+                            layout.write("".join(run))
+                        run = []
+                    with _HID_SEND:
+                        keyboard.send(*codes)
+                if run:
+                    with _HID_SEND:
+                        layout.write("".join(run))
     except KeyboardInterrupt:
         print("Keyboard interrupt received. Exiting HID keyboard.")
 
@@ -0,0 +1,185 @@
+'''key_decoder.py - Incremental, table-driven decoder for keys and terminal escape sequences.
+
+Input from the serial console arrives as characters, with special keys encoded as VT100/xterm escape
+sequences that may be split across reads. KeyDecoder is a small state machine: feed() takes whatever
+has arrived and returns the keys completed so far, keeping any partial sequence for the next call.
+It never waits; a lone ESC stays pending until more input arrives or the caller decides no more is
+coming (after ESC_TIMEOUT) and calls flush().
+
+Keys are returned as strings:
+  - ordinary characters and control characters as themselves ("a", "\r", "\x7f")
+  - special keys by name: UP DOWN LEFT RIGHT HOME END PGUP PGDN INSERT DELETE F1..F12 ESC
+  - with modifiers prefixed in the order SHIFT+ ALT+ CTRL+ META+, e.g. "CTRL+UP", "SHIFT+TAB", "ALT+x"
+  - sequences that are not in the tables as the raw sequence, starting with "\x1b"
+'''
+
+ESC_TIMEOUT = 0.05  # seconds to wait after a lone ESC before treating it as the Escape key
+
+# Final character of CSI (ESC [) and SS3 (ESC O) sequences -> key name
+CSI_FINAL = {
+    "A": "UP", "B": "DOWN", "C": "RIGHT", "D": "LEFT",
+    "H": "HOME", "F": "END", "E": "BEGIN", "Z": "SHIFT+TAB",
+    "P": "F1", "Q": "F2", "R": "F3", "S": "F4",
+}
+SS3_FINAL = {
+    "A": "UP", "B": "DOWN", "C": "RIGHT", "D": "LEFT",
+    "H": "HOME", "F": "END", "E": "BEGIN",
+    "P": "F1", "Q": "F2", "R": "F3", "S": "F4",
+}
+# Linux console function keys: ESC [ [ A .. ESC [ [ E
+LINUX_FINAL = {"A": "F1", "B": "F2", "C": "F3", "D": "F4", "E": "F5"}
+# Number in ESC [ <n> ~ sequences -> key name
+TILDE_CODES = {
+    1: "HOME", 2: "INSERT", 3: "DELETE", 4: "END", 5: "PGUP", 6: "PGDN", 7: "HOME", 8: "END",
+    11: "F1", 12: "F2", 13: "F3", 14: "F4", 15: "F5",
+    17: "F6", 18: "F7", 19: "F8", 20: "F9", 21: "F10", 23: "F11", 24: "F12",
+}
+# xterm modifier parameter (1 + bitmask) -> prefix
+MODIFIER_PREFIXES = [""] * 16
+for _mask in range(16):
+    MODIFIER_PREFIXES[_mask] = ("SHIFT+" if _mask & 1 else "") + ("ALT+" if _mask & 2 else "") + \
+        ("CTRL+" if _mask & 4 else "") + ("META+" if _mask & 8 else "")
+
+_GROUND = 0
+_ESC = 1       # got ESC
+_CSI = 2       # got ESC [, collecting parameters
+_SS3 = 3       # got ESC O
+_LINUX = 4     # got ESC [ [
+
+
+def _modified(name, param):
+    """Apply an xterm modifier parameter to a key name."""
+    mask = param - 1
+    if mask <= 0 or mask >= 16:
+        return name
+    if name.startswith("SHIFT+"):
+        name = name[6:]
+        mask |= 1
+    return MODIFIER_PREFIXES[mask] + name
+
+
+class KeyDecoder:
+    def __init__(self):
+        self.state = _GROUND
+        self.pending = ""  # characters of the sequence being decoded
+
+    def feed(self, data):
+        """Decode the characters in data (str or bytes) and return the list of completed keys."""
+        if isinstance(data, bytes):
+            data = data.decode()
+        keys = []
+        for ch in data:
+            state = self.state
+            if state == _GROUND:
+                if ch == "\x1b":
+                    self.state = _ESC
+                    self.pending = ch
+                else:
+                    keys.append(ch)
+            elif state == _ESC:
+                if ch == "[":
+                    self.state = _CSI
+                    self.pending += ch
+                elif ch == "O":
+                    self.state = _SS3
+                    self.pending += ch
+                elif ch == "\x1b":
+                    keys.append("ESC")  # the first ESC was the Escape key; this one may start a sequence
+                else:
+                    keys.append("ALT+" + ch)
+                    self._reset()
+            elif state == _CSI:
+                self.pending += ch
+                if ch == "[" and self.pending == "\x1b[[":
+                    self.state = _LINUX
+                elif "0" <= ch <= "9" or ch == ";":
+                    pass
+                else:
+                    keys.append(self._csi(ch))
+                    self._reset()
+            elif state == _SS3:
+                self.pending += ch
+                keys.append(SS3_FINAL.get(ch, self.pending))
+                self._reset()
+            else:  # _LINUX
+                self.pending += ch
+                keys.append(LINUX_FINAL.get(ch, self.pending))
+                self._reset()
+        return keys
+
+    def _csi(self, final):
+        params = self.pending[2:-1]
+        parts = params.split(";") if params else []
+        try:
+            numbers = [int(p) if p else 1 for p in parts]
+        except ValueError:
+            return self.pending
+        if final == "~":
+            if not numbers or numbers[0] not in TILDE_CODES:
+                return self.pending
+            name = TILDE_CODES[numbers[0]]
+            return _modified(name, numbers[1]) if len(numbers) > 1 else name
+        name = CSI_FINAL.get(final)
+        if name is None or len(numbers) > 2:
+            return self.pending
+        return _modified(name, numbers[1]) if len(numbers) == 2 else name
+
+    def _reset(self):
+        self.state = _GROUND
+        self.pending = ""
+
+    def waiting(self):
+        """True while part of an escape sequence has been received and the rest has not."""
+        return self.state != _GROUND
+
+    def flush(self):
+        """Give up waiting for the rest of a sequence and return what has been received as keys."""
+        if self.state == _GROUND:
+            return []
+        pending = self.pending
+        self._reset()
+        if pending == "\x1b":
+            return ["ESC"]
+        if pending == "\x1b[":
+            return ["ALT+["]
+        if pending == "\x1bO":
+            return ["ALT+O"]
+        return [pending]
+
+
+def hid_keycodes(key, layout, keycode):
+    """Return the tuple of adafruit_hid keycodes to send for a named or modified key, or None.
+
+    layout: A KeyboardLayout, used for the character in ALT+x style keys.
+    keycode: The adafruit_hid Keycode class.
+    Plain characters return None; send those with layout.write().
+    """
+    if len(key) == 1:
+        return None
+    codes = []
+    name = key
+    while True:
+        for modifier, attribute in _HID_MODIFIERS:
+            if name.startswith(modifier):
+                codes.append(getattr(keycode, attribute))
+                name = name[len(modifier):]
+                break
+        else:
+            break
+    if len(name) == 1:
+        codes.extend(layout.keycodes(name))
+    elif name in _HID_KEYS:
+        codes.append(getattr(keycode, _HID_KEYS[name]))
+    else:
+        return None
+    return tuple(codes)
+
+
+_HID_MODIFIERS = (("SHIFT+", "SHIFT"), ("ALT+", "ALT"), ("CTRL+", "CONTROL"), ("META+", "GUI"))
+_HID_KEYS = {
+    "UP": "UP_ARROW", "DOWN": "DOWN_ARROW", "LEFT": "LEFT_ARROW", "RIGHT": "RIGHT_ARROW",
+    "HOME": "HOME", "END": "END", "PGUP": "PAGE_UP", "PGDN": "PAGE_DOWN",
+    "INSERT": "INSERT", "DELETE": "DELETE", "ESC": "ESCAPE", "TAB": "TAB",
+    "F1": "F1", "F2": "F2", "F3": "F3", "F4": "F4", "F5": "F5", "F6": "F6",
+    "F7": "F7", "F8": "F8", "F9": "F9", "F10": "F10", "F11": "F11", "F12": "F12",
+}
@@ -0,0 +1,75 @@
+'''keystroke_trace.py - Per-keystroke latency instrumentation for the keyboard loops.
+
+A KeystrokeTrace keeps a ring buffer of the last `capacity` keystrokes with how long each stage took:
+  read   - from the key reader getting the input chunk to the key handler starting on this key
+  decode - working out what the key is (escape sequence lookup, filtering)
+  hid    - sending the HID report(s)
+  echo   - writing the key back to the serial console
+  total  - from the input chunk arriving to the handler finishing
+All storage is allocated up front, so recording never allocates. Code that wants tracing keeps a trace
+(or None) and guards each hook with `if trace is not None`, which is all it costs when tracing is off.
+'''
+
+import time
+
+STAGE_READ = 0
+STAGE_DECODE = 1
+STAGE_HID = 2
+STAGE_ECHO = 3
+STAGE_TOTAL = 4
+STAGE_NAMES = ("read", "decode", "hid", "echo", "total")
+
+
+class KeystrokeTrace:
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.durations = [[0] * capacity for _ in STAGE_NAMES]  # nanoseconds, one row per stage
+        self.count = 0      # keystrokes recorded so far (the ring holds the last `capacity`)
+        self.slot = 0
+        self._start = 0
+        self._last = 0
+
+    def begin(self, arrived_ns):
+        """Start a keystroke whose input arrived at arrived_ns (time.monotonic_ns); records the read stage."""
+        now = time.monotonic_ns()
+        slot = self.count % self.capacity
+        self.slot = slot
+        for row in self.durations:
+            row[slot] = 0
+        self.durations[STAGE_READ][slot] = now - arrived_ns
+        self._start = arrived_ns
+        self._last = now
+
+    def mark(self, stage):
+        """Add the time since the previous begin/mark call to stage for the current keystroke."""
+        now = time.monotonic_ns()
+        self.durations[stage][self.slot] += now - self._last
+        self._last = now
+
+    def end(self):
+        """Finish the current keystroke."""
+        self.durations[STAGE_TOTAL][self.slot] = time.monotonic_ns() - self._start
+        self.count += 1
+
+    def percentiles(self, stage, points=(50, 90, 99)):
+        """Return the given percentiles of a stage over the recorded keystrokes, in microseconds."""
+        n = min(self.count, self.capacity)
+        if not n:
+            return [0 for _ in points]
+        values = sorted(self.durations[stage][:n])
+        return [values[min(n - 1, n * p // 100)] / 1000 for p in points]
+
+    def report(self):
+        """Return {stage name: (p50, p90, p99, max)} in microseconds."""
+        n = min(self.count, self.capacity)
+        result = {}
+        for stage, name in enumerate(STAGE_NAMES):
+            p50, p90, p99 = self.percentiles(stage)
+            result[name] = (p50, p90, p99, max(self.durations[stage][:n]) / 1000 if n else 0)
+        return result
+
+    def print_report(self):
+        print(f"Keystroke latency over the last {min(self.count, self.capacity)} keys (us):")
+        print(f"  {'stage':8s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}")
+        for name, values in self.report().items():
+            print(f"  {name:8s} " + " ".join(f"{v:9.1f}" for v in values))
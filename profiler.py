@@ -0,0 +1,217 @@
+'''profiler.py - Call counts, time and heap use per named section, for the device and host benchmarks.
+
+CircuitPython has no cProfile, so code marks the sections worth watching itself. section(name)
+registers a Section once, usually at import, and the code runs under it:
+
+    _DRAW = profiler.section("menu.redraw")
+    ...
+    with _DRAW:
+        ...
+
+or decorates a function with @profiled(name). For every section the Profiler keeps the number of
+calls, the total and longest time (time.monotonic_ns) and the heap allocated inside it, measured as
+the drop in gc.mem_free() (a drop caused by a garbage collection in the middle counts as nothing).
+A section entered again while it is running (recursion) counts the call but not the time twice.
+
+The per-section storage is allocated up front for `capacity` sections, so recording a call does not
+allocate anything of its own; sections registered past capacity are counted in `overflow` and not
+measured. Profiling is off until enable() is called. While it is off, a section costs one attribute
+check on entry and one on exit.
+
+On CPython, gc.mem_free() does not exist; the heap columns come from tracemalloc if it is tracing
+and are 0 otherwise.
+'''
+
+import time
+
+try:
+    from gc import mem_free
+except ImportError:
+    import tracemalloc
+
+    def mem_free():
+        return -tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+CAPACITY = 32
+REPORT_FILE = "profile.txt"
+
+
+class Section:
+    __slots__ = ("profiler", "slot")
+
+    def __init__(self, profiler, slot):
+        self.profiler = profiler
+        self.slot = slot    # None if the profiler was full
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.enabled and self.slot is not None:
+            profiler.begin(self.slot)
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        profiler = self.profiler
+        if profiler.enabled and self.slot is not None:
+            profiler.end(self.slot)
+        return False
+
+
+class Profiler:
+    def __init__(self, capacity=CAPACITY, clock=time.monotonic_ns, free=mem_free):
+        self.capacity = capacity
+        self.clock = clock
+        self.free = free
+        self.enabled = False
+        self.names = [None] * capacity
+        self.sections = {}          # name -> Section
+        self.count = 0              # sections registered
+        self.overflow = 0           # sections registered past capacity, not measured
+        self.calls = [0] * capacity
+        self.total_ns = [0] * capacity
+        self.max_ns = [0] * capacity
+        self.alloc = [0] * capacity     # bytes allocated inside the section, all calls
+        self.max_alloc = [0] * capacity
+        self._depth = [0] * capacity
+        self._start = [0] * capacity
+        self._free = [0] * capacity
+        self.since = 0              # clock when profiling was last enabled or reset
+
+    def section(self, name):
+        """The Section for name, registering it on first use."""
+        section = self.sections.get(name)
+        if section is None:
+            slot = None
+            if self.count < self.capacity:
+                slot = self.count
+                self.names[slot] = name
+                self.count += 1
+            else:
+                self.overflow += 1
+            section = self.sections[name] = Section(self, slot)
+        return section
+
+    def enable(self, enabled=True):
+        if enabled and not self.enabled:
+            self.since = self.clock()
+        self.enabled = enabled
+
+    def reset(self):
+        """Zero every section's statistics; sections stay registered."""
+        for column in (self.calls, self.total_ns, self.max_ns, self.alloc, self.max_alloc, self._depth):
+            for i in range(self.capacity):
+                column[i] = 0
+        self.since = self.clock()
+
+    def begin(self, slot):
+        self.calls[slot] += 1
+        depth = self._depth[slot]
+        self._depth[slot] = depth + 1
+        if not depth:
+            self._free[slot] = self.free()
+            self._start[slot] = self.clock()
+
+    def end(self, slot):
+        depth = self._depth[slot] - 1
+        if depth < 0:
+            return   # enabled while the section was running
+        self._depth[slot] = depth
+        if depth:
+            return
+        elapsed = self.clock() - self._start[slot]
+        allocated = self._free[slot] - self.free()
+        self.total_ns[slot] += elapsed
+        if elapsed > self.max_ns[slot]:
+            self.max_ns[slot] = elapsed
+        if allocated > 0:
+            self.alloc[slot] += allocated
+            if allocated > self.max_alloc[slot]:
+                self.max_alloc[slot] = allocated
+
+    def stats(self, name):
+        """Statistics of one section as a dict, or None if it is not measured."""
+        section = self.sections.get(name)
+        if section is None or section.slot is None:
+            return None
+        slot = section.slot
+        calls = self.calls[slot]
+        return {
+            "name": name,
+            "calls": calls,
+            "total_ms": self.total_ns[slot] / 1e6,
+            "avg_us": self.total_ns[slot] / (calls or 1) / 1000,
+            "max_us": self.max_ns[slot] / 1000,
+            "alloc": self.alloc[slot],
+            "max_alloc": self.max_alloc[slot],
+        }
+
+    def report(self):
+        """Statistics of every section that was called, most time first."""
+        stats = [self.stats(self.names[slot]) for slot in range(self.count) if self.calls[slot]]
+        stats.sort(key=lambda s: -s["total_ms"])
+        return stats
+
+    def report_lines(self):
+        elapsed = (self.clock() - self.since) / 1e9 if self.since else 0
+        lines = [f"{'section':20s} {'calls':>6s} {'total ms':>9s} {'avg us':>8s} {'max us':>8s} {'alloc B':>8s}"]
+        for s in self.report():
+            lines.append(f"{s['name'][:20]:20s} {s['calls']:6d} {s['total_ms']:9.1f} {s['avg_us']:8.1f} "
+                         f"{s['max_us']:8.0f} {s['alloc']:8d}")
+        free = self.free()
+        lines.append(f"{elapsed:.1f} s profiled" + (f", heap free {free} bytes" if free > 0 else ""))
+        if self.overflow:
+            lines.append(f"{self.overflow} sections not measured (capacity {self.capacity})")
+        return lines
+
+    def print_report(self):
+        for line in self.report_lines():
+            print(line)
+
+    def dump(self, path=None):
+        """Print the report and write it to path (REPORT_FILE on the SD card by default); returns the path."""
+        lines = self.report_lines()
+        for line in lines:
+            print(line)
+        if path is None:
+            from sd_storage import SD_ROOT
+            path = f"{SD_ROOT}/{REPORT_FILE}"
+        from sd_storage import get_storage
+        try:
+            get_storage().write_atomic(path, "\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Could not write profile report: {e}")
+            return None
+        return path
+
+
+_profiler = None
+
+
+def get_profiler():
+    """The Profiler every section() registers with."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def section(name):
+    return get_profiler().section(name)
+
+
+def profiled(name):
+    """Decorator running a function under section(name)."""
+    measured = section(name)
+
+    def decorate(function):
+        def wrapper(*args, **kwargs):
+            with measured:
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profile_report_command():
+    """A Command that shows the profile report and saves it to the SD card."""
+    from command_registry import Command
+    return Command("Profiler: Show and save report", "Show where time and heap went, per section, and save it to the SD card",
+                   get_profiler().dump)
@@ -0,0 +1,283 @@
+'''scheduler.py - Cooperative asyncio scheduler for one-shot, background and periodic commands.
+
+Scheduler.submit(command) runs a command according to its mode (command_registry.ONE_SHOT,
+BACKGROUND or PERIODIC):
+  - one-shot: run once, as soon as the scheduler gets to it
+  - background: the callback returns a coroutine (a scanner or logger loop), which runs as its own task
+  - periodic: run every command.period seconds. Periods are counted from the first due time, not
+    from when the last run finished, so runs do not drift. Runs missed while the device was busy
+    are skipped, not replayed.
+Due jobs are kept in a binary heap ordered by due time. The scheduler task sleeps until the earliest
+one is due, or until submit() adds a job that is due sooner. Jobs that are due together run back
+to back, but the scheduler yields to the other tasks whenever SLICE_NS has passed, so the menu
+stays responsive. A job's callback still runs to completion once started. A
+callback that returns a coroutine is run as a task, and a periodic job is not started again while
+its previous run is unfinished.
+
+Every Job keeps run-time accounting: runs, total and longest run time, and how late its runs started
+(scheduling jitter). report() returns them and print_report() prints them.
+'''
+
+import time
+
+from command_registry import ONE_SHOT, PERIODIC
+
+SLICE_NS = 2000000   # jobs due together run back to back for up to this long before the scheduler yields
+
+
+class Job:
+    __slots__ = ("name", "callback", "args", "kwargs", "mode", "period", "due", "order", "active", "task",
+                 "runs", "errors", "total_ns", "max_ns", "late_total_ns", "late_max_ns")
+
+    def __init__(self, name, callback, args, kwargs, mode, period):
+        self.name = name
+        self.callback = callback
+        self.args = args or ()
+        self.kwargs = kwargs or {}
+        self.mode = mode
+        self.period = period
+        self.due = 0
+        self.order = 0         # breaks ties between jobs due at the same time, first submitted first
+        self.active = True     # False once cancelled or finished
+        self.task = None       # asyncio task of a run that returned a coroutine
+        self.runs = 0
+        self.errors = 0
+        self.total_ns = 0      # time spent in the callback (or its coroutine, from start to finish)
+        self.max_ns = 0
+        self.late_total_ns = 0  # how late runs started after their due time
+        self.late_max_ns = 0
+
+    def account(self, elapsed_ns):
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+    def stats(self):
+        runs = self.runs or 1
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "runs": self.runs,
+            "errors": self.errors,
+            "avg_ms": self.total_ns / runs / 1e6,
+            "max_ms": self.max_ns / 1e6,
+            "late_avg_ms": self.late_total_ns / runs / 1e6,
+            "late_max_ms": self.late_max_ns / 1e6,
+        }
+
+
+def _before(a, b):
+    return a.due < b.due or (a.due == b.due and a.order < b.order)
+
+
+def _heap_push(heap, job):
+    heap.append(job)
+    i = len(heap) - 1
+    while i:
+        parent = (i - 1) >> 1
+        if not _before(job, heap[parent]):
+            break
+        heap[i] = heap[parent]
+        i = parent
+    heap[i] = job
+
+
+def _heap_pop(heap):
+    last = heap.pop()
+    if not heap:
+        return last
+    top = heap[0]
+    count = len(heap)
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= count:
+            break
+        if child + 1 < count and _before(heap[child + 1], heap[child]):
+            child += 1
+        if not _before(heap[child], last):
+            break
+        heap[i] = heap[child]
+        i = child
+    heap[i] = last
+    return top
+
+
+class Scheduler:
+    def __init__(self, clock=time.monotonic_ns):
+        """clock: Nanosecond clock; due times and accounting use it."""
+        self.clock = clock
+        self.jobs = []       # every job submitted and not finished, for report() and cancel()
+        self._heap = []
+        self._order = 0
+        self._wake = None
+        self.wakeups = 0     # times the scheduler task woke up, for benchmarks
+        self.overhead_ns = 0  # time spent scheduling, outside the callbacks
+
+    def _event(self):
+        if self._wake is None:
+            import asyncio
+            self._wake = asyncio.Event()
+        return self._wake
+
+    def _queue(self, job, due):
+        job.due = due
+        self._order += 1
+        job.order = self._order
+        _heap_push(self._heap, job)
+        if self._heap[0] is job:
+            self._event().set()
+
+    def add(self, name, callback, args=None, kwargs=None, mode=ONE_SHOT, period=None, delay=0):
+        """Schedule callback(*args, **kwargs) under name; returns its Job. A periodic job first runs after delay seconds."""
+        if mode == PERIODIC and not period:
+            raise ValueError("periodic job %s needs a period" % name)
+        job = Job(name, callback, args, kwargs, mode, period)
+        self.jobs.append(job)
+        self._queue(job, self.clock() + int(delay * 1e9))
+        return job
+
+    def submit(self, command, delay=0):
+        """Schedule a command (Command or CommandView) according to its mode and period.
+
+        Runs go through command.execute, so they are counted in the profiler's command.execute section.
+        If a job of the same name is still active (a periodic command picked from the menu again, say),
+        nothing new is scheduled and that job is returned.
+        """
+        job = self.find(command.name)
+        if job is not None:
+            return job
+        return self.add(command.name, command.execute, None, None,
+                        getattr(command, "mode", ONE_SHOT), getattr(command, "period", None), delay)
+
+    def find(self, name):
+        """Return the active job called name, or None."""
+        for job in self.jobs:
+            if job.name == name and job.active:
+                return job
+        return None
+
+    def every(self, period, name, callback, *args):
+        return self.add(name, callback, args, None, PERIODIC, period)
+
+    def cancel(self, job):
+        """Stop a job: it is not run again, and a running background task or coroutine is cancelled."""
+        job.active = False
+        if job.task is not None:
+            job.task.cancel()
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def _finish(self, job):
+        job.active = False
+        if job in self.jobs:
+            self.jobs.remove(job)
+
+    async def _watch(self, job, coroutine, start):
+        """Run a coroutine returned by a callback, accounting for it when it ends."""
+        try:
+            result = await coroutine
+            if result is not None and job.mode == ONE_SHOT:
+                print(f"{job.name}: {result}")
+        except Exception as e:
+            job.errors += 1
+            print(f"Job {job.name} failed: {e}")
+        finally:
+            job.account(self.clock() - start)
+            job.task = None
+            if job.mode != PERIODIC:
+                self._finish(job)
+
+    def _run(self, job, now):
+        """Start one run of job; returns the nanoseconds spent in its callback."""
+        import asyncio
+        job.runs += 1
+        late = now - job.due
+        job.late_total_ns += late
+        if late > job.late_max_ns:
+            job.late_max_ns = late
+        start = self.clock()
+        try:
+            result = job.callback(*job.args, **job.kwargs)
+        except Exception as e:
+            job.errors += 1
+            result = None
+            print(f"Job {job.name} failed: {e}")
+        if hasattr(result, "send"):
+            job.task = asyncio.create_task(self._watch(job, result, start))
+            return 0
+        if result is not None and job.mode == ONE_SHOT:
+            print(f"{job.name}: {result}")
+        elapsed = self.clock() - start
+        job.account(elapsed)
+        if job.mode != PERIODIC:
+            self._finish(job)
+        return elapsed
+
+    async def run(self):
+        """Run due jobs until cancelled."""
+        import asyncio
+        heap = self._heap
+        wake = self._event()
+        slice_start = self.clock()
+        while True:
+            now = self.clock()
+            if now - slice_start >= SLICE_NS:
+                await asyncio.sleep(0)
+                slice_start = now = self.clock()
+            if heap and heap[0].due <= now:
+                job = _heap_pop(heap)
+                if not job.active:
+                    continue
+                if job.mode == PERIODIC:
+                    # Next due time on the job's own grid, skipping runs that are already past
+                    period = int(job.period * 1e9)
+                    due = job.due + period
+                    if due <= now:
+                        due += (now - due) // period * period + period
+                spent = 0
+                if job.task is None:   # a periodic job whose last run is still going is skipped
+                    spent = self._run(job, now)
+                if job.mode == PERIODIC and job.active:
+                    job.due = due
+                    self._order += 1
+                    job.order = self._order
+                    _heap_push(heap, job)
+                self.overhead_ns += self.clock() - now - spent
+                continue
+            wake.clear()
+            self.wakeups += 1
+            if heap:
+                try:
+                    await asyncio.wait_for(wake.wait(), (heap[0].due - now) / 1e9)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await wake.wait()
+            slice_start = self.clock()
+
+    def report(self):
+        """Per-job statistics, busiest first."""
+        stats = [job.stats() for job in self.jobs]
+        stats.sort(key=lambda s: -s["avg_ms"] * s["runs"])
+        return stats
+
+    def print_report(self):
+        for s in self.report():
+            print(f"{s['name'][:24]:24s} {s['mode']:10s} {s['runs']:5d} runs  avg {s['avg_ms']:7.2f} ms  "
+                  f"max {s['max_ms']:7.2f} ms  late avg {s['late_avg_ms']:6.2f} max {s['late_max_ms']:6.2f} ms")
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """The scheduler code.py runs; commands selected in the menu are submitted to it."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
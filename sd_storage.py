@@ -0,0 +1,320 @@
+'''sd_storage.py - SD card access for every module: one mount, cached file handles and write-behind buffers.
+
+Small, frequent writes are slow on FAT over SPI, and each one reprograms whole 512-byte sectors of the
+card. Modules that write to the card go through the Storage returned by get_storage():
+  - mount() mounts the card once; later calls return the cached result without touching SPI.
+  - append(path, data) adds data to the file's write-behind buffer. The buffer goes to the card once it
+    holds flush_bytes, and then only up to the last sector boundary of the file, so the next write
+    starts on a fresh sector; the rest waits for more data. tick() writes out buffers that are older
+    than flush_age seconds, and while the battery is below LOW_BATTERY percent every append is written
+    through, so little is lost if the device browns out. Files being appended to stay open (up to
+    max_handles of them), so a write does not walk the FAT to find the end of the file again.
+  - replace(path) returns a file for writing a whole file, such as a config file or the command list.
+    It writes to path + ".tmp" and renames that over path when closed without an error, so a crash
+    leaves the old file or the new one, never half of one. FAT cannot rename over an existing file,
+    so there the old file is first renamed to path + ".old"; recover(path) finishes a replace that
+    was interrupted between the two renames.
+If a write fails (card missing or read-only), the data stays buffered and goes out with the next flush.
+While that is the case, an append that would take a buffer past max_pending bytes is dropped whole and
+counted, so records in the file are never cut in half.
+
+Readers of a file that is appended to call flush(path) first so they see everything written so far.
+Storage works on any directory, so on the host it runs against a temporary directory with a mounter
+that does nothing (see benchmarks/bench_sd_storage.py).
+'''
+
+import os
+import time
+
+from profiler import section
+
+SD_ROOT = "/sd"
+SECTOR_SIZE = 512         # bytes per SD card block
+FLUSH_BYTES = 4 * SECTOR_SIZE
+FLUSH_AGE = 30            # seconds buffered data may wait before tick() writes it
+TICK_INTERVAL = 5         # seconds between tick() calls from the scheduler
+MAX_PENDING = 16 * 1024   # bytes buffered per file while it cannot be written
+MAX_HANDLES = 4
+LOW_BATTERY = 10          # percent; below it appends are written through
+
+_WRITE = section("sd.write")
+_REPLACE = section("sd.replace")
+
+
+def _mount_spi(root):
+    """Mount the Cardputer's SD card on SPI at root; returns the SDCard."""
+    import board
+    import digitalio
+    import adafruit_sdcard
+    import storage
+    cs = digitalio.DigitalInOut(board.SD_CS)
+    sdcard = adafruit_sdcard.SDCard(board.SD_SPI(), cs)
+    storage.mount(storage.VfsFat(sdcard), root, readonly=False)
+    print(f"SD Card mounted at {root}")
+    return sdcard
+
+
+def _file_size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return 0
+
+
+class FileBuffer:
+    __slots__ = ("data", "position", "since", "failed")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.position = None   # size of the file on the card, read on the first write
+        self.since = None      # when the oldest unwritten byte was added
+        self.failed = False    # the last write failed
+
+
+class AtomicFile:
+    """File returned by Storage.replace(); writes go to a temporary file that replaces path on close."""
+
+    def __init__(self, path, binary=True):
+        self.path = path
+        self.temporary = path + ".tmp"
+        self.f = open(self.temporary, "wb" if binary else "w")
+        _REPLACE.__enter__()   # the whole replace, from here to close()
+
+    def write(self, data):
+        return self.f.write(data)
+
+    def close(self, commit=True):
+        try:
+            self._close(commit)
+        finally:
+            _REPLACE.__exit__(None, None, None)
+
+    def _close(self, commit):
+        self.f.close()
+        if not commit:
+            try:
+                os.remove(self.temporary)
+            except OSError:
+                pass
+            return
+        try:
+            os.rename(self.temporary, self.path)
+            return
+        except OSError:
+            pass
+        # FAT does not rename over an existing file. The new version is complete once the old one
+        # is moved aside, so recover() can finish the job from there.
+        old = self.path + ".old"
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+        os.rename(self.path, old)
+        os.rename(self.temporary, self.path)
+        os.remove(old)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close(kind is None)
+        return False
+
+
+class Storage:
+    def __init__(self, root=SD_ROOT, mounter=None, clock=time.monotonic, flush_bytes=FLUSH_BYTES,
+                 flush_age=FLUSH_AGE, max_pending=MAX_PENDING, max_handles=MAX_HANDLES):
+        """
+        root: Where the card is mounted.
+        mounter: Function taking root that mounts the card and returns it; defaults to the SPI card.
+        """
+        self.root = root
+        self.mounter = mounter or _mount_spi
+        self.clock = clock
+        self.flush_bytes = flush_bytes
+        self.flush_age = flush_age
+        self.max_pending = max_pending
+        self.max_handles = max_handles
+        self.battery = None         # function returning the battery percent or None, checked by tick()
+        self.write_through = False  # set by tick() while the battery is low
+        self.mounted = False
+        self.card = None
+        self._buffers = {}          # path -> FileBuffer
+        self._handles = []          # [path, file] open for appending, least recently used first
+        self.opens = 0              # files opened, writes issued and bytes written, for benchmarks
+        self.writes = 0
+        self.bytes_written = 0
+        self.dropped = 0            # appends dropped while a file could not be written
+
+    def mount(self):
+        """Mount the card if it is not mounted yet; returns True if it is mounted."""
+        if not self.mounted:
+            try:
+                self.card = self.mounter(self.root)
+                self.mounted = True
+            except Exception as e:
+                print(f"Error mounting SD Card: {e}")
+        return self.mounted
+
+    def _handle(self, path):
+        handles = self._handles
+        for entry in handles:
+            if entry[0] == path:
+                if entry is not handles[-1]:
+                    handles.remove(entry)
+                    handles.append(entry)
+                return entry[1]
+        if len(handles) >= self.max_handles:
+            handles.pop(0)[1].close()
+        f = open(path, "ab")
+        self.opens += 1
+        handles.append([path, f])
+        return f
+
+    def _close_handle(self, path):
+        for entry in self._handles:
+            if entry[0] == path:
+                self._handles.remove(entry)
+                try:
+                    entry[1].close()
+                except OSError:
+                    pass
+                return
+
+    def _write(self, path, buffer, count):
+        """Write the first count bytes of a file's buffer; returns the bytes written."""
+        if count <= 0:
+            return 0
+        data = buffer.data
+        try:
+            with _WRITE:
+                if buffer.position is None:
+                    buffer.position = _file_size(path)
+                f = self._handle(path)
+                f.write(data if count == len(data) else data[:count])
+                f.flush()
+        except OSError:
+            buffer.failed = True
+            buffer.position = None
+            self._close_handle(path)
+            return 0
+        buffer.failed = False
+        buffer.position += count
+        buffer.data = data[count:] if count < len(data) else bytearray()
+        buffer.since = self.clock() if buffer.data else None
+        self.writes += 1
+        self.bytes_written += count
+        return count
+
+    def append(self, path, data):
+        """Queue data (bytes or str) to be appended to path; returns False if it was dropped."""
+        if isinstance(data, str):
+            data = data.encode()
+        buffer = self._buffers.get(path)
+        if buffer is None:
+            buffer = self._buffers[path] = FileBuffer()
+        elif buffer.failed and len(buffer.data) + len(data) > self.max_pending:
+            self.dropped += 1
+            return False
+        if not buffer.data:
+            buffer.since = self.clock()
+        buffer.data += data
+        if self.write_through:
+            self._write(path, buffer, len(buffer.data))
+        elif len(buffer.data) >= self.flush_bytes:
+            if buffer.position is None:
+                buffer.position = _file_size(path)
+            end = buffer.position + len(buffer.data)
+            self._write(path, buffer, end - end % SECTOR_SIZE - buffer.position)
+        return True
+
+    def pending(self, path=None):
+        """Bytes buffered for path, or for all files."""
+        if path is not None:
+            buffer = self._buffers.get(path)
+            return len(buffer.data) if buffer is not None else 0
+        return sum(len(buffer.data) for buffer in self._buffers.values())
+
+    def flush(self, path=None):
+        """Write out everything buffered for path, or for all files; returns the bytes written."""
+        if path is not None:
+            buffer = self._buffers.get(path)
+            return self._write(path, buffer, len(buffer.data)) if buffer is not None else 0
+        return sum(self._write(p, buffer, len(buffer.data)) for p, buffer in self._buffers.items())
+
+    def tick(self):
+        """Write out buffers older than flush_age, or all of them if the battery is low. Run every TICK_INTERVAL."""
+        if self.battery is not None:
+            percent = self.battery()
+            self.write_through = percent is not None and percent < LOW_BATTERY
+        if self.write_through:
+            return self.flush()
+        limit = self.clock() - self.flush_age
+        written = 0
+        for path, buffer in self._buffers.items():
+            if buffer.data and buffer.since <= limit:
+                written += self._write(path, buffer, len(buffer.data))
+        return written
+
+    def close(self, path=None):
+        """Flush and close path, or every file; buffers that could not be written are kept."""
+        self.flush(path)
+        if path is not None:
+            self._close_handle(path)
+            return
+        for entry in self._handles:
+            entry[1].close()
+        self._handles = []
+
+    def replace(self, path, binary=True):
+        """Return an AtomicFile for rewriting path as a whole; use it in a with statement.
+
+        Data still buffered for path is dropped, since the new contents replace it.
+        """
+        self._buffers.pop(path, None)
+        self._close_handle(path)
+        return AtomicFile(path, binary)
+
+    def write_atomic(self, path, data):
+        """Replace the contents of path with data (bytes or str) in one crash-safe step."""
+        with self.replace(path, not isinstance(data, str)) as f:
+            f.write(data)
+
+    def recover(self, path):
+        """Finish a replace of path that a crash interrupted; returns True if it did.
+
+        Only a new version whose old one was already moved aside is complete. A lone path + ".tmp"
+        may be half written and is left alone.
+        """
+        old = path + ".old"
+        try:
+            os.stat(old)
+        except OSError:
+            return False
+        try:
+            os.stat(path)
+        except OSError:
+            try:
+                os.rename(path + ".tmp", path)
+            except OSError:
+                os.rename(old, path)   # the new version is gone; keep the old one
+                return False
+        os.remove(old)
+        return True
+
+
+_storage = None
+
+
+def get_storage():
+    """The Storage every module writes to the SD card through."""
+    global _storage
+    if _storage is None:
+        _storage = Storage()
+    return _storage
+
+
+def mount_sdcard():
+    """Mount the SD card at SD_ROOT once; returns the SDCard, or None if it could not be mounted."""
+    storage = get_storage()
+    return storage.card if storage.mount() else None
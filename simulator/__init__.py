@@ -0,0 +1,121 @@
+'''simulator - Host-side stand-ins for the Cardputer's hardware, for benchmarks and regression runs.
+
+Device modules import board, displayio, terminalio, cardputer_keyboard, analogio, digitalio, storage,
+adafruit_sdcard, adafruit_ble, adafruit_hid and wifi at import time. The install functions put
+stand-ins for them into sys.modules, so the same modules import and run unchanged on desktop Python:
+  - install(): the display (display.FakeDisplay records the frames shown), fonts and labels, the
+    keyboard, a programmable ADC (adc.FakeAnalogIn), digital pins, and an SD card that mounts as nothing
+  - install_sdcard(directory): back the SD card with a directory; writes are counted by sector
+  - install_ble(): an in-memory BLE radio and HID keyboard (ble.py)
+  - install_wifi(radio): a Wi-Fi radio with simulated networks (wifi.py)
+keyboard.ScriptedStdin and ScriptedKeySource script serial input, clock.FakeClock simulated time, and loopback.py is a
+lossy in-process packet network for the ESP-NOW protocols. Call install() before importing device
+modules.
+'''
+
+import sys
+import types
+
+from simulator.adc import FakeAnalogIn, FakeDigitalInOut
+from simulator.ble import (FakeAdvertisement, FakeBLERadio, FakeHIDKeyboard, FakeKeyboardLayout, FakeKeycode,
+                           FakeService)
+from simulator.clock import FakeClock
+from simulator.display import (FakeBitmap, FakeDisplay, FakeFont, FakeGroup, FakeLabel, FakePalette,
+                               FakeTileGrid)
+from simulator.keyboard import ScriptedKeySource, ScriptedStdin
+from simulator.sdcard import CountingFile, DirectoryCard, FakeSDCard, FakeVfsFat
+from simulator.wifi import FakeAuthMode, FakeNetwork, FakeWiFiRadio
+
+
+def install(width=240, height=135):
+    """Register the fake modules in sys.modules and return the fake display."""
+    display = FakeDisplay(width, height)
+
+    board = types.ModuleType("board")
+    board.DISPLAY = display
+    board.SD_CS = "SD_CS"
+    board.BAT_ADC = "BAT_ADC"
+    board.SD_SPI = lambda: "SD_SPI"
+    displayio = types.ModuleType("displayio")
+    displayio.Group = FakeGroup
+    displayio.Bitmap = FakeBitmap
+    displayio.Palette = FakePalette
+    displayio.TileGrid = FakeTileGrid
+    terminalio = types.ModuleType("terminalio")
+    terminalio.FONT = FakeFont()
+    display_text = types.ModuleType("adafruit_display_text")
+    label = types.ModuleType("adafruit_display_text.label")
+    label.Label = FakeLabel
+    display_text.label = label
+    cardputer_keyboard = types.ModuleType("cardputer_keyboard")
+    cardputer_keyboard.attach_serial = lambda: None
+    storage = types.ModuleType("storage")
+    storage.VfsFat = FakeVfsFat
+    storage.mount = lambda vfs, path, readonly=False: None
+    adafruit_sdcard = types.ModuleType("adafruit_sdcard")
+    adafruit_sdcard.SDCard = FakeSDCard
+    digitalio = types.ModuleType("digitalio")
+    digitalio.DigitalInOut = FakeDigitalInOut
+    analogio = types.ModuleType("analogio")
+    analogio.AnalogIn = FakeAnalogIn
+
+    sys.modules.update({
+        "board": board,
+        "displayio": displayio,
+        "terminalio": terminalio,
+        "adafruit_display_text": display_text,
+        "adafruit_display_text.label": label,
+        "cardputer_keyboard": cardputer_keyboard,
+        "storage": storage,
+        "adafruit_sdcard": adafruit_sdcard,
+        "digitalio": digitalio,
+        "analogio": analogio,
+    })
+    return display
+
+
+def install_wifi(radio=None):
+    """Register a fake wifi module whose radio is radio (a FakeWiFiRadio with no networks by default)."""
+    wifi = types.ModuleType("wifi")
+    wifi.radio = radio if radio is not None else FakeWiFiRadio()
+    wifi.AuthMode = FakeAuthMode
+    sys.modules["wifi"] = wifi
+    return wifi.radio
+
+
+def install_ble():
+    """Register fake adafruit_hid and adafruit_ble modules (the ones keyboard/ble_keyboard.py imports)."""
+    modules = {}
+    for name in ("adafruit_hid", "adafruit_hid.keyboard", "adafruit_hid.keyboard_layout_us", "adafruit_hid.keycode",
+                 "adafruit_ble", "adafruit_ble.advertising", "adafruit_ble.advertising.standard",
+                 "adafruit_ble.services", "adafruit_ble.services.standard", "adafruit_ble.services.standard.hid",
+                 "adafruit_ble.services.standard.device_info"):
+        modules[name] = types.ModuleType(name)
+    modules["adafruit_hid.keyboard"].Keyboard = FakeHIDKeyboard
+    modules["adafruit_hid.keyboard_layout_us"].KeyboardLayoutUS = FakeKeyboardLayout
+    modules["adafruit_hid.keycode"].Keycode = FakeKeycode
+    modules["adafruit_ble"].BLERadio = FakeBLERadio
+    modules["adafruit_ble"].__version__ = "0.0.0-fake"
+    modules["adafruit_ble.advertising"].Advertisement = FakeAdvertisement
+    modules["adafruit_ble.advertising.standard"].ProvideServicesAdvertisement = FakeAdvertisement
+    modules["adafruit_ble.services.standard.hid"].HIDService = FakeService
+    modules["adafruit_ble.services.standard.device_info"].DeviceInfoService = FakeService
+    sys.modules.update(modules)
+
+
+def install_sdcard(directory):
+    """Back the SD card with directory and return its DirectoryCard.
+
+    SD_ROOT points at directory, and the storage service is replaced by one that mounts the card
+    there. The storage service and command_registry open files through the DirectoryCard, so their
+    writes are counted.
+    """
+    import command_registry
+    import sd_storage
+    card = DirectoryCard(directory)
+    sd_storage.SD_ROOT = directory
+    command_registry.SD_ROOT = directory
+    sd_storage._storage = sd_storage.Storage(directory, card.mount)
+    sd_storage.open = card.open
+    command_registry.open = card.open
+    return card
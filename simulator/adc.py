@@ -0,0 +1,43 @@
+'''adc.py - analogio and digitalio stand-ins with a programmable battery voltage.
+
+Every FakeAnalogIn is kept in FakeAnalogIn.pins by its pin, so a benchmark can program the ADC a
+module created at import (battery.battery reads board.BAT_ADC). Set `millivolts` to the voltage at
+the pin, or call set_battery() with the voltage at the battery; `noise_mv` adds Gaussian read noise.
+An ADC that was never programmed reads default_value.
+'''
+
+import random
+
+
+class FakeAnalogIn:
+    reference_voltage = 3.3
+    default_value = 41000
+    pins = {}
+
+    def __init__(self, pin, seed=1):
+        self.pin = pin
+        self.millivolts = None   # voltage at the pin; None reads default_value
+        self.noise_mv = 0.0
+        self.random = random.Random(seed)
+        self.reads = 0
+        FakeAnalogIn.pins[pin] = self
+
+    def set_battery(self, millivolts, divider=2.0):
+        """Program the voltage of the battery behind a divider of the given ratio."""
+        self.millivolts = millivolts / divider
+
+    @property
+    def value(self):
+        self.reads += 1
+        if self.millivolts is None:
+            return self.default_value
+        millivolts = self.millivolts
+        if self.noise_mv:
+            millivolts += self.random.gauss(0, self.noise_mv)
+        value = int(millivolts / 1000 / self.reference_voltage * 65535)
+        return max(0, min(65535, value))
+
+
+class FakeDigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
@@ -0,0 +1,86 @@
+'''ble.py - In-memory adafruit_ble radio and adafruit_hid keyboard.
+
+FakeHIDKeyboard keeps the keycodes it was sent and counts the reports; each report can take
+report_delay seconds, like a BLE connection interval. FakeBLERadio is always connected.
+'''
+
+import time
+
+
+class FakeHIDKeyboard:
+    """adafruit_hid Keyboard stand-in; every report takes report_delay seconds, like a BLE connection interval."""
+
+    report_delay = 0.0
+
+    def __init__(self, devices=None):
+        self.devices = devices
+        self.reports = 0
+        self.sent = []
+
+    def _report(self):
+        self.reports += 1
+        if FakeHIDKeyboard.report_delay:
+            time.sleep(FakeHIDKeyboard.report_delay)
+
+    def press(self, *keycodes):
+        self._report()
+
+    def release_all(self):
+        self._report()
+
+    def send(self, *keycodes):
+        self.sent.extend(keycodes)
+        self.press(*keycodes)
+        self.release_all()
+
+
+class FakeKeyboardLayout:
+    def __init__(self, keyboard):
+        self.keyboard = keyboard
+
+    def keycodes(self, char):
+        return (ord(char),)
+
+    def write(self, text):
+        for char in text:
+            self.keyboard.send(ord(char))
+
+
+class FakeKeycode:
+    UP_ARROW = 0x52
+    DOWN_ARROW = 0x51
+    RIGHT_ARROW = 0x4F
+    LEFT_ARROW = 0x50
+    HOME = 0x4A
+    END = 0x4D
+    PAGE_UP = 0x4B
+    PAGE_DOWN = 0x4E
+    INSERT = 0x49
+    DELETE = 0x4C
+    ESCAPE = 0x29
+    TAB = 0x2B
+    F1, F2, F3, F4, F5, F6, F7, F8, F9, F10, F11, F12 = range(0x3A, 0x46)
+    SHIFT = 0xE1
+    ALT = 0xE2
+    CONTROL = 0xE0
+    GUI = 0xE3
+
+
+class FakeBLERadio:
+    def __init__(self):
+        self.connected = True
+        self.connections = []
+        self.advertising = False
+
+    def start_advertising(self, advertisement, scan_response=None):
+        self.advertising = True
+
+
+class FakeAdvertisement:
+    def __init__(self, *services):
+        self.services = services
+
+
+class FakeService:
+    def __init__(self, **kwargs):
+        self.devices = []
@@ -0,0 +1,17 @@
+'''clock.py - Simulated time for code that takes its clock as a parameter.'''
+
+
+class FakeClock:
+    """Replacement for time.monotonic/time.sleep where sleeping just advances the clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.on_sleep = None
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.on_sleep:
+            self.on_sleep(seconds)
@@ -0,0 +1,124 @@
+'''display.py - displayio, terminalio and adafruit_display_text stand-ins, with a recording display.
+
+FakeDisplay keeps what would be on the screen. render() turns the visible labels of the scene
+(root_group and the groups in it) into text rows, top to bottom, each label placed at its character
+column. refresh() renders a frame and keeps it in `frames` if it differs from the one before, as
+the display's auto-refresh would show it; `refreshes` counts every call. FakeLabel counts every text
+and color write in FakeLabel.mutations, which is what a redraw costs on the device.
+'''
+
+import time
+
+
+class FakeFont:
+    def get_bounding_box(self):
+        return (6, 14)
+
+
+class FakeDisplay:
+    def __init__(self, width=240, height=135, max_frames=256):
+        self.width = width
+        self.height = height
+        self.brightness = 1.0
+        self.root_group = None
+        self.auto_refresh = True
+        self.frames = []          # (time.monotonic(), rows) of each distinct frame, oldest first
+        self.max_frames = max_frames
+        self.refreshes = 0
+
+    def _labels(self, group, found):
+        for item in group:
+            if getattr(item, "hidden", False):
+                continue
+            if isinstance(item, FakeGroup):
+                self._labels(item, found)
+            elif isinstance(item, FakeLabel) and item.text:
+                found.append(item)
+        return found
+
+    def render(self):
+        """The visible text as a list of rows, one per label baseline, top to bottom."""
+        if self.root_group is None:
+            return []
+        cell = FakeFont().get_bounding_box()[0]
+        rows = {}
+        for label in self._labels(self.root_group, []):
+            rows.setdefault(label.y, []).append(label)
+        lines = []
+        for y in sorted(rows):
+            line = ""
+            for label in sorted(rows[y], key=lambda label: label.x):
+                column = max(0, label.x // cell)
+                line = line.ljust(column) + label.text if column >= len(line) else line + " " + label.text
+            lines.append(line.rstrip())
+        return lines
+
+    def refresh(self):
+        """Render a frame, keep it if the screen changed and return its rows."""
+        self.refreshes += 1
+        rows = self.render()
+        if not self.frames or self.frames[-1][1] != rows:
+            self.frames.append((time.monotonic(), rows))
+            if len(self.frames) > self.max_frames:
+                del self.frames[0]
+        return rows
+
+    def text(self):
+        return "\n".join(self.render())
+
+
+class FakeGroup(list):
+    pass
+
+
+class FakeBitmap:
+    def __init__(self, width, height, value_count):
+        self.width = width
+        self.height = height
+        # Same storage as a real Bitmap, so allocation measurements see it
+        bits = max(1, (value_count - 1).bit_length())
+        self.data = bytearray((width * height * bits + 7) // 8)
+
+
+class FakePalette(list):
+    def __init__(self, count):
+        super().__init__([0] * count)
+
+
+class FakeTileGrid:
+    def __init__(self, bitmap, pixel_shader=None, x=0, y=0):
+        self.bitmap = bitmap
+        self.pixel_shader = pixel_shader
+        self.x = x
+        self.y = y
+
+
+class FakeLabel:
+    """Label stand-in that counts every .text and .color assignment."""
+
+    mutations = 0
+
+    def __init__(self, font, text="", color=0xFFFFFF, x=0, y=0):
+        self.font = font
+        self._text = text
+        self._color = color
+        self.x = x
+        self.y = y
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        FakeLabel.mutations += 1
+        self._text = value
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        FakeLabel.mutations += 1
+        self._color = value
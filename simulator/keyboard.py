@@ -0,0 +1,50 @@
+'''keyboard.py - Scripted keyboard input for the serial key reader and the keyboard loops.
+
+ScriptedStdin stands in for sys.stdin: it hands out the characters it was fed, and nothing once the
+script runs out, the way a non-blocking read of the serial console does. ScriptedKeySource is a
+UIEventLoop key source that types a script, one chunk every `interval` seconds; installed as
+ui_loop.StdinKeySource it drives the screens that create their own key source, such as code.py's menu.
+'''
+
+
+class ScriptedStdin:
+    """Non-blocking stdin stand-in: read() hands out queued characters, or '' when the script is empty."""
+
+    def __init__(self, script=""):
+        self.buffer = list(script)
+
+    def feed(self, text):
+        self.buffer.extend(text)
+
+    def read(self, n=1):
+        out = self.buffer[:n]
+        del self.buffer[:n]
+        return "".join(out)
+
+
+class ScriptedKeySource:
+    """Key source typing keys (chunks of input) one every interval seconds, then waiting forever.
+
+    on_read is called each time the loop asks for the next key, after it handled the one before; pass
+    FakeDisplay.refresh to record a frame per key. Calling the instance returns itself, so it can stand
+    in for the StdinKeySource class and every screen opened reads the rest of the same script.
+    """
+
+    def __init__(self, keys, interval=0.0, on_read=None):
+        self.keys = list(keys)
+        self.interval = interval
+        self.on_read = on_read
+        self.typed = 0
+
+    def __call__(self, *args):
+        return self
+
+    async def read(self):
+        import asyncio
+        if self.on_read is not None:
+            self.on_read()
+        if not self.keys:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.interval)
+        self.typed += 1
+        return self.keys.pop(0)
@@ -0,0 +1,77 @@
+'''loopback.py - In-process packet network for exercising the radio protocols on the host.
+
+LoopbackNetwork connects any number of endpoints. Each packet is delayed by a random latency and
+lost with probability `loss`; broadcasts are delivered (or lost) independently to every other
+endpoint. Endpoints have the transport interface the connectivity modules use: send(mac, data) and
+receive() -> (mac, data) or None. An endpoint with a handler gets packets pushed to it instead,
+which is how simulated peers answer without a task of their own. Packets are delivered whenever
+any endpoint sends or receives and their time has come.
+'''
+
+import heapq
+import itertools
+import random
+import time
+
+BROADCAST = b"\xff" * 6
+
+
+class LoopbackEndpoint:
+    def __init__(self, network, mac, handler=None):
+        self.network = network
+        self.mac = mac
+        self.handler = handler   # called as handler(source_mac, data) on delivery, if set
+        self.inbox = []
+        self.sent = 0
+
+    def send(self, mac, data):
+        self.sent += 1
+        self.network.send(self.mac, bytes(mac), bytes(data))
+
+    def receive(self):
+        self.network.deliver()
+        if not self.inbox:
+            return None
+        return self.inbox.pop(0)
+
+
+class LoopbackNetwork:
+    def __init__(self, loss=0.0, latency=(0.001, 0.005), seed=1, clock=time.monotonic):
+        self.loss = loss
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.clock = clock
+        self.endpoints = {}
+        self._queue = []   # (due time, order, destination, source, data)
+        self._order = itertools.count()
+        self.delivered = 0
+        self.lost = 0
+
+    def endpoint(self, mac, handler=None):
+        endpoint = LoopbackEndpoint(self, bytes(mac), handler)
+        self.endpoints[endpoint.mac] = endpoint
+        return endpoint
+
+    def send(self, source, destination, data):
+        targets = [m for m in self.endpoints if m != source] if destination == BROADCAST else [destination]
+        now = self.clock()
+        for target in targets:
+            if self.random.random() < self.loss:
+                self.lost += 1
+                continue
+            due = now + self.random.uniform(*self.latency)
+            heapq.heappush(self._queue, (due, next(self._order), target, source, data))
+
+    def deliver(self):
+        now = self.clock()
+        queue = self._queue
+        while queue and queue[0][0] <= now:
+            _, _, target, source, data = heapq.heappop(queue)
+            endpoint = self.endpoints.get(target)
+            if endpoint is None:
+                continue
+            self.delivered += 1
+            if endpoint.handler is not None:
+                endpoint.handler(source, data)
+            else:
+                endpoint.inbox.append((source, data))
@@ -0,0 +1,93 @@
+'''sdcard.py - Directory-backed SD card.
+
+FakeSDCard and FakeVfsFat are what the storage and adafruit_sdcard modules hand out; mounting them
+does nothing. DirectoryCard is the card itself: a directory on the host whose writes are counted by
+sector. simulator.install_sdcard() points the storage service at one.
+'''
+
+import os
+import time
+
+
+class FakeSDCard:
+    """adafruit_sdcard.SDCard stand-in; sleeps for init_delay to mimic SPI card initialisation."""
+
+    init_delay = 0.0
+
+    def __init__(self, spi, cs):
+        time.sleep(FakeSDCard.init_delay)
+
+
+class FakeVfsFat:
+    def __init__(self, block_device):
+        self.block_device = block_device
+
+
+class CountingFile:
+    """File from DirectoryCard.open(); reports every write to the card."""
+
+    def __init__(self, card, path, mode):
+        self.card = card
+        self.f = open(path, mode)
+        self.append = "a" in mode
+
+    def write(self, data):
+        offset = os.fstat(self.f.fileno()).st_size if self.append else self.f.tell()
+        self.card.record(offset, len(data))
+        return self.f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+        return False
+
+
+class DirectoryCard:
+    """A directory standing in for a mounted SD card, counting mounts, opens, writes and sectors.
+
+    mount is a Storage mounter. Install open() as the module-level open of the code under test (or
+    call it directly) to count its writes: a write reprograms every sector it touches, and one that
+    starts or ends inside a sector makes the card read that sector back first.
+    """
+
+    def __init__(self, directory, sector_size=512):
+        self.directory = directory
+        self.sector_size = sector_size
+        self.mounts = 0
+        self.reset()
+
+    def reset(self):
+        self.opens = 0
+        self.writes = 0
+        self.bytes = 0
+        self.sectors = 0
+        self.partial = 0         # writes starting or ending inside a sector
+        self.ragged_ends = 0     # writes ending inside a sector
+
+    def mount(self, root):
+        self.mounts += 1
+        os.makedirs(root, exist_ok=True)
+        return self
+
+    def open(self, path, mode="r"):
+        if "r" in mode and "+" not in mode:
+            return open(path, mode)
+        self.opens += 1
+        return CountingFile(self, path, mode)
+
+    def record(self, offset, size):
+        if not size:
+            return
+        end = offset + size
+        self.writes += 1
+        self.bytes += size
+        self.sectors += (end - 1) // self.sector_size - offset // self.sector_size + 1
+        if offset % self.sector_size or end % self.sector_size:
+            self.partial += 1
+        if end % self.sector_size:
+            self.ragged_ends += 1
@@ -0,0 +1,72 @@
+'''wifi.py - wifi.radio stand-in whose scans and connects block like the real ones.
+'''
+
+import time
+
+
+class FakeNetwork:
+    def __init__(self, ssid, bssid, rssi, channel, secure=True):
+        self.ssid = ssid
+        self.bssid = bssid
+        self.rssi = rssi
+        self.channel = channel
+        self.authmode = [FakeAuthMode.WPA2, FakeAuthMode.PSK] if secure else [FakeAuthMode.OPEN]
+
+
+class FakeAuthMode:
+    OPEN = "OPEN"
+    WEP = "WEP"
+    WPA = "WPA"
+    WPA2 = "WPA2"
+    WPA3 = "WPA3"
+    PSK = "PSK"
+    ENTERPRISE = "ENTERPRISE"
+
+
+class FakeWiFiRadio:
+    """wifi.radio stand-in. Scans and connects block, like the real ones: a scan takes channel_delay
+    seconds per channel, and a connect takes connect_delay seconds, plus a scan of every channel
+    when no channel is given. Connecting fails for fail_connects attempts, each waiting out the
+    timeout like an access point that does not answer, then for a wrong password or an SSID that
+    is not in range."""
+
+    def __init__(self, networks=(), passwords=None, channel_delay=0.0, connect_delay=0.0, fail_connects=0):
+        self.networks = list(networks)
+        self.passwords = passwords or {}
+        self.channel_delay = channel_delay
+        self.connect_delay = connect_delay
+        self.fail_connects = fail_connects
+        self.enabled = True
+        self.connected = False
+        self.ap_info = None
+        self.ipv4_address = None
+        self.scanning = False
+        self.scans = 0
+        self.connects = 0
+
+    def start_scanning_networks(self, *, start_channel=1, stop_channel=11):
+        if self.scanning:
+            raise RuntimeError("Already scanning for wifi networks")
+        self.scanning = True
+        self.scans += 1
+        time.sleep(self.channel_delay * (stop_channel - start_channel + 1))
+        return [n for n in self.networks if start_channel <= n.channel <= stop_channel]
+
+    def stop_scanning_networks(self):
+        self.scanning = False
+
+    def connect(self, ssid, password="", *, channel=0, bssid=None, timeout=None):
+        self.connects += 1
+        if self.fail_connects > 0:
+            self.fail_connects -= 1
+            time.sleep(timeout if timeout is not None else self.connect_delay)
+            raise ConnectionError("No network with that ssid")
+        time.sleep(self.connect_delay + (0 if channel else self.channel_delay * 11))
+        network = [n for n in self.networks if n.ssid == ssid]
+        if not network:
+            raise ConnectionError("No network with that ssid")
+        if self.passwords.get(ssid, "") != password:
+            raise ConnectionError("Authentication failure")
+        self.connected = True
+        self.ap_info = network[0]
+        self.ipv4_address = "192.168.1.50"
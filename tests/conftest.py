@@ -0,0 +1,5 @@
+'''Tests run on desktop Python against the simulator, like the benchmarks (see benchmarks/bench_setup.py).'''
+
+from bench_setup import simulate
+
+simulate()
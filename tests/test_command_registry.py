@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+import command_registry
+from command_registry import Command, CommandIndex, add_command_args, prepare_commandlist_for_ai, write_commandlist_to_file
+
+DEVICE = "test"
+
+
+@pytest.fixture
+def sd_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(command_registry, "SD_ROOT", str(tmp_path))
+    return tmp_path
+
+
+def make_commands(count):
+    return [Command(f"Peer {i}: Toggle relay {i}", f"Toggle relay channel {i}", print) for i in range(count)]
+
+
+def read_list(sd_root):
+    with open(sd_root / f"{DEVICE}_commandlist.json") as f:
+        return f.read()
+
+
+def check_index(commands):
+    index = CommandIndex(DEVICE)
+    assert len(index) == len(commands)
+    assert list(index.names) == [command.name for command in commands]
+    for i, command in enumerate(commands):
+        assert json.loads(index.schema_json(i)) == json.loads(command.schema_json())
+
+
+def test_written_list_matches_the_commands(sd_root):
+    commands = make_commands(20)
+    write_commandlist_to_file(DEVICE, commands)
+    assert read_list(sd_root) == prepare_commandlist_for_ai(commands)
+    check_index(commands)
+
+
+def test_unchanged_list_is_not_rewritten(sd_root):
+    commands = make_commands(20)
+    write_commandlist_to_file(DEVICE, commands)
+    mtime = (sd_root / f"{DEVICE}_commandlist.json").stat().st_mtime_ns
+    write_commandlist_to_file(DEVICE, commands)
+    assert (sd_root / f"{DEVICE}_commandlist.json").stat().st_mtime_ns == mtime
+
+
+def test_appended_commands_are_written(sd_root):
+    commands = make_commands(20)
+    write_commandlist_to_file(DEVICE, commands)
+    commands += [Command("New peer: Ping", "Ping the new peer", print)]
+    write_commandlist_to_file(DEVICE, commands)
+    assert read_list(sd_root) == prepare_commandlist_for_ai(commands)
+    check_index(commands)
+
+
+def test_changed_command_in_the_middle_is_rewritten(sd_root):
+    commands = make_commands(20)
+    write_commandlist_to_file(DEVICE, commands)
+    add_command_args(commands[10], ["channel"])
+    write_commandlist_to_file(DEVICE, commands)
+    text = read_list(sd_root)
+    assert text == prepare_commandlist_for_ai(commands)
+    assert json.loads(text)["tools"][10]["function"]["parameters"]["required"] == ["arg0"]
+    check_index(commands)
+
+
+def test_shorter_list_is_truncated(sd_root):
+    commands = make_commands(20)
+    write_commandlist_to_file(DEVICE, commands)
+    del commands[15:]
+    write_commandlist_to_file(DEVICE, commands)
+    assert read_list(sd_root) == prepare_commandlist_for_ai(commands)
+    check_index(commands)
+
+
+def test_missing_index_forces_a_full_rewrite(sd_root):
+    commands = make_commands(20)
+    write_commandlist_to_file(DEVICE, commands)
+    (sd_root / f"{DEVICE}_commandlist.idx").unlink()
+    (sd_root / f"{DEVICE}_commandlist.json").write_text("garbage")
+    write_commandlist_to_file(DEVICE, commands)
+    assert read_list(sd_root) == prepare_commandlist_for_ai(commands)
+    check_index(commands)
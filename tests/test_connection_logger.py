@@ -0,0 +1,78 @@
+from connectivity.connection_logger import KIND_BLE, KIND_WIFI, ConnectionLogReader, ConnectionLogWriter
+
+START = 1700000000
+
+
+def write(path, scans, segment_size=256):
+    writer = ConnectionLogWriter(str(path), segment_size)
+    for timestamp, seen in scans:
+        for device, name, rssi, kind in seen:
+            writer.add(timestamp, device, name, rssi, 6, kind)
+        writer.flush()
+    return writer
+
+
+def make_scans(count, offset=0):
+    scans = []
+    for scan in range(offset, offset + count):
+        seen = [("aa:00:00:00:00:01", "HomeNet", -50, KIND_WIFI), ("bb:00:00:00:00:%02x" % (scan % 7), "Phone", -70, KIND_BLE)]
+        scans.append((START + scan * 60, seen))
+    return scans
+
+
+def expected(scans):
+    return [(timestamp, device, name, rssi, 6, kind, 0) for timestamp, seen in scans for device, name, rssi, kind in seen]
+
+
+def test_reader_returns_every_record_written(tmp_path):
+    scans = make_scans(50)
+    write(tmp_path / "connections.log", scans)
+    reader = ConnectionLogReader(str(tmp_path / "connections.log"))
+    try:
+        assert reader.segments > 1
+        assert list(reader.query()) == expected(scans)
+    finally:
+        reader.close()
+
+
+def test_query_by_time_and_device_matches_a_filter(tmp_path):
+    scans = make_scans(50)
+    write(tmp_path / "connections.log", scans)
+    records = expected(scans)
+    reader = ConnectionLogReader(str(tmp_path / "connections.log"))
+    try:
+        start, end = START + 10 * 60, START + 20 * 60
+        assert list(reader.query(start, end)) == [r for r in records if start <= r[0] <= end]
+        device = "bb:00:00:00:00:03"
+        assert list(reader.query(device=device)) == [r for r in records if r[1] == device]
+        assert list(reader.query(device="cc:00:00:00:00:00")) == []
+    finally:
+        reader.close()
+
+
+def test_reopened_writer_appends_to_the_log(tmp_path):
+    path = tmp_path / "connections.log"
+    first, second = make_scans(30), make_scans(30, offset=30)
+    write(path, first)
+    write(path, second)
+    reader = ConnectionLogReader(str(path))
+    try:
+        assert list(reader.query()) == expected(first + second)
+        assert list(reader.query(device="bb:00:00:00:00:05")) == [r for r in expected(first + second) if r[1] == "bb:00:00:00:00:05"]
+    finally:
+        reader.close()
+
+
+def test_names_are_stored_as_utf8(tmp_path):
+    path = tmp_path / "connections.log"
+    writer = ConnectionLogWriter(str(path))
+    writer.add(START, "aa:00:00:00:00:01", "Café Wi-Fi ☕", -40)
+    writer.add(START + 1, "aa:00:00:00:00:02", "é" * 200, -40)
+    writer.flush()
+    reader = ConnectionLogReader(str(path))
+    try:
+        names = [record[2] for record in reader.query()]
+    finally:
+        reader.close()
+    assert names[0] == "Café Wi-Fi ☕"
+    assert names[1] == "é" * 127   # cut to 255 bytes at a character boundary
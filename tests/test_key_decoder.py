@@ -0,0 +1,48 @@
+import pytest
+
+from keyboard.key_decoder import KeyDecoder
+
+
+def decode(chunks):
+    decoder = KeyDecoder()
+    keys = []
+    for chunk in chunks:
+        keys.extend(decoder.feed(chunk))
+    return keys + decoder.flush()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("abc", ["a", "b", "c"]),
+    ("\x1b[A\x1b[B\x1b[C\x1b[D", ["UP", "DOWN", "RIGHT", "LEFT"]),
+    ("\x1bOA\x1bOP", ["UP", "F1"]),
+    ("\x1b[5~\x1b[15~\x1b[[A", ["PGUP", "F5", "F1"]),
+    ("\x1b[1;5A\x1b[3;5~\x1b[Z", ["CTRL+UP", "CTRL+DELETE", "SHIFT+TAB"]),
+    ("\x1bx", ["ALT+x"]),
+    ("\x1b\x1b[A", ["ESC", "UP"]),
+    ("\x1b[99~x", ["\x1b[99~", "x"]),
+])
+def test_sequences_decode_however_they_are_split(text, expected):
+    assert decode([text]) == expected
+    assert decode(list(text)) == expected
+    for i in range(1, len(text)):
+        assert decode([text[:i], text[i:]]) == expected
+
+
+def test_partial_sequence_waits_for_the_rest():
+    decoder = KeyDecoder()
+    assert decoder.feed("a\x1b[") == ["a"]
+    assert decoder.waiting()
+    assert decoder.feed("B") == ["DOWN"]
+    assert not decoder.waiting()
+
+
+@pytest.mark.parametrize("pending, key", [("\x1b", "ESC"), ("\x1b[", "ALT+["), ("\x1bO", "ALT+O")])
+def test_flush_gives_up_on_a_partial_sequence(pending, key):
+    decoder = KeyDecoder()
+    assert decoder.feed(pending) == []
+    assert decoder.flush() == [key]
+    assert not decoder.waiting()
+
+
+def test_bytes_are_decoded():
+    assert KeyDecoder().feed(b"\x1b[Aq") == ["UP", "q"]